@@ -298,7 +298,8 @@ resource "aws_instance" "django_app" {
                 export PYTHONPATH=$(pwd)
                 export DJANGO_SETTINGS_MODULE='recyclable_proj.settings'
                 $VENV_PYTHON manage.py showmigrations
-                $VENV_PYTHON manage.py makemigrations recyclable
+                # Container search uses pg_trgm.  Creating it takes rds_superuser, which the master user has.
+                echo "from django.db import connection; connection.cursor().execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')" | $VENV_PYTHON manage.py shell
                 $VENV_PYTHON manage.py migrate
 
                 echo "............Creating superuser............"
@@ -320,13 +321,15 @@ resource "aws_instance" "django_app" {
                 User=ec2-user
                 Group=ec2-user
                 WorkingDirectory=/opt/recyclable
-                ExecStart=/opt/recyclable/myenv/bin/gunicorn --access-logfile /var/log/gunicorn/access.log --error-logfile /var/log/gunicorn/error.log --workers 3 --bind unix:/run/gunicorn/recyclable.sock recyclable_proj.wsgi:application
+                ExecStart=/opt/recyclable/myenv/bin/gunicorn --access-logfile /var/log/gunicorn/access.log --error-logfile /var/log/gunicorn/error.log --workers 3 --worker-class uvicorn.workers.UvicornWorker --bind unix:/run/gunicorn/recyclable.sock recyclable_proj.asgi:application
                 
                 # Set environment variables
                 Environment="DJANGO_SECRET_KEY=${var.django_secret_key}"
                 Environment="DB_NAME=${aws_db_instance.django_db.db_name}"
                 Environment="DB_USER=${aws_db_instance.django_db.username}"
                 Environment="DB_PASSWORD=${aws_db_instance.django_db.password}"
+                # Under ASGI each request's sync code runs in its own thread, so connections would never be reused.
+                Environment="DB_CONN_MAX_AGE=0"
 
                 [Install]
                 WantedBy=multi-user.target
@@ -1,13 +1,183 @@
+import json
+
 from django.contrib import admin
-from .models import Container, Image
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import OperationalError, connections, transaction
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from .capture_sessions import CATEGORY_CRUSH_DEGREES
+from .db_routers import use_replica
+from .jobs import enqueue_bulk_action
+from .models import CaptureRollup, Container, Image, Job
+from .views_helpers import container_search_q, has_trigram_search
+
+
+class ReplicaListAdmin(admin.ModelAdmin):
+    """Reads the change list from the read replica, if there is one.  Actions (POST) stay on the primary."""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with use_replica():
+            response = super().changelist_view(request, extra_context)
+            # The change list is rendered lazily.
+            return response.render() if hasattr(response, 'render') else response
+
+
+def background_action(action: str, description: str):
+    """An admin action that queues jobs.BULK_ACTIONS[action] over the selected rows, so that selecting every row
+    of a large table doesn't time out the request."""
+
+    @admin.action(description=description)
+    def enqueue(modeladmin, request, queryset):
+        job = enqueue_bulk_action(action, queryset)
+        url = reverse('admin:recyclable_job_change', args=[job.id])
+        modeladmin.message_user(request, format_html('Queued job <a href="{}">{}</a>: {}.', url, job.id, job.message))
+
+    # Admin actions are identified by function name.
+    enqueue.__name__ = action
+    return enqueue
+
+
+class ContainerAdmin(ReplicaListAdmin):
+    search_fields = ('barcode', 'brand', 'product_name')
+    search_help_text = 'Barcode prefix, brand or product name'
+    actions = [background_action('recompute_image_counts', 'Recompute image counts of selected containers')]
+
+    def get_search_results(self, request, queryset, search_term):
+        # The default search is an unindexed icontains scan of every search field.
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(container_search_q(search_term, has_trigram_search(queryset.db))), False
+
+
+admin.site.register(Container, ContainerAdmin)
+
+
+# Change lists whose planner estimate is above this show the estimate instead of running COUNT(*).
+EXACT_COUNT_THRESHOLD = 10000
+# ... and so do those whose COUNT(*) takes longer than this, e.g. when the estimate is far too low.
+EXACT_COUNT_TIMEOUT_MS = 200
+ADMIN_THUMBNAIL_WIDTH = 128
+
+
+def estimated_count(queryset) -> int:
+    """The planner's row estimate for queryset, which costs a plan instead of a scan."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']['Plan Rows']
+
+
+class EstimatedCountPaginator(Paginator):
 
-admin.site.register(Container)
+    @cached_property
+    def count(self) -> int:
+        estimate = estimated_count(self.object_list)
+        if estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate
+        db = self.object_list.db
+        try:
+            with transaction.atomic(using=db), connections[db].cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [EXACT_COUNT_TIMEOUT_MS])
+                return super().count
+        except OperationalError:
+            return estimate
 
 
-class ImageAdmin(admin.ModelAdmin):
+class KeysetChangeList(ChangeList):
+    """Adds newest/older links that page by id instead of by offset, so any depth costs the same as page 1."""
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.newest_url = self.get_query_string(remove=['id__lt', PAGE_VAR]) if 'id__lt' in self.params else None
+        self.older_url = None
+        if len(self.result_list) == self.list_per_page:
+            last = self.result_list[self.list_per_page - 1]
+            self.older_url = self.get_query_string({'id__lt': last.id}, [PAGE_VAR])
+
+
+class CrushDegreeFilter(admin.SimpleListFilter):
+    # The default filter for a plain integer field runs SELECT DISTINCT over the whole table.
+    title = 'crush degree'
+    parameter_name = 'crush_degree'
+
+    def lookups(self, request, model_admin):
+        return [(str(degree), str(degree)) for degree in sorted(set(CATEGORY_CRUSH_DEGREES.values()))]
+
+    def queryset(self, request, queryset):
+        return queryset.filter(crush_degree=int(self.value())) if self.value() is not None else queryset
+
+
+class CubeFilter(admin.SimpleListFilter):
+    # The cubes come from the small rollup table rather than a SELECT DISTINCT over the images.
+    title = 'cube'
+    parameter_name = 'cube_sn'
+
+    def lookups(self, request, model_admin):
+        cubes = CaptureRollup.objects.order_by('cube_sn').values_list('cube_sn', flat=True).distinct()
+        return [(cube, cube) for cube in cubes]
+
+    def queryset(self, request, queryset):
+        return queryset.filter(cube_sn=self.value()) if self.value() is not None else queryset
+
+
+class ImageAdmin(ReplicaListAdmin):
     exclude = ['image_sequence_number']
     model = Image
     readonly_fields = ('image', )
+    raw_id_fields = ('container', )
+    list_display = ('id', 'thumbnail', 'barcode', 'crush_degree', 'valid_orientation', 'image_quality', 'cube_sn',
+                    'timestamp')
+    list_select_related = ('container', )
+    list_filter = ('container__material_type', CrushDegreeFilter, CubeFilter)
+    list_per_page = 100
+    # Only the primary key has an index that serves every filter combination in order.
+    ordering = ('-id', )
+    sortable_by = ('id', )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = [
+        background_action('mark_valid_orientation', 'Mark selected images as valid orientation'),
+        background_action('mark_invalid_orientation', 'Mark selected images as bad orientation'),
+        background_action('delete_images', 'Delete selected images in the background'),
+    ]
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_actions(self, request):
+        # The built-in delete lists every selected image on its confirmation page and deletes them in the request.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.display(description='Barcode')
+    def barcode(self, img: Image) -> str:
+        return img.container.barcode if img.container else 'Unknown'
+
+    @admin.display(description='Image')
+    def thumbnail(self, img: Image) -> str:
+        img_src = f"{reverse('recyclable:image_proxy', args=[img.id])}?w={ADMIN_THUMBNAIL_WIDTH}"
+        return format_html('<img src="{}" loading="lazy" style="width: 64px" />', img_src)
 
 
 admin.site.register(Image, ImageAdmin)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'message', 'worker', 'attempts', 'created_at', 'updated_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('progress', 'checkpoint', 'worker', 'heartbeat_at', 'attempts', 'artifact_s3_object_key')
+
+    def get_exclude(self, request, obj=None):
+        # The params of a bulk action hold every selected id, which is too many to render in a form.
+        return ('params', ) if obj is not None and obj.kind == 'bulk_action' else None
+
+
+admin.site.register(Job, JobAdmin)
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 class RecyclableConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recyclable'
+
+    def ready(self):
+        if settings.METRICS_ENABLED:
+            from recyclable.metrics import count_queries
+            count_queries()
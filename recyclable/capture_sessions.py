@@ -0,0 +1,85 @@
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Tuple
+
+from recyclable.models import Container
+
+# A capture session is the plan for photographing one container: which category each of its num_images captures
+# should show.  It is computed once, when the percentages are submitted, and kept in the user's Django session, so
+# each capture request only looks up its category by index.  Sessions expire CAPTURE_SESSION_TTL seconds after
+# they start.
+
+CAPTURE_SESSION_TTL = 8 * 60 * 60
+SESSION_KEY = 'capture_sessions'
+
+# The order in which a session's captures go through the categories.
+CAPTURE_CATEGORIES = ['valid', 'bad_orientation', 'crushed_1', 'crushed_2', 'crushed_3', 'no_label', 'crushed_4']
+CATEGORY_CRUSH_DEGREES = {
+    'valid': 0,
+    'crushed_1': 1,
+    'crushed_2': 2,
+    'crushed_3': 3,
+    'crushed_4': 4,
+    'bad_orientation': -1,
+    'no_label': -1,
+}
+
+
+def allocate_counts(num_images: int, percentages: dict[str, float]) -> List[Tuple[str, int]]:
+    """Splits num_images by percentage with the largest remainder method, in CAPTURE_CATEGORIES order."""
+    exact_counts = [(name, num_images * percentages.get(name, 0.0) / 100) for name in CAPTURE_CATEGORIES]
+    counts = {name: int(exact_count) for name, exact_count in exact_counts}
+    by_remainder = sorted(exact_counts, key=lambda c: c[1] - int(c[1]), reverse=True)
+    for name, _ in by_remainder[:num_images - sum(counts.values())]:
+        counts[name] += 1
+    return [(name, counts[name]) for name in CAPTURE_CATEGORIES]
+
+
+@dataclass
+class CaptureSession:
+    id: str
+    container_id: int
+    barcode: str
+    material_type: str
+    num_images: int
+    counts_list: List[Tuple[str, int]]
+    plan: str  # one digit per capture: the index of its category in CAPTURE_CATEGORIES
+    expires_at: float
+
+    def category(self, i_image: int) -> str:
+        """The category of capture i_image, counting from 1."""
+        return CAPTURE_CATEGORIES[int(self.plan[i_image - 1])]
+
+    def crush_degree(self, i_image: int) -> int:
+        return CATEGORY_CRUSH_DEGREES[self.category(i_image)]
+
+    def container(self) -> Container:
+        # Enough of the container to save its images without fetching it again.
+        return Container(id=self.container_id, barcode=self.barcode, material_type=self.material_type)
+
+
+def create_capture_session(session, container: Container, num_images: int,
+                           counts_list: List[Tuple[str, int]]) -> CaptureSession:
+    plan = ''.join(str(CAPTURE_CATEGORIES.index(name)) * count for name, count in counts_list)
+    capture = CaptureSession(id=uuid.uuid4().hex, container_id=container.id, barcode=container.barcode,
+                             material_type=container.material_type, num_images=num_images,
+                             counts_list=counts_list, plan=plan, expires_at=time.time() + CAPTURE_SESSION_TTL)
+    captures = {sid: c for sid, c in session.get(SESSION_KEY, {}).items() if c['expires_at'] > time.time()}
+    captures[capture.id] = asdict(capture)
+    session[SESSION_KEY] = captures
+    return capture
+
+
+def get_capture_session(session, capture_session_id: str) -> Optional[CaptureSession]:
+    """Returns the capture session, or None if it does not exist or has expired."""
+    capture = session.get(SESSION_KEY, {}).get(capture_session_id)
+    if capture is None or capture['expires_at'] <= time.time():
+        return None
+    return CaptureSession(**{**capture, 'counts_list': [tuple(c) for c in capture['counts_list']]})
+
+
+def end_capture_session(session, capture_session_id: str) -> None:
+    captures = session.get(SESSION_KEY, {})
+    if captures.pop(capture_session_id, None) is not None:
+        session[SESSION_KEY] = captures
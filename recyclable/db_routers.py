@@ -0,0 +1,57 @@
+import contextvars
+from contextlib import contextmanager
+from typing import Iterator, Optional, TypeVar
+
+from django.conf import settings
+
+# Reads go to the replica only inside use_replica(), so that the capture screens always read their own writes.
+# settings.DATABASE_REPLICA names the replica alias, or is None when there is no replica.
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+T = TypeVar('T')
+
+
+@contextmanager
+def use_replica() -> Iterator[None]:
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def iter_on_replica(iterator: Iterator[T]) -> Iterator[T]:
+    """Runs each step of a lazy iterator, e.g. the body of a StreamingHttpResponse, inside use_replica()."""
+    iterator = iter(iterator)
+    while True:
+        with use_replica():
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def replica_alias() -> Optional[str]:
+    return getattr(settings, 'DATABASE_REPLICA', None)
+
+
+class ReplicaRouter:
+    """Sends the reads made inside use_replica() to the replica, and everything else to the primary."""
+
+    def db_for_read(self, model, **hints) -> Optional[str]:
+        if _use_replica.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints) -> Optional[str]:
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints) -> Optional[bool]:
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> Optional[bool]:
+        if db == replica_alias():
+            return False
+        return None
@@ -0,0 +1,187 @@
+import logging
+import os
+import tempfile
+import threading
+from typing import BinaryIO, Optional
+
+from django.conf import settings
+from PIL import Image as PILImage
+
+from recyclable.models import Image
+from recyclable.presign import get_s3_client
+
+# Widths that image_proxy() will resize to; anything else would let clients fill the cache with variants.
+THUMBNAIL_WIDTHS = (128, 256, 512, 1024)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Each process tracks the cache's size from its last evict() scan plus what it has written since, and only scans
+# when that is over the limit.  Other processes write to the cache too, so it also scans after writing
+# EVICT_RESCAN_FRACTION of the limit; together, the workers can take the cache that far over it per worker.
+EVICT_RESCAN_FRACTION = 0.05
+
+_scanned_bytes: Optional[int] = None
+_written_bytes = 0
+_size_lock = threading.Lock()
+
+
+def image_etag(img: Image, width: Optional[int] = None) -> str:
+    # S3 ETags identify the object's content, so they make strong ETags.
+    etag = img.aws_entity_tag.strip('"')
+    return f'"{etag}-w{width}"' if width else f'"{etag}"'
+
+
+def cache_path(img: Image, width: Optional[int] = None) -> str:
+    name = image_etag(img, width).strip('"')
+    return os.path.join(settings.IMAGE_CACHE_DIR, name[:2], name)
+
+
+def write_atomically(path: str, write) -> int:
+    """Writes path through a temporary file, so that readers never see a partial file.  Returns its size."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            size = f.tell()
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return size
+
+
+def download(img: Image, path: str) -> int:
+    body = get_s3_client(img.aws_region_name).get_object(Bucket=img.s3_bucket_name, Key=img.s3_object_key)['Body']
+
+    def write(f):
+        for chunk in body.iter_chunks(DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+
+    return write_atomically(path, write)
+
+
+def resize(source_path: str, path: str, width: int) -> int:
+    with PILImage.open(source_path) as im:
+        im.thumbnail((width, width * 4))
+        return write_atomically(path, lambda f: im.convert('RGB').save(f, 'JPEG', quality=85))
+
+
+def cached_image_path(img: Image, width: Optional[int] = None) -> str:
+    """Returns the path of the cached original (width None) or thumbnail of img, fetching or making it first if
+    needed.  A hit refreshes the file's mtime, which evict() uses as the LRU order."""
+    path = cache_path(img, width)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    if width:
+        size = resize(cached_image_path(img), path, width)
+    else:
+        size = download(img, path)
+    added_to_cache(size, settings.IMAGE_CACHE_MAX_BYTES)
+    return path
+
+
+def open_cached_image(img: Image, width: Optional[int] = None) -> BinaryIO:
+    """Opens the cached original or thumbnail of img.  Another process's evict() may delete the file between
+    cached_image_path() and the open, or delete the original while a thumbnail is made of it; the file is then
+    fetched or made again."""
+    try:
+        return open(cached_image_path(img, width), 'rb')
+    except FileNotFoundError:
+        logging.info(f'open_cached_image() - image {img.id} was evicted, fetching it again')
+        return open(cached_image_path(img, width), 'rb')
+
+
+def added_to_cache(size: int, max_bytes: int) -> None:
+    """Adds size bytes to the tracked cache size, and evicts if it is over max_bytes or a rescan is due."""
+    global _written_bytes
+    with _size_lock:
+        _written_bytes += size
+        due = (_scanned_bytes is None or _scanned_bytes + _written_bytes > max_bytes or
+               _written_bytes > max_bytes * EVICT_RESCAN_FRACTION)
+    if due:
+        evict(max_bytes)
+
+
+def reset_cache_size() -> None:
+    """Forgets the tracked cache size, e.g. after IMAGE_CACHE_DIR changes.  The next write rescans the cache."""
+    global _scanned_bytes, _written_bytes
+    with _size_lock:
+        _scanned_bytes = None
+        _written_bytes = 0
+
+
+def evict(max_bytes: int) -> int:
+    """Deletes the least recently used files until the cache is within max_bytes, and records its size as the
+    tracked one.  Returns the bytes freed."""
+    global _scanned_bytes, _written_bytes
+    files = []
+    total = 0
+    for dir_entry in os.scandir(settings.IMAGE_CACHE_DIR):
+        if not dir_entry.is_dir():
+            continue
+        for entry in os.scandir(dir_entry.path):
+            if entry.is_file() and not entry.name.startswith('.tmp-'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+    with _size_lock:
+        _scanned_bytes = total
+        _written_bytes = 0
+    if total <= max_bytes:
+        return 0
+
+    # Evict down to 90% so that every miss doesn't trigger another eviction.
+    freed = 0
+    for _, size, path in sorted(files):
+        if total - freed <= max_bytes * 0.9:
+            break
+        try:
+            os.unlink(path)
+            freed += size
+        except FileNotFoundError:  # another worker evicted it
+            pass
+    with _size_lock:
+        _scanned_bytes = total - freed
+    logging.info(f'evict() - freed {freed} bytes')
+    return freed
+
+
+class RangeFile:
+    """Reads at most length bytes of f from its current position; the body of a 206 response."""
+
+    def __init__(self, f, length: int):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self.f.close()
+
+
+def parse_range(header: str, size: int) -> Optional[tuple]:
+    """Parses a single 'bytes=start-end', 'bytes=start-' or 'bytes=-suffix' range into an inclusive (start, end).
+    Returns None for a header to ignore (e.g. multiple ranges), and raises ValueError if it can't be satisfied."""
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    start, sep, end = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if start:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+        else:
+            start, end = max(size - int(end), 0), size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise ValueError(f'Unsatisfiable range {header}')
+    return start, end
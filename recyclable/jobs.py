@@ -0,0 +1,254 @@
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import traceback
+from datetime import date, timedelta
+from typing import Callable, List, Optional, Any, Tuple, Type
+
+import boto3
+from django.db import close_old_connections, connection, models, transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from recyclable.db_routers import use_replica
+from recyclable.metrics import stage
+from recyclable.models import Container, Job, JobReclaimed, Image, compact_capture_rollups, delete_images, \
+    load_models_from_csv, recompute_image_counts, set_valid_orientation
+from recyclable.s3_index import index_captures
+from recyclable.utils import BUCKET_NAME, COMPRESSION_EXTENSIONS, COMPRESSION_CONTENT_TYPES, compress_stream
+from recyclable.views_helpers import CLASSIFIER_EXPORTS, CLASSIFIER_LABELS, DEFAULT_URL_PREFIX, \
+    create_classifier_jsonl, create_classifier_splits_json, create_classifier_splits_jsonl, parse_split_ratios
+
+# A running job whose heartbeat is older than this is assumed to have lost its worker and is claimed again.
+STALE_JOB_TIMEOUT = timedelta(minutes=10)
+# Workers refresh the heartbeat of the job they run this often, however long the handler goes without a checkpoint.
+HEARTBEAT_INTERVAL = timedelta(minutes=1)
+# A job whose worker has died this many times (e.g. by running out of memory) fails instead of being claimed again.
+MAX_JOB_ATTEMPTS = 3
+CHECKPOINT_INTERVAL = 1000
+
+JobHandler = Callable[[Job], None]
+JOB_HANDLERS: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    def register(fn: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue_job(kind: str, params: Optional[dict] = None) -> Job:
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    return Job.objects.create(kind=kind, params=params or {})
+
+
+def claim_job(worker: str) -> Optional[Job]:
+    """Claims the oldest runnable job.  SKIP LOCKED lets any number of workers, on any node, poll the same
+    table without blocking on or double-claiming each other's rows."""
+    while True:
+        stale_before = timezone.now() - STALE_JOB_TIMEOUT
+        with transaction.atomic():
+            job = Job.objects.select_for_update(skip_locked=True).filter(
+                Q(status=Job.Status.QUEUED) |
+                Q(status=Job.Status.RUNNING, heartbeat_at__lt=stale_before)
+            ).order_by('id').first()
+            if job is None:
+                return None
+
+            if job.status == Job.Status.RUNNING and job.attempts >= MAX_JOB_ATTEMPTS:
+                logging.error(f'claim_job() - giving up on job {job.id} after {job.attempts} attempts')
+                job.status = Job.Status.FAILED
+                job.message = f'Gave up after {job.attempts} attempts; the last worker ({job.worker}) stopped ' \
+                              f'responding.'
+                job.save(update_fields=['status', 'message', 'updated_at'])
+                continue
+
+            job.status = Job.Status.RUNNING
+            job.worker = worker
+            job.heartbeat_at = timezone.now()
+            job.attempts += 1
+            job.save(update_fields=['status', 'worker', 'heartbeat_at', 'attempts', 'updated_at'])
+            return job
+
+
+def beat(job: Job) -> bool:
+    """Refreshes the job's heartbeat.  Returns False if another worker has claimed it."""
+    return Job.objects.filter(id=job.id, worker=job.worker).update(heartbeat_at=timezone.now()) > 0
+
+
+def heartbeat(job: Job, stop: threading.Event) -> None:
+    # Runs in its own thread, with its own DB connection, while the handler runs.
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL.total_seconds()):
+            if not beat(job):
+                logging.warning(f'heartbeat() - job {job.id} was claimed by another worker')
+                return
+    except Exception as e:
+        logging.error(f'heartbeat() - job {job.id}: {e}')
+    finally:
+        connection.close()
+
+
+def run_job(job: Job) -> None:
+    stop = threading.Event()
+    threading.Thread(target=heartbeat, args=(job, stop), daemon=True).start()
+    try:
+        with stage(f'job.{job.kind}'):
+            JOB_HANDLERS[job.kind](job)
+        job.status = Job.Status.SUCCEEDED
+        job.progress = 1.0
+    except JobReclaimed as e:
+        logging.warning(f'run_job() - {e}  Stopping.')
+        return
+    except Exception as e:
+        logging.error(f'run_job() - job {job.id} failed: {e}')
+        logging.error(traceback.format_exc())
+        job.status = Job.Status.FAILED
+        job.message = str(e)
+    finally:
+        stop.set()
+
+    # Only the worker that holds the job may record its outcome.
+    if not Job.objects.filter(id=job.id, worker=job.worker).update(
+            status=job.status, progress=job.progress, message=job.message,
+            artifact_s3_object_key=job.artifact_s3_object_key, updated_at=timezone.now()):
+        logging.warning(f'run_job() - job {job.id} was claimed by another worker; dropping the result of '
+                        f'{job.worker}')
+
+
+def run_worker(worker: Optional[str] = None, poll_interval: float = 5.0, once: bool = False) -> int:
+    """Claims and runs jobs until there are none left (once=True) or forever.  Returns the number of jobs run."""
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+    num_jobs = 0
+    while True:
+        # Outside of a request nothing else closes connections that are past CONN_MAX_AGE or broken.
+        if not connection.in_atomic_block:
+            close_old_connections()
+        job = claim_job(worker)
+        if job is None:
+            if once:
+                return num_jobs
+            time.sleep(poll_interval)
+            continue
+
+        logging.info(f'run_worker() - {worker} running {job}')
+        run_job(job)
+        num_jobs += 1
+
+
+def upload_job_artifact(job: Job, file_name: str, fileobj: Any, content_type: str) -> None:
+    s3_object_key = f'jobs/{job.id}/{file_name}'
+    s3_client = boto3.client('s3')
+    s3_client.upload_fileobj(fileobj, BUCKET_NAME, s3_object_key, ExtraArgs={'ContentType': content_type})
+    job.artifact_s3_object_key = s3_object_key
+
+
+def run_chunked_ids(job: Job, model: Type[models.Model], ids: List[Any], fn: Callable[[QuerySet], Any],
+                    chunk_size: int = 1000) -> None:
+    """Applies fn to the rows of a sorted list of primary keys, e.g. the rows selected in the admin, in chunks.
+    Each chunk is looked up by its own keys, so a chunk costs the same however large the selection is.  The
+    number of keys done is checkpointed after each chunk, so a job restarted on another worker continues there."""
+    done = job.checkpoint.get('done', 0)
+    while done < len(ids):
+        pks = ids[done:done + chunk_size]
+        with transaction.atomic():
+            fn(model.objects.filter(pk__in=pks))
+        done += len(pks)
+        job.save_checkpoint(done / len(ids), {'done': done})
+
+
+# Admin actions that run as 'bulk_action' jobs: name -> (model, function applied to each chunk of the selection).
+# Every function must be safe to apply to a chunk twice, since a reclaimed job repeats its last chunk.
+BULK_ACTIONS: dict[str, Tuple[Type[models.Model], Callable[[QuerySet], Any]]] = {
+    'mark_valid_orientation': (Image, lambda images: set_valid_orientation(images, True)),
+    'mark_invalid_orientation': (Image, lambda images: set_valid_orientation(images, False)),
+    'delete_images': (Image, delete_images),
+    'recompute_image_counts': (Container,
+                               lambda containers: recompute_image_counts(containers.values_list('id', flat=True))),
+}
+
+
+def enqueue_bulk_action(action: str, queryset: QuerySet) -> Job:
+    """Queues action over the rows of queryset.  Only their primary keys are read now."""
+    if action not in BULK_ACTIONS:
+        raise ValueError(f'Unknown bulk action: {action}')
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    return Job.objects.create(kind='bulk_action', params={'action': action, 'ids': ids},
+                              message=f'{action} on {len(ids)} {queryset.model._meta.verbose_name_plural}')
+
+
+@job_handler('bulk_action')
+def bulk_action_job(job: Job) -> None:
+    model, fn = BULK_ACTIONS[job.params['action']]
+    run_chunked_ids(job, model, job.params['ids'], fn)
+
+
+@job_handler('load_models_from_csv')
+def load_models_from_csv_job(job: Job) -> None:
+    load_models_from_csv(job.params['dir_name'], checkpoint=job.checkpoint, on_progress=job.save_checkpoint)
+
+
+@job_handler('compact_capture_rollups')
+def compact_capture_rollups_job(job: Job) -> None:
+    days = job.params.get('days')
+    compact_capture_rollups(date.today() - timedelta(days=int(days)) if days is not None else None)
+
+
+@job_handler('index_s3_captures')
+def index_s3_captures_job(job: Job) -> None:
+    index_captures(**job.params)
+
+
+def classifier_export_job(name: str) -> JobHandler:
+    # Exports are cheap to restart, so a reclaimed export starts over; progress is still checkpointed so it can
+    # be reported.
+    @use_replica()
+    def handler(job: Job) -> None:
+        create_json, iter_records = CLASSIFIER_EXPORTS[name]
+        params = job.params
+        ratios = parse_split_ratios(params['splits']) if params.get('splits') else None
+
+        if params.get('format') == 'jsonl':
+            compression = params.get('compression', 'gzip')
+            url_prefix = DEFAULT_URL_PREFIX if params.get('factor_prefix') else ''
+            total = Image.objects.count()
+
+            def iter_counted():
+                for i, record in enumerate(iter_records()):
+                    if i % CHECKPOINT_INTERVAL == 0:
+                        job.save_checkpoint(min(i / max(total, 1), 1.0))
+                    yield record
+
+            if ratios:
+                lines = create_classifier_splits_jsonl(iter_counted(), CLASSIFIER_LABELS[name](), ratios, url_prefix)
+            else:
+                lines = create_classifier_jsonl(iter_counted(), url_prefix)
+            file_name = f'{name}.jsonl{COMPRESSION_EXTENSIONS[compression]}'
+            chunks = compress_stream(lines, compression)
+            content_type = COMPRESSION_CONTENT_TYPES[compression]
+        else:
+            with stage(f'export.{name}.build'):
+                json = create_classifier_splits_json(iter_records(), CLASSIFIER_LABELS[name](), ratios) if ratios \
+                    else create_json()
+            file_name = f'{name}_splits.json' if ratios else f'{name}.json'
+            chunks = [json.encode('utf-8')]
+            content_type = 'text/json'
+
+        with tempfile.TemporaryFile() as f:
+            with stage(f'export.{name}.build'):
+                for chunk in chunks:
+                    f.write(chunk)
+            f.seek(0)
+            with stage(f'export.{name}.upload'):
+                upload_job_artifact(job, file_name, f, content_type)
+
+    return handler
+
+
+for _name in CLASSIFIER_EXPORTS:
+    job_handler(_name)(classifier_export_job(_name))
@@ -0,0 +1,141 @@
+import asyncio
+import base64
+import io
+import queue
+import re
+import statistics
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from typing import Callable, List
+from unittest import mock
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from PIL import Image as PILImage
+
+from recyclable.capture_sessions import CAPTURE_CATEGORIES
+from recyclable.models import Container, mk_container
+
+BENCH_BARCODE = 'bench-capture'
+BENCH_USER = 'bench-capture'
+
+
+class Command(BaseCommand):
+    help = ('Compares the image capture throughput of concurrent tablets when the views are served like a sync WSGI '
+            'deployment (a fixed number of worker threads) and like an ASGI one (one event loop).  S3 uploads are '
+            'replaced by a sleep of --s3-latency seconds unless --real-s3 is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tablets', type=int, default=12, help='Number of tablets capturing at the same time.')
+        parser.add_argument('--captures', type=int, default=10, help='Number of images each tablet captures.')
+        parser.add_argument('--wsgi-workers', type=int, default=3, help='Number of sync workers to compare with.')
+        parser.add_argument('--s3-latency', type=float, default=0.25, help='Simulated S3 PUT time in seconds.')
+        parser.add_argument('--real-s3', action='store_true', help='Upload the images to S3.')
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(username=BENCH_USER)
+        c = mk_container(BENCH_BARCODE, 'bench', 'bench', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        num_captures = options['tablets'] * options['captures']
+        # Every capture posts i_image 1 of a session planned for more captures than are sent.
+        start = {'container_id': c.id, 'barcode': c.barcode, 'num_images': num_captures + 1,
+                 'valid_percentage': 100, **{f'{name}_percentage': 0 for name in CAPTURE_CATEGORIES[1:]}}
+        data = {'i_image': 1, 'image_width': 640, 'image_height': 480, 'frame_data_url': frame_data_url()}
+
+        def fake_upload(s3_object_key: str, image_data: bytes) -> str:
+            time.sleep(options['s3_latency'])
+            return uuid.uuid4().hex
+
+        try:
+            with nullcontext() if options['real_s3'] else mock.patch('recyclable.views.upload_image_bytes_to_s3',
+                                                                     fake_upload):
+                self.stdout.write(f'{options["tablets"]} tablets x {options["captures"]} captures, '
+                                  f'S3 latency {"real" if options["real_s3"] else options["s3_latency"]}')
+                self.report(f'WSGI, {options["wsgi_workers"]} workers',
+                            *run_wsgi(user, start, data, num_captures, options['wsgi_workers']))
+                self.report('ASGI, 1 event loop',
+                            *asyncio.run(run_asgi(user, start, data, options['tablets'], options['captures'])))
+        finally:
+            c.delete()
+
+    def report(self, name: str, elapsed: float, latencies: List[float]) -> None:
+        p50 = statistics.median(latencies) * 1000
+        p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+        self.stdout.write(f'{name:<24} {len(latencies) / elapsed:7.1f} captures/s   '
+                          f'p50 {p50:8.1f} ms   p95 {p95:8.1f} ms')
+
+
+def frame_data_url() -> str:
+    # Noise does not compress, so the PNG is about the size of a real capture.
+    buffer = io.BytesIO()
+    PILImage.effect_noise((640, 480), 64).convert('RGB').save(buffer, 'PNG')
+    return f'data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode("ascii")}'
+
+
+def capture_session_id(response) -> str:
+    return re.search(r'name="capture_session" value="(\w+)"', response.content.decode()).group(1)
+
+
+def timed(post: Callable[[], None], latencies: List[float]) -> None:
+    t0 = time.perf_counter()
+    post()
+    latencies.append(time.perf_counter() - t0)
+
+
+def run_wsgi(user, start: dict, data: dict, num_captures: int, num_workers: int):
+    """Each worker thread handles one request at a time, like a sync gunicorn worker."""
+    requests = queue.Queue()
+    for _ in range(num_captures):
+        requests.put(data)
+    latencies: List[float] = []
+
+    def worker() -> None:
+        client = Client()
+        client.force_login(user)
+        url = reverse('recyclable:image')
+        capture_session = capture_session_id(client.post(url, start))
+        while True:
+            try:
+                request_data = requests.get_nowait()
+            except queue.Empty:
+                break
+            timed(lambda: client.post(url, {**request_data, 'capture_session': capture_session}), latencies)
+        connections.close_all()
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - t0, latencies
+
+
+async def run_asgi(user, start: dict, data: dict, num_tablets: int, num_captures: int):
+    """Every tablet has a request in flight at all times, all served by one event loop."""
+    client = AsyncClient()
+    await sync_to_async(client.force_login)(user)
+    url = reverse('recyclable:image')
+    async with ThreadSensitiveContext():
+        data = {**data, 'capture_session': capture_session_id(await client.post(url, start))}
+    latencies: List[float] = []
+
+    async def tablet() -> None:
+        for _ in range(num_captures):
+            # ASGIHandler runs each request's sync code in its own thread; the test client does not.
+            async with ThreadSensitiveContext():
+                t0 = time.perf_counter()
+                await client.post(url, data)
+                latencies.append(time.perf_counter() - t0)
+                await sync_to_async(connections.close_all)()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(tablet() for _ in range(num_tablets)))
+    return time.perf_counter() - t0, latencies
@@ -0,0 +1,81 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from recyclable.models import Container, Image, mk_container
+from recyclable.partitions import is_partitioned
+from recyclable.views_helpers import encode_cursor, production_images_page
+
+BENCH_BARCODE = 'bench-container'
+NUM_CUBES = 20
+
+
+class Command(BaseCommand):
+    help = 'Times the production image grid range queries, optionally after seeding synthetic images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Number of synthetic images to insert first.')
+        parser.add_argument('--months', type=int, default=24, help='Spread the seeded images over this many months.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--runs', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], options['months'], options['batch_size'])
+
+        bounds = Image.objects.filter(timestamp__isnull=False).aggregate(first=Min('timestamp'), last=Max('timestamp'))
+        if bounds['first'] is None:
+            self.stdout.write('No images with a timestamp; use --seed.')
+            return
+
+        self.stdout.write(f'{Image.objects.count()} images, partitioned: {is_partitioned()}')
+        queries = {
+            'day, first page': lambda start: list(
+                Image.objects.filter(timestamp__range=(start, start + timedelta(days=1))).order_by('timestamp')[:100]),
+            'week, count': lambda start: Image.objects.filter(
+                timestamp__range=(start, start + timedelta(days=7))).count(),
+            'cube, month, first page': lambda start: list(
+                Image.objects.filter(cube_sn=f'cube{random.randrange(NUM_CUBES)}',
+                                     timestamp__range=(start, start + timedelta(days=30))).order_by('timestamp')[:100]),
+            'api page, no filters': lambda start: production_images_page({}, encode_cursor(start, 0)),
+            'api page, cube': lambda start: production_images_page(
+                {'cubes': [f'cube{random.randrange(NUM_CUBES)}']}, encode_cursor(start, 0)),
+            'api page, valid deposits': lambda start: production_images_page(
+                {'deposit_types': ['valid']}, encode_cursor(start, 0)),
+        }
+        span = (bounds['last'] - bounds['first']).total_seconds()
+        for name, query in queries.items():
+            timings = []
+            for _ in range(options['runs']):
+                start = bounds['first'] + timedelta(seconds=random.uniform(0, span))
+                t0 = time.perf_counter()
+                query(start)
+                timings.append((time.perf_counter() - t0) * 1000)
+            p50 = statistics.median(timings)
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            self.stdout.write(f'{name:<28} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms')
+
+    def seed(self, n: int, months: int, batch_size: int) -> None:
+        c = Container.objects.filter(barcode=BENCH_BARCODE).first()
+        if c is None:
+            c = mk_container(BENCH_BARCODE, 'bench', 'bench', Container.MaterialType.ALUMINUM,
+                             Container.PlasticCode.NA, 12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+            c.save()
+
+        end = datetime.now(timezone.utc)
+        span = timedelta(days=30 * months).total_seconds()
+        offset = Image.objects.filter(container=c).count()
+        for i_batch in range(0, n, batch_size):
+            Image.objects.bulk_create(
+                Image(container=c, image_sequence_number=offset + i,
+                      aws_entity_tag=f'bench-{offset + i}', s3_bucket_name='olyns-recyclable',
+                      aws_region_name='us-west-2', s3_object_key=f'bench/{offset + i}.png',
+                      crush_degree=i % 5, valid_orientation=True, cube_sn=f'cube{i % NUM_CUBES}',
+                      timestamp=end - timedelta(seconds=random.uniform(0, span)))
+                for i in range(i_batch, min(i_batch + batch_size, n))
+            )
+            self.stdout.write(f'seeded {min(i_batch + batch_size, n)} / {n}')
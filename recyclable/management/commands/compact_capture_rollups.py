@@ -0,0 +1,18 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from recyclable.models import compact_capture_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recounts the capture rollups of recent days from the Image table.  Run it nightly, e.g. from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Recount the days since this many days ago.')
+        parser.add_argument('--all', action='store_true', help='Recount every day.')
+
+    def handle(self, *args, **options):
+        since = None if options['all'] else date.today() - timedelta(days=options['days'])
+        num_rollups = compact_capture_rollups(since)
+        self.stdout.write(f'wrote {num_rollups} rollups' + (f' since {since}' if since else ''))
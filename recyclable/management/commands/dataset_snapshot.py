@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recyclable.models import DatasetSnapshot, Image
+from recyclable.snapshots import create_snapshot, diff_snapshots
+from recyclable.views_helpers import CLASSIFIER_EXPORTS
+
+
+class Command(BaseCommand):
+    help = 'Records an immutable snapshot of a classifier export, or diffs two snapshots.'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        create = subparsers.add_parser('create')
+        create.add_argument('name')
+        create.add_argument('--classifier', default='deposit_classifier', choices=list(CLASSIFIER_EXPORTS))
+
+        diff = subparsers.add_parser('diff')
+        diff.add_argument('old')
+        diff.add_argument('new')
+        diff.add_argument('--urls', action='store_true', help='Include the URL of every added, moved or changed image.')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'create':
+            snapshot = create_snapshot(options['name'], options['classifier'])
+            self.stdout.write(f'created {snapshot}')
+            return
+
+        try:
+            old = DatasetSnapshot.objects.get(name=options['old'])
+            new = DatasetSnapshot.objects.get(name=options['new'])
+        except DatasetSnapshot.DoesNotExist as e:
+            raise CommandError(str(e))
+
+        diff = diff_snapshots(old, new)
+        result = {
+            'added': [{'image_id': i, 'class': cls} for i, cls in diff.added],
+            'removed': [{'image_id': i, 'class': cls} for i, cls in diff.removed],
+            'moved': [{'image_id': i, 'old_class': old_cls, 'class': cls} for i, old_cls, cls in diff.moved],
+            'changed': [{'image_id': i, 'class': cls} for i, cls in diff.changed],
+        }
+
+        if options['urls']:
+            items = result['added'] + result['moved'] + result['changed']
+            images = Image.objects.in_bulk([item['image_id'] for item in items])
+            for item in items:
+                img = images.get(item['image_id'])
+                item['url'] = img.url() if img else None
+
+        self.stdout.write(json.dumps(result))
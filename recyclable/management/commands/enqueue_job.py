@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recyclable.jobs import enqueue_job
+
+
+class Command(BaseCommand):
+    help = 'Queues a background job, e.g. enqueue_job load_models_from_csv dir_name=/data/export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind')
+        parser.add_argument('params', nargs='*', help='key=value job parameters.  Values that parse as JSON, e.g. '
+                                                      'days=7 or full=true, are passed as such; others as strings.')
+
+    def handle(self, *args, **options):
+        params = {}
+        for param in options['params']:
+            key, sep, value = param.partition('=')
+            if not sep:
+                raise CommandError(f'Invalid parameter {param}, expected key=value')
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+
+        try:
+            job = enqueue_job(options['kind'], params)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'queued job {job.id}')
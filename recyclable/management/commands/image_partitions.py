@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recyclable.partitions import enable_partitioning, create_future_partitions, detach_old_partitions, \
+    is_partitioned, list_partitions
+
+
+class Command(BaseCommand):
+    help = 'Manages the optional monthly partitioning of the Image table by timestamp.'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        enable = subparsers.add_parser('enable', help='Convert the Image table to a partitioned table.')
+        enable.add_argument('--months-ahead', type=int, default=3)
+
+        create = subparsers.add_parser('create', help='Create the partitions for the coming months.')
+        create.add_argument('--months-ahead', type=int, default=3)
+
+        detach = subparsers.add_parser('detach', help='Detach partitions older than --keep-months.')
+        detach.add_argument('--keep-months', type=int, required=True)
+        detach.add_argument('--drop', action='store_true', help='Drop the detached partitions.')
+
+        subparsers.add_parser('list')
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'enable':
+            try:
+                enable_partitioning(options['months_ahead'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f'partitioned; {len(list_partitions())} monthly partitions')
+            return
+
+        if not is_partitioned():
+            raise CommandError('The Image table is not partitioned; run "image_partitions enable" first.')
+
+        if action == 'create':
+            for name in create_future_partitions(options['months_ahead']):
+                self.stdout.write(f'created {name}')
+        elif action == 'detach':
+            for name in detach_old_partitions(options['keep_months'], options['drop']):
+                self.stdout.write(f'{"dropped" if options["drop"] else "detached"} {name}')
+        else:
+            for name, month in list_partitions():
+                self.stdout.write(f'{name}  {month:%Y-%m}')
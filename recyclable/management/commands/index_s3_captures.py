@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recyclable.s3_index import CAPTURES_BUCKET_NAME, CAPTURES_PREFIX, index_captures
+
+
+class Command(BaseCommand):
+    help = 'Indexes the production captures in S3 into the S3Object table.  Only new dates are listed unless ' \
+           '--full is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bucket', default=CAPTURES_BUCKET_NAME)
+        parser.add_argument('--prefix', default=CAPTURES_PREFIX)
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--full', action='store_true', help='List every date, not only the new ones.')
+
+    def handle(self, *args, **options):
+        result = index_captures(options['bucket'], options['prefix'], max_workers=options['workers'],
+                                full=options['full'])
+        self.stdout.write(f'prefixes: {result.num_prefixes}, objects: {result.num_objects}, '
+                          f'failed prefixes: {result.num_failed_prefixes}')
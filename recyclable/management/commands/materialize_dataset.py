@@ -0,0 +1,30 @@
+import json
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from recyclable.sagemaker import classifier_items, materialize_dataset, with_image_data, write_manifest
+from recyclable.utils import BUCKET_NAME
+
+
+class Command(BaseCommand):
+    help = ('Copies the images of a classifier JSON into the {prefix}/{class}/{image_id}_{file} layout used for '
+            'training.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('classifier_json', help='Path to a classifier (or classifier splits) JSON file.')
+        parser.add_argument('prefix', help='Destination prefix, e.g. datasets/deposit/2024-11-10')
+        parser.add_argument('--bucket', default=BUCKET_NAME)
+        parser.add_argument('--workers', type=int, default=16)
+
+    def handle(self, *args, **options):
+        with open(options['classifier_json']) as f:
+            classifier = json.load(f)
+
+        items = with_image_data(classifier_items(classifier))
+        results = materialize_dataset(items, options['bucket'], options['prefix'], max_workers=options['workers'])
+        manifest_key = write_manifest(results, options['bucket'], options['prefix'])
+
+        statuses = Counter(r.status for r in results)
+        self.stdout.write(f'copied: {statuses["copied"]}, skipped: {statuses["skipped"]}, '
+                          f'failed: {statuses["failed"]}, manifest: s3://{options["bucket"]}/{manifest_key}')
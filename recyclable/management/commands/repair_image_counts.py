@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recyclable.models import recompute_image_counts
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-container image counts from the Image table, e.g. after images were edited or ' \
+           'deleted in the admin app.'
+
+    def handle(self, *args, **options):
+        num_containers = recompute_image_counts()
+        self.stdout.write(f'recomputed the image counts of {num_containers} containers')
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recyclable.jobs import run_worker
+from recyclable.metrics import serve_metrics
+
+
+class Command(BaseCommand):
+    help = 'Claims and runs queued background jobs.  Start one or more of these on any node to add capacity.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker', default=None, help='Worker name (defaults to host:pid).')
+        parser.add_argument('--poll-interval', type=float, default=5.0)
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty.')
+        parser.add_argument('--metrics-port', type=int, default=None,
+                            help='Serve this worker\'s metrics on this port (requires METRICS_ENABLED).')
+
+    def handle(self, *args, **options):
+        if options['metrics_port'] is not None:
+            if not settings.METRICS_ENABLED:
+                raise CommandError('--metrics-port requires METRICS_ENABLED.')
+            serve_metrics(options['metrics_port'])
+        num_jobs = run_worker(options['worker'], options['poll_interval'], options['once'])
+        self.stdout.write(f'ran {num_jobs} jobs')
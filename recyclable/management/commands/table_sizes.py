@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+TABLE_SIZES_SQL = '''
+SELECT c.relname, c.reltuples::bigint, pg_table_size(c.oid), pg_indexes_size(c.oid), pg_total_relation_size(c.oid)
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema() AND c.relname LIKE %s
+ORDER BY pg_total_relation_size(c.oid) DESC
+'''
+
+INDEX_SIZES_SQL = '''
+SELECT i.indexrelname, pg_relation_size(i.indexrelid)
+FROM pg_stat_user_indexes i
+WHERE i.relname = %s
+ORDER BY pg_relation_size(i.indexrelid) DESC
+'''
+
+
+class Command(BaseCommand):
+    help = 'Reports the table and index sizes of the recyclable tables, e.g. before and after a migration.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--indexes', action='store_true', help='Also list the size of every index.')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute(TABLE_SIZES_SQL, ['recyclable_%'])
+            tables = cursor.fetchall()
+
+            self.stdout.write(f'{"table":<40}{"rows":>12}{"table":>12}{"indexes":>12}{"total":>12}')
+            for name, rows, table_size, indexes_size, total_size in tables:
+                self.stdout.write(f'{name:<40}{rows:>12}{mb(table_size):>12}{mb(indexes_size):>12}{mb(total_size):>12}')
+
+                if options['indexes']:
+                    cursor.execute(INDEX_SIZES_SQL, [name])
+                    for index_name, index_size in cursor.fetchall():
+                        self.stdout.write(f'    {index_name:<60}{mb(index_size):>12}')
+
+
+def mb(n_bytes: int) -> str:
+    return f'{n_bytes / 2 ** 20:.1f} MB'
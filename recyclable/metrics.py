@@ -0,0 +1,208 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Histograms of request latency, DB queries per request and named stage timings, kept in memory per process and
+# rendered in the Prometheus text format by the metrics view (or serve_metrics() in a job worker).  With
+# METRICS_ENABLED off, MetricsMiddleware removes itself, no query counter is installed and stage() is a
+# nullcontext.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_bound(bound: float) -> str:
+    return '+Inf' if math.isinf(bound) else repr(float(bound))
+
+
+class Histogram:
+    """A Prometheus histogram with one series per combination of label values (at least one label)."""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = (*buckets, math.inf)
+        # label values -> [count per bucket..., sum]
+        self._series: dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        i_bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0]
+            series[i_bucket] += 1
+            series[-1] += value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            snapshot = {label_values: list(series) for label_values, series in self._series.items()}
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for label_values, series in sorted(snapshot.items()):
+            labels = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(self.label_names, label_values))
+            count = 0
+            for bound, n in zip(self.buckets, series):
+                count += n
+                yield f'{self.name}_bucket{{{labels},le="{format_bound(bound)}"}} {count}'
+            yield f'{self.name}_sum{{{labels}}} {series[-1]}'
+            yield f'{self.name}_count{{{labels}}} {count}'
+
+
+REQUEST_SECONDS = Histogram('recyclable_request_seconds', 'Time to produce a response, by view.',
+                            ('view', 'method', 'status'), LATENCY_BUCKETS)
+REQUEST_DB_QUERIES = Histogram('recyclable_request_db_queries', 'Database queries per request, by view.',
+                               ('view', ), QUERY_COUNT_BUCKETS)
+STAGE_SECONDS = Histogram('recyclable_stage_seconds', 'Time spent in a named stage of a request or job.',
+                          ('stage', ), LATENCY_BUCKETS)
+HISTOGRAMS = [REQUEST_SECONDS, REQUEST_DB_QUERIES, STAGE_SECONDS]
+
+
+def render_metrics() -> str:
+    return '\n'.join(line for histogram in HISTOGRAMS for line in histogram.samples()) + '\n'
+
+
+@contextmanager
+def _timed_stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, name)
+
+
+def stage(name: str):
+    """Times the with block as stage name, e.g. with stage('capture.s3_put'): ..."""
+    return _timed_stage(name) if settings.METRICS_ENABLED else nullcontext()
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorates a sync function to time each call as stage name."""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(name: str, iterable: Iterable) -> Iterator:
+    """Times the iteration of iterable, from the first item to exhaustion, as stage name.  For streamed
+    responses, which are produced after their view returns."""
+    with stage(name):
+        yield from iterable
+
+
+# The number of queries of the current request, shared with the threads that sync_to_async() runs its code in.
+_request_queries: ContextVar[Optional[List[int]]] = ContextVar('request_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _add_query_counter(sender, connection, **kwargs) -> None:
+    # connection_created is sent again whenever a DatabaseWrapper reconnects.
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def count_queries() -> None:
+    """Counts the queries of every connection opened from now on, and of this thread's open ones."""
+    connection_created.connect(_add_query_counter)
+    for connection in connections.all(initialized_only=True):
+        _add_query_counter(None, connection)
+
+
+class MetricsMiddleware:
+    """Records the latency and number of DB queries of every request, labelled by view name.  The latency of a
+    streamed response is the time to its first byte."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        queries = [0]
+        token = _request_queries.set(queries)
+        t0 = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.observe(request, response, time.perf_counter() - t0, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        queries = [0]
+        token = _request_queries.set(queries)
+        t0 = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.observe(request, response, time.perf_counter() - t0, queries[0])
+        return response
+
+    @staticmethod
+    def observe(request, response, seconds: float, num_queries: int) -> None:
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        REQUEST_SECONDS.observe(seconds, view, request.method, str(response.status_code))
+        REQUEST_DB_QUERIES.observe(num_queries, view)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int) -> ThreadingHTTPServer:
+    """Serves render_metrics() on port from a daemon thread, for processes without a web server (job workers)."""
+    server = ThreadingHTTPServer(('', port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Container',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('barcode', models.CharField(max_length=255, unique=True)),
+                ('brand', models.CharField(default='', max_length=255)),
+                ('product_name', models.CharField(default='', max_length=255)),
+                ('material_type', models.CharField(choices=[('alu', 'Aluminum'), ('bimetal', 'Bimetal'), ('cardboard', 'Cardboard'), ('FOIL_LAMINATE', 'Foil Laminate'), ('glass', 'Glass'), ('paper', 'Paper'), ('organic', 'Organic'), ('plastic', 'Plastic'), ('other', 'Other'), ('unknown', 'Unknown')], max_length=31)),
+                ('plastic_code', models.CharField(choices=[('1_pet', '1-PET'), ('2_hdpe', '2-HDPE'), ('3_pvc', '3-PVC'), ('4_ldpe', '4-LDPE'), ('5_pp', '5-PP'), ('6_ps', '6-PS'), ('7_o', '7-OTHER'), ('NA', 'NA'), ('unknown', 'Unknown')], max_length=31)),
+                ('rigidity', models.CharField(choices=[('rigid', 'Rigid'), ('flexible', 'Flexible'), ('unknown', 'Unknown')], default='rigid', max_length=31)),
+                ('shape', models.CharField(choices=[('unknown', 'Unknown'), ('bottle', 'Bottle'), ('can_beverage', 'Can Beverage'), ('can_food', 'Can Food'), ('cup', 'Cup'), ('jar', 'Jar'), ('cubic', 'Cubic'), ('egg_shaped', 'Egg Shaped'), ('bag_wrapper', 'Bag Wrapper'), ('pouch', 'Pouch'), ('rest', 'Rest')], default='unknown', max_length=31)),
+                ('content_type', models.CharField(choices=[('unknown', 'Unknown'), ('beverage', 'Beverage'), ('candy', 'Candy'), ('oil', 'Oil'), ('cosmetics', 'Cosmetics'), ('pharmaceutical', 'Pharmaceutical'), ('food', 'Food'), ('condiments', 'Condiments'), ('flammable', 'Flammable'), ('rest', 'Rest')], default='unknown', max_length=31)),
+                ('hazardous', models.CharField(choices=[('unknown', 'Unknown'), ('yes', 'Yes'), ('no', 'No')], default='unknown', max_length=31)),
+                ('beverage_type', models.CharField(choices=[('NA', 'NA'), ('unknown', 'Unknown'), ('water', 'Water'), ('flavored_water', 'Flavored Water'), ('coconut_water', 'Coconut Water'), ('soft_drink', 'Soft Drink'), ('soft_drink_alternative', 'Soft Drink Alternative'), ('sports_drink', 'Sports Drink'), ('energy_drink', 'Energy Drink'), ('alcoholic_beverage', 'Alcoholic Beverage'), ('dairy', 'Dairy'), ('substitute_milk', 'Substitute Milk'), ('protein_shake', 'Protein Shake'), ('fruit_juice', 'Fruit Juice'), ('vegetable_juice', 'Vegetable Juice'), ('coffee', 'Coffee'), ('tea', 'Tea'), ('probiotics', 'Probiotics'), ('rest', 'Rest')], default='unknown', max_length=31)),
+                ('alcohol_percentage', models.FloatField(default=-1.0)),
+                ('alcoholic', models.CharField(choices=[('unknown', 'Unknown'), ('yes', 'Yes'), ('no', 'No')], default='no', max_length=31)),
+                ('alcoholic_drinks_type', models.CharField(choices=[('NA', 'NA'), ('unknown', 'Unknown'), ('absinthe', 'Absinthe'), ('baijiu', 'Baijiu'), ('beer', 'Beer'), ('bourbon', 'Bourbon'), ('brandy', 'Brandy'), ('cocktail_mix', 'Cocktail Mix'), ('cognac', 'Cognac'), ('gin', 'Gin'), ('hard_seltzer', 'Hard Seltzer'), ('makgeolli', 'Makgeolli'), ('malt', 'Malt'), ('rum', 'Rum'), ('sake', 'Sake'), ('scotch', 'Scotch'), ('soju', 'Soju'), ('tequila', 'Tequila'), ('vermouth', 'Vermouth'), ('vodka', 'Vodka'), ('whisky', 'Whisky'), ('wine', 'Wine'), ('other', 'Other')], default='NA', max_length=31)),
+                ('wine_bottle_shape', models.CharField(choices=[('NA', 'NA'), ('unknown', 'Unknown'), ('alsace', 'Alsace'), ('bordeaux', 'Bordeaux'), ('burgundy', 'Burgundy'), ('champagne', 'Champagne'), ('chianti', 'Chianti'), ('port', 'Port'), ('provence', 'Provence'), ('other', 'Other')], default='NA', max_length=31)),
+                ('wine_type', models.CharField(choices=[('NA', 'NA'), ('unknown', 'Unknown'), ('albariño', 'Albariño'), ('cabernet_franc', 'Cabernet Franc'), ('cabernet_sauvignon', 'Cabernet Sauvignon'), ('cava', 'Cava'), ('champagne', 'Champagne'), ('chardonnay', 'Chardonnay'), ('chenin_blanc', 'Chenin Blanc'), ('gewürztraminer', 'Gewürztraminer'), ('grüner_veltliner', 'Grüner Veltliner'), ('madeira', 'Madeira'), ('malbec', 'Malbec'), ('merlot', 'Merlot'), ('muscat', 'Muscat'), ('pinot_blanc', 'Pinot Blanc'), ('pinot_gris', 'Pinot Gris'), ('pinot_noir', 'Pinot Noir'), ('port', 'Port'), ('prosecco', 'Prosecco'), ('red_blend', 'Red Blend'), ('riesling', 'Riesling'), ('rosé', 'Rosé'), ('sancerre', 'Sancerre'), ('sangiovese', 'Sangiovese'), ('sauvignon_blanc', 'Sauvignon Blanc'), ('sherry', 'Sherry'), ('shiraz', 'Shiraz'), ('sparkling_wine', 'Sparkling Wine'), ('sylvaner', 'Sylvaner'), ('white_blend', 'White Blend'), ('zinfandel', 'Zinfandel')], default='NA', max_length=31)),
+                ('liquid_volume', models.FloatField(default=-1.0)),
+                ('liquid_volume_unit', models.CharField(choices=[('OZ', 'fl oz'), ('ML', 'mL'), ('LITER', 'L'), ('NA', 'NA')], max_length=31)),
+                ('mass_gram', models.FloatField(default=-1.0)),
+                ('ca', models.BooleanField(default=False)),
+                ('ct', models.BooleanField(default=False)),
+                ('gu', models.BooleanField(default=False)),
+                ('hi', models.BooleanField(default=False)),
+                ('ia', models.BooleanField(default=False)),
+                ('me', models.BooleanField(default=False)),
+                ('ma', models.BooleanField(default=False)),
+                ('mi', models.BooleanField(default=False)),
+                ('ny', models.BooleanField(default=False)),
+                ('Or', models.BooleanField(default=False)),
+                ('vt', models.BooleanField(default=False)),
+                ('juice_percentage', models.FloatField(default=-1.0)),
+                ('material_color', models.CharField(choices=[('amber', 'Amber'), ('beige', 'Beige'), ('black', 'Black'), ('blue', 'Blue'), ('brown', 'Brown'), ('cobalt_blue', 'Cobalt Blue'), ('emerald_green', 'Emerald Green'), ('fluorescent_green', 'Fluorescent Green'), ('frosted', 'Frosted'), ('gold', 'Gold'), ('green', 'Green'), ('grey', 'Grey'), ('holographic', 'Holographic'), ('khaki', 'Khaki'), ('multi_color', 'Multi Color'), ('navy_blue', 'Navy Blue'), ('olive_green', 'Olive Green'), ('orange', 'Orange'), ('pink', 'Pink'), ('purple', 'Purple'), ('red', 'Red'), ('silver', 'Silver'), ('translucent', 'Translucent'), ('transparent', 'Transparent'), ('unknown', 'Unknown'), ('white', 'White'), ('yellow', 'Yellow')], default='unknown', max_length=31)),
+                ('ribbed', models.CharField(choices=[('ribbed_body', 'Ribbed Body'), ('ribbed_neck', 'Ribbed Neck'), ('NA', 'NA'), ('unknown', 'Unknown')], default='NA', max_length=31)),
+                ('ringed', models.CharField(choices=[('single_ring', 'Single Ring'), ('double_ring', 'Double Ring'), ('NA', 'NA'), ('unknown', 'Unknown')], default='NA', max_length=31)),
+                ('visual_volume', models.CharField(choices=[('NA', 'NA'), ('small', 'Small'), ('LT_24_OZ', 'Less than 24 oz'), ('GT_24_OZ', 'Greater than 24 oz')], default='NA', max_length=31)),
+                ('made_in', models.CharField(default='UNK', help_text='Enter the 3-letter country code.', max_length=3)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Image',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deposit_id', models.CharField(blank=True, default='', max_length=255)),
+                ('image_id', models.CharField(blank=True, default='', max_length=255)),
+                ('image_sequence_number', models.IntegerField(default=0)),
+                ('aws_entity_tag', models.CharField(max_length=511, unique=True)),
+                ('s3_bucket_name', models.CharField(max_length=63)),
+                ('aws_region_name', models.CharField(max_length=63)),
+                ('s3_object_key', models.CharField(max_length=511, unique=True)),
+                ('lid_cap', models.CharField(choices=[('unknown', 'Unknown'), ('true', 'True'), ('false', 'False')], default='unknown', max_length=31)),
+                ('crush_degree', models.IntegerField()),
+                ('label', models.CharField(choices=[('neck_only', 'Neck Only'), ('body_only', 'Body Only'), ('neither', 'Neither'), ('neck_and_body', 'Neck and Body')], default='body_only', max_length=31)),
+                ('orientation_style', models.CharField(choices=[('unknown', 'Unknown'), ('standing_up', 'Standing Up'), ('leaning', 'Leaning'), ('orthogonal', 'Orthogonal'), ('parallel', 'Parallel')], default='unknown', max_length=31)),
+                ('valid_orientation', models.BooleanField()),
+                ('image_quality', models.CharField(choices=[('valid_image', 'Valid Image'), ('invalid_image', 'Invalid Image'), ('unknown_image', 'Unknown Image'), ('partially_shown', 'Partially Shown'), ('blurry_moving_belt', 'Blurry Moving Belt'), ('out_of_focus', 'Out of Focus'), ('bad_lighting', 'Bad Lighting'), ('blurry_moving_container', 'Blurry Moving Container')], default='valid_image', max_length=31)),
+                ('container_in_frame', models.FloatField(null=True)),
+                ('image_height', models.FloatField(default=-1.0)),
+                ('image_width', models.FloatField(default=-1.0)),
+                ('hands_in_image', models.CharField(choices=[('no_hands', 'No Hands'), ('hands', 'Hands'), ('blurry_hands_in', 'Blurry Hands In'), ('blurry_hands_out', 'Blurry Hands Out')], default='no_hands', max_length=31)),
+                ('count', models.CharField(choices=[('empty', 'Empty'), ('solo', 'Solo'), ('multiple', 'Multiple')], default='solo', max_length=31)),
+                ('imager_version', models.CharField(default='unknown', max_length=255)),
+                ('timestamp', models.DateTimeField(blank=True, default=None, null=True)),
+                ('company_name', models.CharField(default='unknown', max_length=255)),
+                ('store_name', models.CharField(default='unknown', max_length=255)),
+                ('cube_sn', models.CharField(default='unknown', max_length=255)),
+                ('database_version', models.IntegerField(default=1)),
+                ('container', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='recyclable.container')),
+            ],
+        ),
+    ]
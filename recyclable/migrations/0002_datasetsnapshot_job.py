@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recyclable', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetSnapshot',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('classifier', models.CharField(max_length=63)),
+                ('classes', models.JSONField(default=list)),
+                ('num_items', models.IntegerField(default=0)),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(max_length=63)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=31)),
+                ('progress', models.FloatField(default=0.0)),
+                ('checkpoint', models.JSONField(blank=True, default=dict)),
+                ('message', models.TextField(blank=True, default='')),
+                ('worker', models.CharField(blank=True, default='', max_length=255)),
+                ('heartbeat_at', models.DateTimeField(blank=True, default=None, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('artifact_s3_object_key', models.CharField(blank=True, default='', max_length=511)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='recyclable__status_770b16_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:09
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without locking the tables against writes.
+    atomic = False
+
+    dependencies = [
+        ('recyclable', '0002_datasetsnapshot_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='container',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='recyclable.container'),
+        ),
+        AddIndexConcurrently(
+            model_name='container',
+            index=models.Index(condition=models.Q(('ca', True)), fields=['material_type'], name='container_ca_material_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(fields=['container', 'image_sequence_number'], name='image_container_seq_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(condition=models.Q(('crush_degree__in', [0, 1]), ('valid_orientation', True)), fields=['container'], name='image_valid_uncrushed_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(fields=['valid_orientation', 'crush_degree'], name='image_orientation_crush_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(condition=models.Q(('timestamp__isnull', False)), fields=['timestamp'], name='image_timestamp_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(fields=['cube_sn', 'timestamp'], name='image_cube_timestamp_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(fields=['store_name', 'timestamp'], name='image_store_timestamp_idx'),
+        ),
+    ]
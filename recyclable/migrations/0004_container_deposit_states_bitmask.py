@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:10
+
+from django.db import migrations, models
+import recyclable.models
+
+# Boolean column per bit of Container.deposit_states, in bit order (recyclable.models.DEPOSIT_STATES).
+STATE_COLUMNS = ['ca', 'ct', 'gu', 'hi', 'ia', 'me', 'ma', 'mi', 'ny', 'Or', 'vt']
+
+TO_BITMASK_SQL = 'UPDATE recyclable_container SET deposit_states = ' + ' | '.join(
+    f'(CASE WHEN "{column}" THEN {1 << i} ELSE 0 END)' for i, column in enumerate(STATE_COLUMNS)
+)
+
+FROM_BITMASK_SQL = 'UPDATE recyclable_container SET ' + ', '.join(
+    f'"{column}" = (deposit_states & {1 << i}) <> 0' for i, column in enumerate(STATE_COLUMNS)
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recyclable', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='container',
+            name='deposit_states',
+            field=recyclable.models.DepositStatesField(default=0, help_text='States in which the container has a deposit.'),
+        ),
+        migrations.RunSQL(TO_BITMASK_SQL, FROM_BITMASK_SQL),
+        migrations.RemoveIndex(
+            model_name='container',
+            name='container_ca_material_idx',
+        ),
+    ] + [
+        migrations.RemoveField(
+            model_name='container',
+            name=column,
+        )
+        for column in STATE_COLUMNS
+    ] + [
+        migrations.AddIndex(
+            model_name='container',
+            index=models.Index(condition=models.Q(('deposit_states__hasbits', 1)), fields=['material_type'], name='container_ca_material_idx'),
+        ),
+    ]
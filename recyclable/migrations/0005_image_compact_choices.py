@@ -0,0 +1,121 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:11
+
+from django.db import migrations
+import recyclable.models
+
+# The values of each converted column, in code order, frozen as of this migration, and the default that blanks left
+# by CSV imports are converted to.  Any other value stops the migration (see check_values()).
+COLUMN_VALUES = {
+    'count': (['empty', 'solo', 'multiple'], 'solo'),
+    'hands_in_image': (['no_hands', 'hands', 'blurry_hands_in', 'blurry_hands_out'], 'no_hands'),
+    'image_quality': (['valid_image', 'invalid_image', 'unknown_image', 'partially_shown', 'blurry_moving_belt',
+                       'out_of_focus', 'bad_lighting', 'blurry_moving_container'], 'valid_image'),
+    'label': (['neck_only', 'body_only', 'neither', 'neck_and_body'], 'body_only'),
+    'lid_cap': (['unknown', 'true', 'false'], 'unknown'),
+    'orientation_style': (['unknown', 'standing_up', 'leaning', 'orthogonal', 'parallel'], 'unknown'),
+}
+
+
+def check_values(apps, schema_editor):
+    """Lists every value that has no code, so that they can be fixed before converting instead of being lost."""
+    unknown = []
+    with schema_editor.connection.cursor() as cursor:
+        for column, (values, _) in COLUMN_VALUES.items():
+            cursor.execute(f'SELECT "{column}", count(*) FROM recyclable_image WHERE "{column}" NOT IN %s '
+                           f'GROUP BY 1 ORDER BY 1', [tuple(values + [''])])
+            unknown += [f'{column}={value!r} ({n} images)' for value, n in cursor.fetchall()]
+    if unknown:
+        raise RuntimeError(f'recyclable_image has values without a code: {", ".join(unknown)}.  Update them to '
+                           f'known values and rerun the migration.')
+
+
+def to_codes_sql(column: str) -> str:
+    values, default = COLUMN_VALUES[column]
+    cases = ' '.join(f"WHEN '{value}' THEN {code}" for code, value in enumerate(values))
+    # ELSE NULL makes the NOT NULL column reject any value that check_values() did not see.
+    return (f'ALTER TABLE recyclable_image ALTER COLUMN "{column}" TYPE smallint '
+            f'USING (CASE "{column}" {cases} WHEN \'\' THEN {values.index(default)} ELSE NULL END)')
+
+
+def to_strings_sql(column: str) -> str:
+    values, _ = COLUMN_VALUES[column]
+    cases = ' '.join(f"WHEN {code} THEN '{value}'" for code, value in enumerate(values))
+    return (f'ALTER TABLE recyclable_image ALTER COLUMN "{column}" TYPE varchar(31) '
+            f'USING (CASE "{column}" {cases} END)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recyclable', '0004_container_deposit_states_bitmask'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_values, migrations.RunPython.noop),
+        migrations.RunSQL(
+            to_codes_sql('count'),
+            to_strings_sql('count'),
+            state_operations=[
+                migrations.AlterField(
+                    model_name='image',
+                    name='count',
+                    field=recyclable.models.CompactChoicesField(default='solo', enum=recyclable.models.Image.CountType),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            to_codes_sql('hands_in_image'),
+            to_strings_sql('hands_in_image'),
+            state_operations=[
+                migrations.AlterField(
+                    model_name='image',
+                    name='hands_in_image',
+                    field=recyclable.models.CompactChoicesField(default='no_hands', enum=recyclable.models.Image.HandsType),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            to_codes_sql('image_quality'),
+            to_strings_sql('image_quality'),
+            state_operations=[
+                migrations.AlterField(
+                    model_name='image',
+                    name='image_quality',
+                    field=recyclable.models.CompactChoicesField(default='valid_image', enum=recyclable.models.Image.ImageQuality),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            to_codes_sql('label'),
+            to_strings_sql('label'),
+            state_operations=[
+                migrations.AlterField(
+                    model_name='image',
+                    name='label',
+                    field=recyclable.models.CompactChoicesField(default='body_only', enum=recyclable.models.Image.LabelType),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            to_codes_sql('lid_cap'),
+            to_strings_sql('lid_cap'),
+            state_operations=[
+                migrations.AlterField(
+                    model_name='image',
+                    name='lid_cap',
+                    field=recyclable.models.CompactChoicesField(default='unknown', enum=recyclable.models.Image.LidCapType),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            to_codes_sql('orientation_style'),
+            to_strings_sql('orientation_style'),
+            state_operations=[
+                migrations.AlterField(
+                    model_name='image',
+                    name='orientation_style',
+                    field=recyclable.models.CompactChoicesField(default='unknown', enum=recyclable.models.Image.Orientation),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Counts the existing images, as recyclable.models.recompute_image_counts() does.
+BACKFILL_SQL = '''
+INSERT INTO recyclable_containerimagecounts (container_id, total, valid, crushed_1, crushed_2, crushed_3, crushed_4,
+                                             bad_orientation, no_label)
+SELECT c.id,
+       count(i.id),
+       count(i.id) FILTER (WHERE i.valid_orientation AND i.crush_degree = 0),
+       count(i.id) FILTER (WHERE i.valid_orientation AND i.crush_degree = 1),
+       count(i.id) FILTER (WHERE i.valid_orientation AND i.crush_degree = 2),
+       count(i.id) FILTER (WHERE i.valid_orientation AND i.crush_degree = 3),
+       count(i.id) FILTER (WHERE i.valid_orientation AND i.crush_degree = 4),
+       count(i.id) FILTER (WHERE NOT i.valid_orientation),
+       count(i.id) FILTER (WHERE i.valid_orientation AND i.crush_degree = -1)
+FROM recyclable_container c LEFT JOIN recyclable_image i ON i.container_id = c.id
+GROUP BY c.id
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recyclable', '0005_image_compact_choices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContainerImageCounts',
+            fields=[
+                ('container', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='image_counts', serialize=False, to='recyclable.container')),
+                ('total', models.IntegerField(default=0)),
+                ('valid', models.IntegerField(default=0)),
+                ('crushed_1', models.IntegerField(default=0)),
+                ('crushed_2', models.IntegerField(default=0)),
+                ('crushed_3', models.IntegerField(default=0)),
+                ('crushed_4', models.IntegerField(default=0)),
+                ('bad_orientation', models.IntegerField(default=0)),
+                ('no_label', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
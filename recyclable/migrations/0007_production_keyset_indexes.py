@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+# The new indexes are built before the old ones are dropped, so the production queries are never unindexed.  This
+# uses plain AddIndex rather than AddIndexConcurrently, which Postgres does not support on a partitioned table
+# (see recyclable.partitions).
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recyclable', '0006_container_image_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(condition=models.Q(('timestamp__isnull', False)), fields=['timestamp', 'id'], name='image_timestamp_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['cube_sn', 'timestamp', 'id'], name='image_cube_timestamp_id_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='image',
+            name='image_timestamp_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='image',
+            name='image_cube_timestamp_idx',
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recyclable', '0007_production_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='S3Object',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('bucket', models.CharField(max_length=63)),
+                ('key', models.CharField(max_length=1024)),
+                ('size', models.BigIntegerField(default=0)),
+                ('etag', models.CharField(blank=True, default='', max_length=255)),
+                ('last_modified', models.DateTimeField(blank=True, default=None, null=True)),
+                ('store', models.CharField(blank=True, default='', max_length=255)),
+                ('cube_sn', models.CharField(blank=True, default='', max_length=255)),
+                ('capture_date', models.DateField(blank=True, default=None, null=True)),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['capture_date', 'store'], name='s3object_date_store_idx'), models.Index(fields=['store', 'capture_date'], name='s3object_store_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='s3object',
+            constraint=models.UniqueConstraint(fields=('bucket', 'key'), name='s3object_bucket_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:28
+
+from django.db import migrations, models
+
+# Counts the existing images, as recyclable.models.compact_capture_rollups() does.
+BACKFILL_SQL = '''
+INSERT INTO recyclable_capturerollup (day, cube_sn, store_name, deposit_type, count)
+SELECT (i."timestamp" AT TIME ZONE 'UTC')::date, i.cube_sn, i.store_name,
+       CASE WHEN i.valid_orientation AND i.crush_degree IN (0, 1) AND c.material_type IN ('alu', 'glass', 'plastic')
+            THEN 'valid' ELSE 'invalid' END,
+       count(*)
+FROM recyclable_image i LEFT JOIN recyclable_container c ON c.id = i.container_id
+WHERE i."timestamp" IS NOT NULL
+GROUP BY 1, 2, 3, 4
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recyclable', '0008_s3object'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaptureRollup',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('cube_sn', models.CharField(max_length=255)),
+                ('store_name', models.CharField(max_length=255)),
+                ('deposit_type', models.CharField(max_length=15)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cube_sn', 'day'], name='capturerollup_cube_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='capturerollup',
+            constraint=models.UniqueConstraint(fields=('day', 'cube_sn', 'store_name', 'deposit_type'), name='capturerollup_key_uniq'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
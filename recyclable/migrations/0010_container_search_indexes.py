@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:43
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.text
+
+TRIGRAM_INDEXES = {
+    'container_barcode_trgm_idx': 'barcode',
+    'container_brand_trgm_idx': 'brand',
+    'container_product_trgm_idx': 'product_name',
+}
+
+
+def add_trigram_indexes(apps, schema_editor):
+    # Creating pg_trgm takes a superuser (rds_superuser on RDS), so the deploy creates it before migrating rather
+    # than the app's role here.  Without it, search_containers() only does prefix matches.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "recyclable_container" '
+                              f'USING gin ("{column}" gin_trgm_ops)')
+
+
+def remove_trigram_indexes(apps, schema_editor):
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recyclable', '0009_capture_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='container',
+            index=models.Index(fields=['barcode'], name='container_barcode_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='container',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('brand'), name='text_pattern_ops'), name='container_brand_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='container',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('product_name'), name='text_pattern_ops'), name='container_product_prefix_idx'),
+        ),
+        migrations.RunPython(add_trigram_indexes, remove_trigram_indexes),
+    ]
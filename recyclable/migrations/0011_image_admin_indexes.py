@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recyclable', '0010_container_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['cube_sn', 'id'], name='image_cube_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['crush_degree', 'id'], name='image_crush_id_idx'),
+        ),
+    ]
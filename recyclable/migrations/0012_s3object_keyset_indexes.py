@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:42
+
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+# The new indexes are built before the old one is dropped, without locking the table against the indexer's writes.
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('recyclable', '0011_image_admin_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='s3object',
+            index=models.Index(fields=['capture_date', 'id'], name='s3object_date_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='s3object',
+            index=models.Index(fields=['cube_sn', 'capture_date', 'id'], name='s3object_cube_date_id_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='s3object',
+            name='s3object_date_store_idx',
+        ),
+    ]
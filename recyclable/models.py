@@ -1,17 +1,25 @@
 import os
 import traceback
-from datetime import datetime
+from collections import Counter
+from datetime import date, datetime, timezone as dt_timezone
 from enum import Enum, auto
-from typing import Tuple, Any, Optional
+from typing import Tuple, Any, Optional, Callable, Iterable, List
 import logging
 
-from django.db import models
+from django import forms
+from django.contrib.postgres.indexes import OpClass
+from django.db import connection, models, transaction
+from django.db.models.functions import TruncDate, Upper
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
 
-from recyclable.utils import read_csv_with_headers, s3_data_from_object_url, url_from_s3_data, \
-    convert_spaces_to_pluses
+from recyclable.metrics import stage
+from recyclable.presign import S3Location, presigned_url, presigned_urls
+from recyclable.utils import read_csv_with_headers
 
 
 class ContainerSize(Enum):
@@ -23,6 +31,80 @@ class ContainerSize(Enum):
 
 
 
+# Bottle-bill states, in bit order of Container.deposit_states.  Never reorder; only append.
+DEPOSIT_STATES: Tuple[str, ...] = ('CA', 'CT', 'GU', 'HI', 'IA', 'ME', 'MA', 'MI', 'NY', 'OR', 'VT')
+
+
+def state_bit(state: str) -> int:
+    try:
+        return 1 << DEPOSIT_STATES.index(state.upper())
+    except ValueError:
+        raise ValueError(f'Unknown deposit state: {state}')
+
+
+def states_to_bitmask(states: Iterable[str]) -> int:
+    mask = 0
+    for state in states:
+        mask |= state_bit(state)
+    return mask
+
+
+def bitmask_to_states(mask: int) -> List[str]:
+    return [state for i, state in enumerate(DEPOSIT_STATES) if mask & (1 << i)]
+
+
+class DepositStatesFormField(forms.MultipleChoiceField):
+    widget = forms.CheckboxSelectMultiple
+
+    def __init__(self, **kwargs):
+        kwargs['choices'] = [(state, state) for state in DEPOSIT_STATES]
+        super().__init__(**kwargs)
+
+    def prepare_value(self, value):
+        return bitmask_to_states(value) if isinstance(value, int) else value
+
+    def clean(self, value) -> int:
+        return states_to_bitmask(super().clean(value))
+
+
+class DepositStatesField(models.PositiveSmallIntegerField):
+    """A bitmask of DEPOSIT_STATES.  Query it with the hasbits (all given bits set) and hasanybits lookups,
+    e.g. Container.objects.filter(deposit_states__hasbits=state_bit('CA'))."""
+
+    def formfield(self, **kwargs):
+        return DepositStatesFormField(required=False, label=self.verbose_name, help_text=self.help_text)
+
+
+@DepositStatesField.register_lookup
+class HasBits(models.Lookup):
+    lookup_name = 'hasbits'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'({lhs} & {rhs}) = {rhs}', lhs_params + rhs_params + rhs_params
+
+
+@DepositStatesField.register_lookup
+class HasAnyBits(models.Lookup):
+    lookup_name = 'hasanybits'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'({lhs} & {rhs}) <> 0', lhs_params + rhs_params
+
+
+class ContainerQuerySet(models.QuerySet):
+
+    def eligible_in(self, *states: str) -> 'ContainerQuerySet':
+        """Containers with a deposit in every one of states, as a single predicate on deposit_states."""
+        return self.filter(deposit_states__hasbits=states_to_bitmask(states))
+
+    def eligible_in_any(self, *states: str) -> 'ContainerQuerySet':
+        return self.filter(deposit_states__hasanybits=states_to_bitmask(states))
+
+
 class Container(models.Model):
 
     class MaterialType(models.TextChoices):
@@ -259,17 +341,7 @@ class Container(models.Model):
     liquid_volume = models.FloatField(default=-1.0, blank=False)
     liquid_volume_unit = models.CharField(max_length=31, choices=LiquidVolumeUnit.choices)
     mass_gram = models.FloatField(default=-1.0, blank=False)
-    ca = models.BooleanField(default=False)
-    ct = models.BooleanField(default=False)
-    gu = models.BooleanField(default=False)
-    hi = models.BooleanField(default=False)
-    ia = models.BooleanField(default=False)
-    me = models.BooleanField(default=False)
-    ma = models.BooleanField(default=False)
-    mi = models.BooleanField(default=False)
-    ny = models.BooleanField(default=False)
-    Or = models.BooleanField(default=False)
-    vt = models.BooleanField(default=False)
+    deposit_states = DepositStatesField(default=0, help_text='States in which the container has a deposit.')
     juice_percentage = models.FloatField(default=-1.0)
     material_color = models.CharField(max_length=31, choices=MaterialColor.choices, default=MaterialColor.UNKNOWN)
     ribbed = models.CharField(max_length=31, choices=RibbedType.choices, default=RibbedType.NA)
@@ -277,6 +349,19 @@ class Container(models.Model):
     visual_volume = models.CharField(max_length=31, choices=VisualVolume.choices, default=VisualVolume.NA)
     made_in = models.CharField(max_length=3, blank=False, null=False, help_text='Enter the 3-letter country code.', default='UNK')
 
+    objects = ContainerQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # create_size_classifier_json(): eligible in CA and material_type in (alu, glass, plastic)
+            models.Index(fields=['material_type'], condition=models.Q(deposit_states__hasbits=state_bit('CA')),
+                         name='container_ca_material_idx'),
+            # search_containers(): prefix matches.  Migration 0010 also adds trigram indexes on barcode, brand and
+            # product_name where the pg_trgm extension is installed.
+            models.Index(fields=['barcode'], opclasses=['varchar_pattern_ops'], name='container_barcode_prefix_idx'),
+            models.Index(OpClass(Upper('brand'), name='text_pattern_ops'), name='container_brand_prefix_idx'),
+            models.Index(OpClass(Upper('product_name'), name='text_pattern_ops'), name='container_product_prefix_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'Container - id: {self.id}, created_at: {self.created_at},' \
@@ -303,6 +388,18 @@ class Container(models.Model):
     def size(self) -> ContainerSize:
         return convert_to_size(self.liquid_volume, self.liquid_volume_unit)
 
+    def eligible_in(self, state: str) -> bool:
+        return bool(self.deposit_states & state_bit(state))
+
+    def set_eligible(self, state: str, eligible: bool) -> None:
+        if eligible:
+            self.deposit_states |= state_bit(state)
+        else:
+            self.deposit_states &= ~state_bit(state)
+
+    def states(self) -> List[str]:
+        return bitmask_to_states(self.deposit_states)
+
 
 def mk_container(
     barcode: str,
@@ -366,17 +463,9 @@ def mk_container(
         ribbed=ribbed,
         ringed=ringed,
         visual_volume=visual_volume,
-        ca=ca,
-        ct=ct,
-        gu=gu,
-        hi=hi,
-        ia=ia,
-        me=me,
-        ma=ma,
-        mi=mi,
-        ny=ny,
-        Or=Or,
-        vt=vt,
+        deposit_states=states_to_bitmask(
+            state for state, eligible in zip(DEPOSIT_STATES, [ca, ct, gu, hi, ia, me, ma, mi, ny, Or, vt]) if eligible
+        ),
     )
     return c
 
@@ -388,6 +477,53 @@ def mk_null_container() -> Container:
                      liquid_volume_unit=Container.LiquidVolumeUnit.NA)
 
 
+class CompactChoicesField(models.PositiveSmallIntegerField):
+    """Stores a TextChoices value as a smallint code (its position in the enum) instead of a string, while
+    Python code, forms, templates and CSV import keep seeing the string values.  Codes are positional, so
+    members of the enum must only ever be appended, never reordered or removed."""
+
+    def __init__(self, *args, enum: type[models.TextChoices], **kwargs):
+        self.enum = enum
+        self.codes = {value: code for code, value in enumerate(enum.values)}
+        kwargs['choices'] = enum.choices
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['enum'] = self.enum
+        del kwargs['choices']
+        return name, path, args, kwargs
+
+    @cached_property
+    def validators(self):
+        # The integer range validators of PositiveSmallIntegerField don't apply to the string values.
+        return [*self.default_validators, *self._validators]
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else self.enum.values[value]
+
+    def to_python(self, value):
+        if isinstance(value, int) and not isinstance(value, str):
+            return self.enum.values[value]
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        try:
+            return self.codes[str(value)]
+        except KeyError:
+            raise ValueError(f'{value!r} is not a valid {self.enum.__name__}')
+
+    def pre_save(self, model_instance, add):
+        # CSV imports leave missing values blank; store the default rather than fail.
+        value = super().pre_save(model_instance, add)
+        if value in ('', None) and self.has_default():
+            value = self.get_default()
+            setattr(model_instance, self.attname, value)
+        return value
+
+
 class Image(models.Model):
 
     class LidCapType(models.TextChoices):
@@ -434,7 +570,8 @@ class Image(models.Model):
     id = models.AutoField(primary_key=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    container = models.ForeignKey(Container, null=True, on_delete=models.CASCADE)
+    # Indexed by image_container_seq_idx, whose leading column serves every container lookup.
+    container = models.ForeignKey(Container, null=True, on_delete=models.CASCADE, db_index=False)
     deposit_id = models.CharField(max_length=255, default='', blank=True)
     image_id = models.CharField(max_length=255, default='', blank=True)
     image_sequence_number = models.IntegerField(default=0)
@@ -442,17 +579,17 @@ class Image(models.Model):
     s3_bucket_name = models.CharField(max_length=63)
     aws_region_name = models.CharField(max_length=63)
     s3_object_key = models.CharField(max_length=511, unique=True)
-    lid_cap = models.CharField(max_length=31, choices=LidCapType.choices, default=LidCapType.UNKNOWN)
+    lid_cap = CompactChoicesField(enum=LidCapType, default=LidCapType.UNKNOWN)
     crush_degree = models.IntegerField(blank=False)
-    label = models.CharField(max_length=31, choices=LabelType.choices, default=LabelType.BODY_ONLY)
-    orientation_style = models.CharField(max_length=31, choices=Orientation.choices, default=Orientation.UNKNOWN)
+    label = CompactChoicesField(enum=LabelType, default=LabelType.BODY_ONLY)
+    orientation_style = CompactChoicesField(enum=Orientation, default=Orientation.UNKNOWN)
     valid_orientation = models.BooleanField()
-    image_quality = models.CharField(max_length=31, choices=ImageQuality.choices, default=ImageQuality.VALID_IMAGE)
+    image_quality = CompactChoicesField(enum=ImageQuality, default=ImageQuality.VALID_IMAGE)
     container_in_frame = models.FloatField(null=True, blank=False)
     image_height = models.FloatField(default=-1.0)
     image_width = models.FloatField(default=-1.0)
-    hands_in_image = models.CharField(max_length=31, choices=HandsType.choices, default=HandsType.NO_HANDS)
-    count = models.CharField(max_length=31, choices=CountType.choices, default=CountType.SOLO)
+    hands_in_image = CompactChoicesField(enum=HandsType, default=HandsType.NO_HANDS)
+    count = CompactChoicesField(enum=CountType, default=CountType.SOLO)
     imager_version = models.CharField(max_length=255, default='unknown')
     timestamp = models.DateTimeField(null=True, blank=True, default=None)
     company_name = models.CharField(max_length=255, default='unknown')
@@ -460,13 +597,36 @@ class Image(models.Model):
     cube_sn = models.CharField(max_length=255, default='unknown')
     database_version = models.IntegerField(default=1)
 
-
-
-    def url(self) -> str:
-        return url_from_s3_data(self.s3_bucket_name, self.aws_region_name, convert_spaces_to_pluses(self.s3_object_key))
+    class Meta:
+        indexes = [
+            # Image.save(): the last sequence number of a container
+            models.Index(fields=['container', 'image_sequence_number'], name='image_container_seq_idx'),
+            # create_size_classifier_json(): the valid, uncrushed images of a container
+            models.Index(fields=['container'], condition=models.Q(valid_orientation=True, crush_degree__in=[0, 1]),
+                         name='image_valid_uncrushed_idx'),
+            # classifier scans by orientation and crush degree
+            models.Index(fields=['valid_orientation', 'crush_degree'], name='image_orientation_crush_idx'),
+            # production browsing by date range, optionally narrowed to a cube or store; the trailing id
+            # serves the (timestamp, id) keyset pagination of views.api_containers()
+            models.Index(fields=['timestamp', 'id'], condition=models.Q(timestamp__isnull=False),
+                         name='image_timestamp_id_idx'),
+            models.Index(fields=['cube_sn', 'timestamp', 'id'], name='image_cube_timestamp_id_idx'),
+            models.Index(fields=['store_name', 'timestamp'], name='image_store_timestamp_idx'),
+            # admin.ImageAdmin: the newest images of a cube or crush degree, scanned in id order
+            models.Index(fields=['cube_sn', 'id'], name='image_cube_id_idx'),
+            models.Index(fields=['crush_degree', 'id'], name='image_crush_id_idx'),
+        ]
+
+
+    def location(self) -> S3Location:
+        return self.s3_bucket_name, self.aws_region_name, self.s3_object_key
+
+    def url(self, expires_in: Optional[int] = None) -> str:
+        # The bucket is private, so this is a presigned URL; see image_urls() to sign many at once.
+        return presigned_url(*self.location(), expires_in=expires_in)
 
     def image(self) -> str:
-        img_src = self.url()
+        img_src = f"{reverse('recyclable:image_proxy', args=[self.id])}?w=512"
         return format_html('<img src="{}" style="width: 100%; max-width: 500px" />', img_src)
 
     def __str__(self) -> str:
@@ -475,25 +635,405 @@ class Image(models.Model):
 
     # Override the save method to handle sequence numbering
     def save(self, *args, **kwargs) -> None:
-        if not self.pk:
-            last_image = Image.objects.filter(container=self.container).order_by('-image_sequence_number').first()
-            if last_image:
-                self.image_sequence_number = last_image.image_sequence_number + 1
-            else:
-                self.image_sequence_number = 1
-        super().save(*args, **kwargs)
+        if self.pk:
+            super().save(*args, **kwargs)
+            return
+
+        last_image = Image.objects.filter(container=self.container).order_by('-image_sequence_number').first()
+        if last_image:
+            self.image_sequence_number = last_image.image_sequence_number + 1
+        else:
+            self.image_sequence_number = 1
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.timestamp is not None:
+                bump_capture_rollups({capture_rollup_key(self): 1})
+
+    def deposit_type(self) -> str:
+        material_type = self.container.material_type if self.container else None
+        valid = (self.valid_orientation and self.crush_degree in (0, 1) and material_type in VALID_DEPOSIT_MATERIALS)
+        return 'valid' if valid else 'invalid'
+
+
+def image_urls(images: Iterable[Image], expires_in: Optional[int] = None) -> List[str]:
+    return presigned_urls((img.location() for img in images), expires_in)
+
+
+# The capture categories of num_images.html, as recorded on an Image by views.save_image().
+IMAGE_CATEGORIES = ('valid', 'crushed_1', 'crushed_2', 'crushed_3', 'crushed_4', 'bad_orientation', 'no_label')
+IMAGE_CATEGORY_FILTERS = {
+    'valid': models.Q(valid_orientation=True, crush_degree=0),
+    'crushed_1': models.Q(valid_orientation=True, crush_degree=1),
+    'crushed_2': models.Q(valid_orientation=True, crush_degree=2),
+    'crushed_3': models.Q(valid_orientation=True, crush_degree=3),
+    'crushed_4': models.Q(valid_orientation=True, crush_degree=4),
+    'bad_orientation': models.Q(valid_orientation=False),
+    'no_label': models.Q(valid_orientation=True, crush_degree=-1),
+}
+
+
+def image_category(crush_degree: int, valid_orientation: bool) -> Optional[str]:
+    if not valid_orientation:
+        return 'bad_orientation'
+    if crush_degree == -1:
+        return 'no_label'
+    if crush_degree == 0:
+        return 'valid'
+    if 1 <= crush_degree <= 4:
+        return f'crushed_{crush_degree}'
+    return None
+
+
+class ContainerImageCounts(models.Model):
+    """Per-container image counters, kept alongside Container so that capture screens don't need a GROUP BY
+    over Image.  Captures and imports keep them current; repair_image_counts recomputes them all."""
+
+    container = models.OneToOneField(Container, primary_key=True, on_delete=models.CASCADE,
+                                     related_name='image_counts')
+    total = models.IntegerField(default=0)
+    valid = models.IntegerField(default=0)
+    crushed_1 = models.IntegerField(default=0)
+    crushed_2 = models.IntegerField(default=0)
+    crushed_3 = models.IntegerField(default=0)
+    crushed_4 = models.IntegerField(default=0)
+    bad_orientation = models.IntegerField(default=0)
+    no_label = models.IntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'ContainerImageCounts {self.container_id} ({self.total} images)'
+
+    def categories(self) -> List[Tuple[str, int]]:
+        return [(category, getattr(self, category)) for category in IMAGE_CATEGORIES]
+
+
+def increment_image_counts(container: Container, category: Optional[str]) -> None:
+    """Counts one new image of container.  The update is a single UPDATE ... SET n = n + 1, so concurrent
+    captures of the same container don't lose counts."""
+    ContainerImageCounts.objects.get_or_create(container=container)
+    increments = {'total': models.F('total') + 1}
+    if category in IMAGE_CATEGORIES:
+        increments[category] = models.F(category) + 1
+    ContainerImageCounts.objects.filter(container=container).update(**increments)
+
+
+def recompute_image_counts(container_ids: Optional[Iterable[int]] = None) -> int:
+    """Recomputes the counts of the given containers (all, if None) in one aggregate pass over Image.
+    Returns the number of containers written."""
+    images = Image.objects.filter(container__isnull=False)
+    containers = Container.objects.all()
+    if container_ids is not None:
+        container_ids = list(container_ids)
+        images = images.filter(container_id__in=container_ids)
+        containers = containers.filter(id__in=container_ids)
+
+    aggregates = {category: models.Count('id', filter=q) for category, q in IMAGE_CATEGORY_FILTERS.items()}
+    rows = {row['container']: row for row in images.values('container').annotate(total=models.Count('id'),
+                                                                                **aggregates)}
+    counts = []
+    for container_id in containers.values_list('id', flat=True).iterator():
+        row = rows.get(container_id, {})
+        counts.append(ContainerImageCounts(container_id=container_id, total=row.get('total', 0),
+                                           **{category: row.get(category, 0) for category in IMAGE_CATEGORIES}))
+
+    ContainerImageCounts.objects.bulk_create(counts, batch_size=1000, update_conflicts=True,
+                                             unique_fields=['container'],
+                                             update_fields=['total', *IMAGE_CATEGORIES])
+    return len(counts)
+
+
+# An image is a valid deposit when classify_deposit_image() would put it in one of the ALU, GLASS or PET classes.
+VALID_DEPOSIT_MATERIALS = (Container.MaterialType.ALUMINUM, Container.MaterialType.GLASS,
+                           Container.MaterialType.PLASTIC)
+VALID_DEPOSIT_Q = models.Q(valid_orientation=True, crush_degree__in=[0, 1],
+                           container__material_type__in=VALID_DEPOSIT_MATERIALS)
+DEPOSIT_TYPES = ('valid', 'invalid')
+
+
+class CaptureRollup(models.Model):
+    """The number of production images per day, cube, store and deposit type.  New images are counted as they
+    are saved; compact_capture_rollups() recounts from Image to correct drift from edits, deletes and bulk
+    inserts."""
+
+    id = models.BigAutoField(primary_key=True)
+    day = models.DateField()
+    cube_sn = models.CharField(max_length=255)
+    store_name = models.CharField(max_length=255)
+    deposit_type = models.CharField(max_length=15)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'cube_sn', 'store_name', 'deposit_type'],
+                                    name='capturerollup_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['cube_sn', 'day'], name='capturerollup_cube_day_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'CaptureRollup {self.day} {self.cube_sn} {self.store_name} {self.deposit_type}: {self.count}'
+
+
+CaptureRollupKey = Tuple[Any, str, str, str]  # (day, cube_sn, store_name, deposit_type)
+
+BUMP_CAPTURE_ROLLUPS_SQL = '''
+INSERT INTO recyclable_capturerollup (day, cube_sn, store_name, deposit_type, count) VALUES {values}
+ON CONFLICT (day, cube_sn, store_name, deposit_type)
+DO UPDATE SET count = recyclable_capturerollup.count + EXCLUDED.count
+'''
+
+
+def capture_rollup_key(img: Image) -> CaptureRollupKey:
+    return img.timestamp.astimezone(dt_timezone.utc).date(), img.cube_sn, img.store_name, img.deposit_type()
+
+
+def bump_capture_rollups(increments: dict) -> None:
+    """Adds each {key: n} to its rollup in one upsert, so concurrent writers never lose a count."""
+    if not increments:
+        return
+    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(increments))
+    params = [param for key, n in sorted(increments.items()) for param in (*key, n)]
+    with connection.cursor() as cursor:
+        cursor.execute(BUMP_CAPTURE_ROLLUPS_SQL.format(values=values), params)
+
+
+def compact_capture_rollups(since: Optional[date] = None) -> int:
+    """Recounts the rollups of every day from since (all days if None) with one GROUP BY over Image.  Returns the
+    number of rollup rows written."""
+    images = Image.objects.filter(timestamp__isnull=False)
+    rollups = CaptureRollup.objects.all()
+    if since is not None:
+        images = images.filter(timestamp__gte=datetime.combine(since, datetime.min.time(), tzinfo=dt_timezone.utc))
+        rollups = rollups.filter(day__gte=since)
+
+    rows = images.annotate(day=TruncDate('timestamp', tzinfo=dt_timezone.utc)) \
+        .values('day', 'cube_sn', 'store_name') \
+        .annotate(total=models.Count('id'), valid=models.Count('id', filter=VALID_DEPOSIT_Q))
+    new_rollups = []
+    for row in rows.iterator():
+        for deposit_type, count in [('valid', row['valid']), ('invalid', row['total'] - row['valid'])]:
+            if count:
+                new_rollups.append(CaptureRollup(day=row['day'], cube_sn=row['cube_sn'],
+                                                 store_name=row['store_name'], deposit_type=deposit_type,
+                                                 count=count))
+
+    with transaction.atomic():
+        rollups.delete()
+        CaptureRollup.objects.bulk_create(new_rollups, batch_size=1000)
+    return len(new_rollups)
+
+
+BUMP_IMAGE_COUNTS_SQL = '''
+UPDATE recyclable_containerimagecounts AS c SET {assignments}
+FROM (VALUES {values}) AS d (container_id, total, {categories})
+WHERE c.container_id = d.container_id
+'''
+
+
+def bump_image_counts(deltas: dict[int, Counter]) -> None:
+    """Adds each {container_id: {'total' or category: n}} to the container's counts in one UPDATE.  Containers
+    without counts are left for repair_image_counts."""
+    deltas = {container_id: delta for container_id, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return
+    columns = ('total', *IMAGE_CATEGORIES)
+    sql = BUMP_IMAGE_COUNTS_SQL.format(assignments=', '.join(f'{c} = c.{c} + d.{c}' for c in columns),
+                                       values=', '.join([f'({", ".join(["%s"] * (len(columns) + 1))})'] * len(deltas)),
+                                       categories=', '.join(IMAGE_CATEGORIES))
+    params = [param for container_id, delta in sorted(deltas.items())
+              for param in (container_id, *(delta[c] for c in columns))]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _bulk_edit_images(images: models.QuerySet) -> List[Image]:
+    # Just the fields that capture_rollup_key() and image_category() need.
+    return list(images.select_related('container').only('container_id', 'timestamp', 'cube_sn', 'store_name',
+                                                         'crush_degree', 'valid_orientation',
+                                                         'container__material_type'))
+
+
+def set_valid_orientation(images: models.QuerySet, valid_orientation: bool) -> int:
+    """Sets valid_orientation with one UPDATE and moves the changed images' counts and rollups to match.  Returns
+    the number of images changed."""
+    changed = _bulk_edit_images(images.exclude(valid_orientation=valid_orientation))
+    rollup_increments = Counter()
+    count_deltas: dict[int, Counter] = {}
+    for img in changed:
+        old_key = capture_rollup_key(img) if img.timestamp is not None else None
+        old_category = image_category(img.crush_degree, img.valid_orientation)
+        img.valid_orientation = valid_orientation
+        if old_key is not None:
+            rollup_increments[old_key] -= 1
+            rollup_increments[capture_rollup_key(img)] += 1
+        if img.container_id is not None:
+            delta = count_deltas.setdefault(img.container_id, Counter())
+            delta[old_category] -= 1
+            delta[image_category(img.crush_degree, img.valid_orientation)] += 1
+
+    Image.objects.filter(pk__in=[img.pk for img in changed]).update(valid_orientation=valid_orientation)
+    bump_capture_rollups({key: n for key, n in rollup_increments.items() if n})
+    bump_image_counts(count_deltas)
+    return len(changed)
+
+
+def delete_images(images: models.QuerySet) -> int:
+    """Deletes images with one DELETE and takes them out of their containers' counts and their rollups.  Returns
+    the number of images deleted."""
+    doomed = _bulk_edit_images(images)
+    rollup_increments = Counter(capture_rollup_key(img) for img in doomed if img.timestamp is not None)
+    count_deltas: dict[int, Counter] = {}
+    for img in doomed:
+        if img.container_id is not None:
+            delta = count_deltas.setdefault(img.container_id, Counter())
+            delta['total'] -= 1
+            delta[image_category(img.crush_degree, img.valid_orientation)] -= 1
+
+    Image.objects.filter(pk__in=[img.pk for img in doomed]).delete()
+    bump_capture_rollups({key: -n for key, n in rollup_increments.items()})
+    bump_image_counts(count_deltas)
+    return len(doomed)
+
+
+class Job(models.Model):
+    """A unit of background work (classifier export, CSV import, backfill) claimed and run by a job worker."""
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', _('Queued')
+        RUNNING = 'running', _('Running')
+        SUCCEEDED = 'succeeded', _('Succeeded')
+        FAILED = 'failed', _('Failed')
+
+    id = models.AutoField(primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    kind = models.CharField(max_length=63)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=31, choices=Status.choices, default=Status.QUEUED)
+    progress = models.FloatField(default=0.0)
+    checkpoint = models.JSONField(default=dict, blank=True)
+    message = models.TextField(default='', blank=True)
+    worker = models.CharField(max_length=255, default='', blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, default=None)
+    attempts = models.IntegerField(default=0)
+    artifact_s3_object_key = models.CharField(max_length=511, default='', blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self) -> str:
+        return f'Job {self.id} ({self.kind}, {self.status}, {self.progress:.0%})'
+
+    def save_checkpoint(self, progress: float, checkpoint: Optional[dict] = None) -> None:
+        """Records progress (0.0 to 1.0) and the state needed to resume the job if its worker dies.  Raises
+        JobReclaimed if another worker has claimed the job since this one did."""
+        self.progress = progress
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+        self.heartbeat_at = timezone.now()
+        self.updated_at = self.heartbeat_at
+        if not Job.objects.filter(id=self.id, worker=self.worker).update(
+                progress=self.progress, checkpoint=self.checkpoint, heartbeat_at=self.heartbeat_at,
+                updated_at=self.updated_at):
+            raise JobReclaimed(f'{self} was claimed by another worker.')
+
+
+class JobReclaimed(Exception):
+    """The job's heartbeat went stale and another worker claimed it, so this worker must stop."""
 
 
-def load_models_from_csv(dir_name: str) -> None:
+class DatasetSnapshot(models.Model):
+    """An immutable record of which images were in a classifier export, and in which class.
+    See recyclable.snapshots for the packed format of data."""
+
+    id = models.AutoField(primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    name = models.CharField(max_length=255, unique=True)
+    classifier = models.CharField(max_length=63)
+    classes = models.JSONField(default=list)
+    num_items = models.IntegerField(default=0)
+    data = models.BinaryField()
+
+    def __str__(self) -> str:
+        return f'DatasetSnapshot {self.name} ({self.classifier}, {self.num_items} images)'
+
+
+class S3Object(models.Model):
+    """A production capture in S3, indexed by recyclable.s3_index so that listings don't need to call S3."""
+
+    id = models.BigAutoField(primary_key=True)
+    bucket = models.CharField(max_length=63)
+    key = models.CharField(max_length=1024)
+    size = models.BigIntegerField(default=0)
+    etag = models.CharField(max_length=255, default='', blank=True)
+    last_modified = models.DateTimeField(null=True, blank=True, default=None)
+    # parsed from collector/captures/{store}/attempts/{capture_date}/..., e.g. store 'Safeway1483' and cube '1483'
+    store = models.CharField(max_length=255, default='', blank=True)
+    cube_sn = models.CharField(max_length=255, default='', blank=True)
+    capture_date = models.DateField(null=True, blank=True, default=None)
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'key'], name='s3object_bucket_key_uniq'),
+        ]
+        indexes = [
+            # production_captures_page(): newest first, keyed on (capture_date, id), optionally by cube
+            models.Index(fields=['capture_date', 'id'], name='s3object_date_id_idx'),
+            models.Index(fields=['cube_sn', 'capture_date', 'id'], name='s3object_cube_date_id_idx'),
+            # index_captures(): the latest indexed date of each store
+            models.Index(fields=['store', 'capture_date'], name='s3object_store_date_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f's3://{self.bucket}/{self.key}'
+
+
+CSV_PROGRESS_INTERVAL = 100
+
+
+def load_models_from_csv(dir_name: str, checkpoint: Optional[dict] = None,
+                         on_progress: Optional[Callable[[float, dict], None]] = None) -> None:
+    # checkpoint holds the number of container and image rows already processed, so an interrupted
+    # import (see recyclable.jobs) can resume.  on_progress(fraction, checkpoint) is called periodically.
+    checkpoint = dict(checkpoint or {})
+    checkpoint.setdefault('containers', 0)
+    checkpoint.setdefault('images', 0)
+
     logging.info('reading and saving containers')
     fp = os.path.join(dir_name, 'container.csv')
 
-    containers_all = read_csv_with_headers(fp)
+    with stage('load_csv.read'):
+        containers_all = read_csv_with_headers(fp)
 
     num_containers = len(containers_all)
     logging.info(f'load_models_from_csv() - num_containers: {num_containers}')
 
-    for row in containers_all:
+    with stage('load_csv.read'):
+        images_all = read_csv_with_headers(os.path.join(dir_name, 'image.csv'))
+    num_rows = num_containers + len(images_all)
+
+    # Image counts of the containers that got new images are recomputed in bulk before each progress report,
+    # so they are current at every checkpoint a resumed import restarts from.
+    counted_container_ids = set()
+
+    def report_progress() -> None:
+        if counted_container_ids:
+            with stage('load_csv.recompute_counts'):
+                recompute_image_counts(counted_container_ids)
+            counted_container_ids.clear()
+        if on_progress:
+            on_progress((checkpoint['containers'] + checkpoint['images']) / max(num_rows, 1), dict(checkpoint))
+
+    for i_row, row in enumerate(containers_all):
+        if i_row < checkpoint['containers']:
+            continue
+        if i_row % CSV_PROGRESS_INTERVAL == 0:
+            checkpoint['containers'] = i_row
+            report_progress()
+
         barcode = row.get('barcode', '').strip()
         if not barcode:
             logging.warning('Skipping container with missing barcode.')
@@ -520,17 +1060,8 @@ def load_models_from_csv(dir_name: str) -> None:
             'liquid_volume': float_or_default(row.get('liquid_volume', ''), -1.0),
             'liquid_volume_unit': row.get('liquid_volume_unit', '').strip(),
             'mass_gram': float_or_default(row.get('mass_gram', ''), -1.0),
-            'ca': str_to_bool(row.get('CA', 'False')),
-            'ct': str_to_bool(row.get('CT', 'False')),
-            'gu': str_to_bool(row.get('GU', 'False')),
-            'hi': str_to_bool(row.get('HI', 'False')),
-            'ia': str_to_bool(row.get('IA', 'False')),
-            'me': str_to_bool(row.get('ME', 'False')),
-            'ma': str_to_bool(row.get('MA', 'False')),
-            'mi': str_to_bool(row.get('MI', 'False')),
-            'ny': str_to_bool(row.get('NY', 'False')),
-            'Or': str_to_bool(row.get('OR', 'False')),
-            'vt': str_to_bool(row.get('VT', 'False')),
+            'deposit_states': states_to_bitmask(state for state in DEPOSIT_STATES
+                                                if str_to_bool(row.get(state, 'False'))),
             'juice_percentage': float_or_default(row.get('juice_percentage', ''), -1.0),
             'material_color': row.get('material_color', '').strip(),
             'ribbed': row.get('ribbed', '').strip(),
@@ -540,30 +1071,34 @@ def load_models_from_csv(dir_name: str) -> None:
         }
 
         # Create or update the Container instance
-        c, created = Container.objects.update_or_create(
-            barcode=barcode,
-            defaults=container_fields
-        )
+        with stage('load_csv.save_container'):
+            c, created = Container.objects.update_or_create(
+                barcode=barcode,
+                defaults=container_fields
+            )
         if created:
             logging.info(f'Created new container with barcode: {barcode}')
         else:
             logging.info(f'Updated existing container with barcode: {barcode}')
 
+    checkpoint['containers'] = num_containers
+
     logging.info('reading and saving images')
-    fp = os.path.join(dir_name, 'image.csv')
-    images_all = read_csv_with_headers(fp)
 
     num_images = len(images_all)
     logging.info(f'load_models_from_csv() - num_images: {num_images}')
 
-    for row in images_all:
+    for i_row, row in enumerate(images_all):
+        if i_row < checkpoint['images']:
+            continue
+        if i_row % CSV_PROGRESS_INTERVAL == 0:
+            checkpoint['images'] = i_row
+            report_progress()
+
         barcode = row.get('barcode', '').strip()
         aws_entity_tag = row.get('aws_entity_tag', '').strip()
         s3_bucket_name = row.get('s3_bucket_name', '').strip()
         aws_region_name = row.get('aws_region_name', '').strip()
-        image_name = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
-        file_name = f'{c.barcode}_{image_name}.png'
-        s3_object_key = f'images/{c.barcode}/{file_name}'
 
         if not barcode:
             logging.warning('Skipping image with missing barcode.')
@@ -571,12 +1106,6 @@ def load_models_from_csv(dir_name: str) -> None:
         elif not aws_entity_tag:
             logging.warning('Skipping image with missing aws_entity_tag.')
             continue
-        elif not s3_object_key:
-            logging.warning('Skipping image with missing s3_object_key.')
-            continue
-
-        if 'aws_object_url' in row and not s3_bucket_name and not aws_region_name and not s3_object_key:
-            s3_bucket_name, aws_region_name, s3_object_key = s3_data_from_object_url(row['aws_object_url'])
 
         logging.info(f'Processing image for barcode: {barcode}, aws_entity_tag: {aws_entity_tag}')
 
@@ -586,6 +1115,10 @@ def load_models_from_csv(dir_name: str) -> None:
             logging.error(f'No container found with barcode {barcode}. Skipping this image.')
             continue
 
+        image_name = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        file_name = f'{barcode}_{image_name}.png'
+        s3_object_key = f'images/{barcode}/{file_name}'
+
         # Prepare a dictionary for image fields
         image_fields = {
             'container': c,
@@ -617,12 +1150,17 @@ def load_models_from_csv(dir_name: str) -> None:
 
         try:
             # Create the Image instance
-            Image.objects.create(**image_fields)
+            with stage('load_csv.save_image'):
+                Image.objects.create(**image_fields)
+            counted_container_ids.add(c.id)
             logging.info(f'Created image with aws_entity_tag: {aws_entity_tag}')
         except Exception as e:
             logging.error(f'Error creating image for barcode {barcode}: {e}')
             logging.error(traceback.format_exc())
 
+    checkpoint['images'] = num_images
+    report_progress()
+
 
 def str_to_bool(value: str) -> bool:
     return value.strip().lower() in ['true', 't', 'yes', '1']
@@ -0,0 +1,196 @@
+import logging
+from datetime import date
+from typing import List, Tuple
+
+from django.db import connection, transaction
+
+from recyclable.models import Container, Image
+
+# Optional monthly range partitioning of recyclable_image on "timestamp".
+#
+# Postgres requires every unique constraint of a partitioned table to include the partition key, so the table itself
+# can only enforce (id, timestamp), (aws_entity_tag, timestamp) and (s3_object_key, timestamp).  Global uniqueness
+# of the three columns is enforced by recyclable_image_keys instead, which a row trigger on the partitioned table
+# keeps in step with every insert, update and delete; a duplicate raises IntegrityError as before.  Ids still come
+# from a single identity sequence.  Rows with a NULL timestamp (e.g. tablet captures) and rows of months without a
+# partition land in the default partition; create_partition() moves a month's rows out of it.  CREATE INDEX
+# CONCURRENTLY is not supported on partitioned tables, so migrations that index Image must use plain AddIndex.
+
+TABLE = Image._meta.db_table
+UNPARTITIONED_TABLE = f'{TABLE}_unpartitioned'
+DEFAULT_PARTITION = f'{TABLE}_default'
+KEYS_TABLE = f'{TABLE}_keys'
+KEY_COLUMNS = ('id', 'aws_entity_tag', 's3_object_key')
+
+CREATE_KEYS_SQL = f'''
+    CREATE TABLE "{KEYS_TABLE}" (
+        "id" integer PRIMARY KEY,
+        "aws_entity_tag" varchar(511) NOT NULL UNIQUE,
+        "s3_object_key" varchar(511) NOT NULL UNIQUE
+    );
+
+    CREATE FUNCTION "{KEYS_TABLE}_sync"() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM "{KEYS_TABLE}" WHERE "id" = OLD."id";
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            INSERT INTO "{KEYS_TABLE}" VALUES (NEW."id", NEW."aws_entity_tag", NEW."s3_object_key");
+        END IF;
+        RETURN NULL;
+    END
+    $$;
+
+    -- A row that an UPDATE moves to another partition fires DELETE and INSERT instead.
+    CREATE TRIGGER "{KEYS_TABLE}_sync" AFTER INSERT OR DELETE OR UPDATE OF "id", "aws_entity_tag", "s3_object_key"
+        ON "{TABLE}" FOR EACH ROW EXECUTE FUNCTION "{KEYS_TABLE}_sync"();
+'''
+
+
+def insert_keys_sql(table: str) -> str:
+    columns = ', '.join(f'"{c}"' for c in KEY_COLUMNS)
+    return f'INSERT INTO "{KEYS_TABLE}" ({columns}) SELECT {columns} FROM "{table}"'
+
+
+def partition_name(month: date) -> str:
+    return f'{TABLE}_p{month.year:04d}_{month.month:02d}'
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    i_month = month.year * 12 + month.month - 1 + n
+    return date(i_month // 12, i_month % 12 + 1, 1)
+
+
+def is_partitioned() -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def list_partitions() -> List[Tuple[str, date]]:
+    """Returns the (name, month) of every monthly partition, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+        ''', [TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+
+    prefix = f'{TABLE}_p'
+    partitions = []
+    for name in names:
+        if name.startswith(prefix):
+            year, month = name[len(prefix):].split('_')
+            partitions.append((name, date(int(year), int(month), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition(cursor, month: date) -> bool:
+    """Creates the partition of month, moving the month's rows out of the default partition if it has any."""
+    name = partition_name(month)
+    cursor.execute('SELECT to_regclass(%s)', [name])
+    if cursor.fetchone()[0] is not None:
+        return False
+
+    # A month's partition cannot be attached while the default partition holds rows of that month, so they are
+    # moved into the new table first.  Deleting them from the default partition also deletes their keys.
+    bounds = [month.isoformat(), next_month(month).isoformat()]
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(f'''
+        WITH moved AS (
+            DELETE FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *
+        )
+        INSERT INTO "{name}" SELECT * FROM moved
+    ''', bounds)
+    num_moved = cursor.rowcount
+    cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)', bounds)
+    if num_moved:
+        cursor.execute(insert_keys_sql(name))
+        logging.info(f'create_partition() - moved {num_moved} rows from {DEFAULT_PARTITION} to {name}')
+    logging.info(f'create_partition() - created {name}')
+    return True
+
+
+def create_future_partitions(months_ahead: int = 3, today: date = None) -> List[str]:
+    this_month = (today or date.today()).replace(day=1)
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for n in range(months_ahead + 1):
+            month = add_months(this_month, n)
+            if create_partition(cursor, month):
+                created.append(partition_name(month))
+    return created
+
+
+def detach_old_partitions(keep_months: int, drop: bool = False, today: date = None) -> List[str]:
+    """Detaches (and optionally drops) the monthly partitions that end more than keep_months ago.  Detached
+    tables keep their rows and can be archived, but their ids, ETags and object keys are released; insert them
+    into recyclable_image_keys again before re-attaching one."""
+    oldest_kept = add_months((today or date.today()).replace(day=1), -keep_months)
+    detached = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name, month in list_partitions():
+            if month >= oldest_kept:
+                break
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DELETE FROM "{KEYS_TABLE}" WHERE "id" IN (SELECT "id" FROM "{name}")')
+            if drop:
+                cursor.execute(f'DROP TABLE "{name}"')
+            detached.append(name)
+    return detached
+
+
+def enable_partitioning(months_ahead: int = 3, today: date = None) -> None:
+    """Converts recyclable_image into a table partitioned by month of timestamp, copying the existing rows.
+    This rewrites the table and holds an exclusive lock while it runs."""
+    if is_partitioned():
+        raise ValueError(f'{TABLE} is already partitioned')
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Pending deferred foreign key checks on the old table would block dropping it.
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{UNPARTITIONED_TABLE}"')
+        cursor.execute(f'''
+            CREATE TABLE "{TABLE}" (LIKE "{UNPARTITIONED_TABLE}" INCLUDING DEFAULTS INCLUDING IDENTITY
+                INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE ("timestamp")
+        ''')
+        cursor.execute(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT')
+
+        # Every month with data, through months_ahead months from now, gets its own partition.
+        cursor.execute(f'SELECT min("timestamp"), max("timestamp") FROM "{UNPARTITIONED_TABLE}"')
+        first, last = cursor.fetchone()
+        this_month = (today or date.today()).replace(day=1)
+        month = min(first.date().replace(day=1), this_month) if first else this_month
+        end = max(add_months(this_month, months_ahead), last.date().replace(day=1) if last else this_month)
+        while month <= end:
+            create_partition(cursor, month)
+            month = next_month(month)
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{UNPARTITIONED_TABLE}"')
+        cursor.execute(f'''
+            SELECT setval(pg_get_serial_sequence(%s, 'id'),
+                          COALESCE((SELECT max(id) FROM "{UNPARTITIONED_TABLE}"), 0) + 1, false)
+        ''', [TABLE])
+        cursor.execute(f'DROP TABLE "{UNPARTITIONED_TABLE}"')
+
+        # These serve lookups by id, ETag and object key; recyclable_image_keys enforces uniqueness.
+        for column in KEY_COLUMNS:
+            cursor.execute(f'''
+                ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_{column}_timestamp_uniq" UNIQUE ("{column}", "timestamp")
+            ''')
+        cursor.execute(CREATE_KEYS_SQL)
+        cursor.execute(insert_keys_sql(TABLE))
+        cursor.execute(f'''
+            ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_container_id_fk"
+            FOREIGN KEY ("container_id") REFERENCES "{Container._meta.db_table}" ("id") DEFERRABLE INITIALLY DEFERRED
+        ''')
+
+        # Indexes created on the parent cascade to every partition, including ones created later.
+        with connection.schema_editor() as schema_editor:
+            for index in Image._meta.indexes:
+                schema_editor.add_index(Image, index)
@@ -0,0 +1,87 @@
+import hashlib
+import logging
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import NoCredentialsError
+from django.conf import settings
+from django.core.cache import caches
+
+from recyclable.utils import convert_spaces_to_pluses, url_from_s3_data
+
+# The bucket is private, so clients get presigned URLs.  Signing is local (no request to S3), but costs a few
+# hundred microseconds per URL, so signed URLs are cached until PRESIGNED_URL_REFRESH_MARGIN seconds before they
+# expire.  Note that a URL signed with temporary credentials (e.g. an instance role) stops working when those
+# credentials expire, whatever its own expiry.
+PRESIGNED_URL_REFRESH_MARGIN = 300
+
+S3Location = Tuple[str, str, str]  # (bucket, region, key)
+
+_clients: dict[str, object] = {}
+_clients_lock = threading.Lock()
+_warned_no_credentials = False
+
+
+def get_s3_client(region: str):
+    """Returns the shared signing client of a region.  boto3 clients are thread-safe."""
+    with _clients_lock:
+        client = _clients.get(region)
+        if client is None:
+            # The regional virtual-hosted endpoint gives the same https://{bucket}.s3.{region}.amazonaws.com/{key}
+            # URLs as url_from_s3_data().
+            client = _clients[region] = boto3.client(
+                's3', region_name=region, endpoint_url=f'https://s3.{region}.amazonaws.com',
+                config=Config(signature_version='s3v4', s3={'addressing_style': 'virtual'}))
+        return client
+
+
+def reset_s3_clients() -> None:
+    with _clients_lock:
+        _clients.clear()
+
+
+def cache_key(location: S3Location, expires_in: int) -> str:
+    digest = hashlib.sha256('/'.join([*location, str(expires_in)]).encode('utf-8')).hexdigest()
+    return f'presigned_url:{digest}'
+
+
+def sign(location: S3Location, expires_in: int) -> str:
+    global _warned_no_credentials
+    bucket, region, key = location
+    try:
+        return get_s3_client(region).generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key},
+                                                             ExpiresIn=expires_in)
+    except NoCredentialsError:
+        # e.g. local development without AWS credentials
+        if not _warned_no_credentials:
+            logging.warning('sign() - no AWS credentials, returning unsigned URLs')
+            _warned_no_credentials = True
+        return url_from_s3_data(bucket, region, convert_spaces_to_pluses(key))
+
+
+def presigned_urls(locations: Iterable[S3Location], expires_in: Optional[int] = None) -> List[str]:
+    """Returns a presigned GET URL for each (bucket, region, key), in order.  Cached URLs are fetched with a
+    single get_many() and the others are signed and stored with a single set_many()."""
+    expires_in = expires_in or settings.PRESIGNED_URL_EXPIRES
+    locations = list(locations)
+    keys = [cache_key(location, expires_in) for location in locations]
+
+    cache = caches['presigned_urls']
+    cached = cache.get_many(keys)
+    signed = {}
+    urls = []
+    for key, location in zip(keys, locations):
+        url = cached.get(key) or signed.get(key)
+        if url is None:
+            url = signed[key] = sign(location, expires_in)
+        urls.append(url)
+
+    if signed:
+        cache.set_many(signed, timeout=max(expires_in - PRESIGNED_URL_REFRESH_MARGIN, 1))
+    return urls
+
+
+def presigned_url(bucket: str, region: str, key: str, expires_in: Optional[int] = None) -> str:
+    return presigned_urls([(bucket, region, key)], expires_in)[0]
@@ -0,0 +1,120 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+import boto3
+from django.db.models import Max
+
+from recyclable.models import S3Object
+
+# Production captures are written to s3://{CAPTURES_BUCKET_NAME}/collector/captures/{store}/attempts/{date}/...
+CAPTURES_BUCKET_NAME = os.environ.get('CAPTURES_BUCKET_NAME', 'static-olyns.olyns.com')
+CAPTURES_PREFIX = 'collector/captures/'
+# The captures bucket is served from its own domain, e.g. https://static-olyns.olyns.com/collector/captures/...
+CAPTURES_URL_PREFIX = os.environ.get('CAPTURES_URL_PREFIX', f'https://{CAPTURES_BUCKET_NAME}/')
+
+CAPTURE_KEY_RE = re.compile(r'^(?P<store>[^/]+)/attempts/(?P<date>[^/]+)/')
+CUBE_SN_RE = re.compile(r'(\d+)$')
+
+UPSERT_BATCH_SIZE = 1000
+
+
+@dataclass
+class IndexResult:
+    num_prefixes: int = 0
+    num_objects: int = 0
+    num_failed_prefixes: int = 0
+
+
+def parse_capture_date(value: str) -> Optional[date]:
+    for fmt in ('%Y.%m.%d', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_capture_key(key: str, prefix: str = CAPTURES_PREFIX) -> Tuple[str, str, Optional[date]]:
+    """Returns the (store, cube_sn, capture_date) of a capture key; parts that can't be parsed are empty."""
+    match = CAPTURE_KEY_RE.match(key[len(prefix):] if key.startswith(prefix) else key)
+    if match is None:
+        return '', '', None
+    store = match.group('store')
+    cube_match = CUBE_SN_RE.search(store)
+    return store, cube_match.group(1) if cube_match else '', parse_capture_date(match.group('date'))
+
+
+def capture_url(key: str) -> str:
+    return CAPTURES_URL_PREFIX + quote(key)
+
+
+def list_common_prefixes(s3_client, bucket: str, prefix: str) -> List[str]:
+    prefixes = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        prefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+    return prefixes
+
+
+def list_s3_objects(s3_client, bucket: str, prefix: str) -> List[S3Object]:
+    objects = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            objects.append(S3Object(bucket=bucket, key=obj['Key'], size=obj['Size'], etag=obj['ETag'].strip('"'),
+                                    last_modified=obj['LastModified']))
+    return objects
+
+
+def upsert_s3_objects(objects: List[S3Object], prefix: str) -> None:
+    for obj in objects:
+        obj.store, obj.cube_sn, obj.capture_date = parse_capture_key(obj.key, prefix)
+    S3Object.objects.bulk_create(objects, batch_size=UPSERT_BATCH_SIZE, update_conflicts=True,
+                                 unique_fields=['bucket', 'key'],
+                                 update_fields=['size', 'etag', 'last_modified', 'store', 'cube_sn', 'capture_date',
+                                                'indexed_at'])
+
+
+def index_captures(bucket: str = CAPTURES_BUCKET_NAME, prefix: str = CAPTURES_PREFIX, s3_client=None,
+                   max_workers: int = 16, full: bool = False) -> IndexResult:
+    """Lists the capture prefix of the bucket into S3Object.
+
+    The listing is sharded by {store}/attempts/{date}/ prefix and run on a thread pool; the database writes stay
+    on the calling thread.  Unless full is set, only the dates of each store from its latest indexed date on are
+    listed.  The latest date is listed again since it may have been indexed while captures were still arriving."""
+    s3_client = s3_client or boto3.client('s3')
+    latest = {} if full else dict(S3Object.objects.filter(bucket=bucket).values('store')
+                                  .annotate(latest=Max('capture_date')).values_list('store', 'latest'))
+    result = IndexResult()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        store_prefixes = list_common_prefixes(s3_client, bucket, prefix)
+        date_prefixes = []
+        for store_prefix, prefixes in zip(store_prefixes, executor.map(
+                lambda p: list_common_prefixes(s3_client, bucket, f'{p}attempts/'), store_prefixes)):
+            store = store_prefix[len(prefix):].rstrip('/')
+            for date_prefix in prefixes:
+                capture_date = parse_capture_date(date_prefix.rstrip('/').rsplit('/', 1)[-1])
+                if store in latest and capture_date is not None and capture_date < latest[store]:
+                    continue
+                date_prefixes.append(date_prefix)
+
+        futures = {executor.submit(list_s3_objects, s3_client, bucket, p): p for p in date_prefixes}
+        for future in as_completed(futures):
+            result.num_prefixes += 1
+            try:
+                objects = future.result()
+            except Exception as e:
+                logging.error(f'index_captures() - error listing {futures[future]}: {e}')
+                result.num_failed_prefixes += 1
+                continue
+            upsert_s3_objects(objects, prefix)
+            result.num_objects += len(objects)
+
+    return result
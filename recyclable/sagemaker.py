@@ -0,0 +1,127 @@
+import json
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from itertools import islice
+from typing import List, Any, Optional
+
+import boto3
+
+from recyclable.models import Image
+from recyclable.utils import s3_data_from_object_url
+
+
+@dataclass
+class DatasetItem:
+    cls: str  # class path, e.g. 'pet' or 'train/pet'
+    url: str
+    image_id: Optional[int] = None
+    etag: str = ''
+
+
+@dataclass
+class CopyResult:
+    cls: str
+    source_bucket: str
+    source_key: str
+    dest_key: str
+    status: str  # 'copied', 'skipped' or 'failed'
+    etag: str = ''
+    error: str = ''
+
+
+def classifier_items(classifier: dict[str, Any]) -> List[DatasetItem]:
+    """Flattens a classifier JSON ({class: [url, ...]}, or the {"splits": {split: {class: [url, ...]}}}
+    output of the split generator) into items.  The JSON has no image ids or ETags; see with_image_data()."""
+    if 'splits' in classifier:
+        return [DatasetItem(f'{split}/{cls}', url)
+                for split, classes in classifier['splits'].items()
+                for cls, urls in classes.items()
+                for url in urls]
+
+    return [DatasetItem(cls, url) for cls, urls in classifier.items() for url in urls]
+
+
+def with_image_data(items: List[DatasetItem], batch_size: int = 1000) -> List[DatasetItem]:
+    """Fills in the image id and ETag of items that lack them from the Image rows of their object keys."""
+    missing = iter([item for item in items if item.image_id is None])
+    while batch := list(islice(missing, batch_size)):
+        keys = {s3_data_from_object_url(item.url)[2]: item for item in batch}
+        for image_id, key, etag in Image.objects.filter(s3_object_key__in=keys).values_list(
+                'id', 's3_object_key', 'aws_entity_tag'):
+            keys[key].image_id, keys[key].etag = image_id, etag
+    return items
+
+
+def list_etags(s3_client, bucket: str, prefix: str) -> dict[str, str]:
+    etags: dict[str, str] = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            etags[obj['Key']] = obj['ETag'].strip('"')
+    return etags
+
+
+def materialize_dataset(items: List[DatasetItem], dest_bucket: str, prefix: str,
+                        s3_client=None, max_workers: int = 16) -> List[CopyResult]:
+    """Copies every item to s3://{dest_bucket}/{prefix}/{class_path}/{image_id}_{file} with server-side
+    copy_object calls from a bounded thread pool.  Objects that already exist with the item's ETag are skipped,
+    so reruns only copy what changed."""
+    s3_client = s3_client or boto3.client('s3')
+    prefix = prefix.strip('/')
+
+    # One listing of the destination, compared with the ETags the items carry, replaces a HEAD request per object.
+    existing = list_etags(s3_client, dest_bucket, f'{prefix}/')
+
+    tasks = []
+    etags = []
+    dest_keys = set()
+    for item in items:
+        source_bucket, _, source_key = s3_data_from_object_url(item.url)
+        # Different containers reuse file names, so the image id (or, without one, the whole key) keeps them apart.
+        name = f'{item.image_id}_{posixpath.basename(source_key)}' if item.image_id is not None \
+            else source_key.replace('/', '_')
+        dest_key = f'{prefix}/{item.cls}/{name}'
+        if dest_key in dest_keys:
+            logging.warning(f'materialize_dataset() - {item.url} is listed twice in {item.cls}, skipping')
+            continue
+        dest_keys.add(dest_key)
+        tasks.append(CopyResult(item.cls, source_bucket, source_key, dest_key, status=''))
+        etags.append(item.etag.strip('"'))
+
+    def copy(task: CopyResult, etag: str) -> CopyResult:
+        try:
+            dest_etag = existing.get(task.dest_key)
+            if dest_etag is not None:
+                if not etag:
+                    # Only items whose image is not in the DB lack an ETag.
+                    etag = s3_client.head_object(Bucket=task.source_bucket, Key=task.source_key)['ETag'].strip('"')
+                if etag == dest_etag:
+                    task.status, task.etag = 'skipped', dest_etag
+                    return task
+
+            response = s3_client.copy_object(Bucket=dest_bucket, Key=task.dest_key,
+                                             CopySource={'Bucket': task.source_bucket, 'Key': task.source_key})
+            task.status, task.etag = 'copied', response['CopyObjectResult']['ETag'].strip('"')
+        except Exception as e:
+            logging.error(f'materialize_dataset() - error copying {task.source_key} to {task.dest_key}: {e}')
+            task.status, task.error = 'failed', str(e)
+        return task
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(copy, tasks, etags))
+
+
+def write_manifest(results: List[CopyResult], dest_bucket: str, prefix: str,
+                   s3_client=None) -> Optional[str]:
+    """Writes a JSON Lines manifest ({"source-ref": "s3://...", "class": ...} per object) next to the dataset
+    and returns its key."""
+    s3_client = s3_client or boto3.client('s3')
+    manifest_key = f'{prefix.strip("/")}/manifest.jsonl'
+
+    lines = [json.dumps({'source-ref': f's3://{dest_bucket}/{r.dest_key}', 'class': r.cls, **asdict(r)})
+             for r in results if r.status != 'failed']
+    s3_client.put_object(Bucket=dest_bucket, Key=manifest_key, Body='\n'.join(lines).encode('utf-8'),
+                         ContentType='application/x-ndjson')
+    return manifest_key
@@ -0,0 +1,83 @@
+import hashlib
+import struct
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Tuple
+
+from recyclable.models import DatasetSnapshot
+from recyclable.views_helpers import CLASSIFIER_LABELS, ClassifierLabel
+
+# Each snapshot item is packed as (image id: uint32, class index: uint16, content hash: 8 bytes), sorted by image
+# id, so a snapshot of a million images takes 14 MB and two snapshots can be diffed with a single merge pass.
+ITEM = struct.Struct('<IH8s')
+
+SnapshotItem = Tuple[int, str, bytes]
+
+
+def content_hash(etag: str) -> bytes:
+    # S3 ETags of single-part uploads are the MD5 of the object, so the first 8 bytes identify the content.
+    try:
+        digest = bytes.fromhex(etag.split('-')[0])
+    except ValueError:
+        digest = b''
+    if len(digest) < 8:
+        digest = hashlib.sha256(etag.encode('utf-8')).digest()
+    return digest[:8]
+
+
+def pack_items(labels: Iterable[ClassifierLabel]) -> Tuple[List[str], int, bytes]:
+    classes: List[str] = []
+    class_index: dict[str, int] = {}
+    packed = []
+    for label in labels:
+        i_class = class_index.get(label.cls)
+        if i_class is None:
+            i_class = class_index[label.cls] = len(classes)
+            classes.append(label.cls)
+        packed.append((label.image_id, i_class, content_hash(label.etag)))
+
+    packed.sort()
+    return classes, len(packed), b''.join(ITEM.pack(*item) for item in packed)
+
+
+def iter_items(snapshot: DatasetSnapshot) -> Iterator[SnapshotItem]:
+    classes = snapshot.classes
+    for image_id, i_class, digest in ITEM.iter_unpack(bytes(snapshot.data)):
+        yield image_id, classes[i_class], digest
+
+
+def create_snapshot(name: str, classifier: str) -> DatasetSnapshot:
+    # A snapshot only needs the ids, classes and ETags, so it reads the labels instead of signing every URL.
+    classes, num_items, data = pack_items(CLASSIFIER_LABELS[classifier]())
+    return DatasetSnapshot.objects.create(name=name, classifier=classifier, classes=classes,
+                                          num_items=num_items, data=data)
+
+
+@dataclass
+class SnapshotDiff:
+    added: List[Tuple[int, str]] = field(default_factory=list)
+    removed: List[Tuple[int, str]] = field(default_factory=list)
+    moved: List[Tuple[int, str, str]] = field(default_factory=list)  # (image id, old class, new class)
+    changed: List[Tuple[int, str]] = field(default_factory=list)  # same class, new image content
+
+
+def diff_snapshots(old: DatasetSnapshot, new: DatasetSnapshot) -> SnapshotDiff:
+    """Merges the two sorted item lists in O(len(old) + len(new))."""
+    diff = SnapshotDiff()
+    old_items, new_items = iter_items(old), iter_items(new)
+    a, b = next(old_items, None), next(new_items, None)
+
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            diff.removed.append((a[0], a[1]))
+            a = next(old_items, None)
+        elif a is None or b[0] < a[0]:
+            diff.added.append((b[0], b[1]))
+            b = next(new_items, None)
+        else:
+            if a[1] != b[1]:
+                diff.moved.append((b[0], a[1], b[1]))
+            elif a[2] != b[2]:
+                diff.changed.append((b[0], b[1]))
+            a, b = next(old_items, None), next(new_items, None)
+
+    return diff
@@ -1,14 +1,65 @@
+import gzip
+import io
+import json
 import os
+import tempfile
+from collections import Counter, defaultdict
 from typing import Tuple, Any
-from unittest import skip
+from unittest import mock, skip, skipUnless
 
 import boto3
+from PIL import Image as PILImage
+from datetime import date, datetime, timezone
+
 from django.conf import settings
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+try:
+    from moto import mock_aws
+except ImportError:  # moto is only needed for the local S3 tests
+    mock_aws = None
+
+from .admin import EstimatedCountPaginator, ImageAdmin, estimated_count
+from .capture_sessions import CAPTURE_CATEGORIES, SESSION_KEY as CAPTURE_SESSION_KEY, allocate_counts, \
+    create_capture_session, get_capture_session
+from .db_routers import ReplicaRouter, use_replica, iter_on_replica
+from . import image_cache
+from .image_cache import evict, open_cached_image, reset_cache_size
+from .jobs import MAX_JOB_ATTEMPTS, STALE_JOB_TIMEOUT, beat, enqueue_job, claim_job, run_job, run_worker
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, HISTOGRAMS, count_queries, render_metrics, stage
+from .models import CaptureRollup, Container, ContainerImageCounts, ContainerSize, Image, Job, JobReclaimed, \
+    S3Object, load_models_from_csv, mk_container, image_category, increment_image_counts, recompute_image_counts, \
+    compact_capture_rollups
+from .partitions import enable_partitioning, create_future_partitions, detach_old_partitions, \
+    is_partitioned, list_partitions, partition_name
+from .s3_index import index_captures, parse_capture_key
+from .presign import presigned_urls, reset_s3_clients
+from .sagemaker import classifier_items, materialize_dataset, with_image_data, write_manifest
+from .snapshots import create_snapshot, diff_snapshots
+from .utils import s3_data_from_object_url, compress_stream
+from .views_helpers import create_size_classifier_json, create_deposit_classifier_json, create_classifier_jsonl, \
+    iter_deposit_classifier_records, iter_size_classifier_records, CLASSIFIER_LABELS, DEFAULT_URL_PREFIX, plan_splits, \
+    split_sizes, parse_split_ratios, create_classifier_splits_json, create_classifier_splits_jsonl, ClassifierRecord, \
+    ClassifierLabel, canonical_production_filters, production_cache_stats, production_cache_ttl
 
-from .models import Container, ContainerSize, load_models_from_csv, mk_container
-from .utils import s3_data_from_object_url
-from .views_helpers import create_size_classifier_json, create_deposit_classifier_json
+
+def mk_test_image(c: Container, n: int, crush_degree: int = 0, valid_orientation: bool = True, **kwargs) -> Image:
+    return Image.objects.create(
+        container=c,
+        aws_entity_tag=f'etag-{c.barcode}-{n}',
+        s3_bucket_name='olyns-recyclable',
+        aws_region_name='us-west-2',
+        s3_object_key=f'images/{c.barcode}/{c.barcode}_{n}.png',
+        crush_degree=crush_degree,
+        valid_orientation=valid_orientation,
+        **kwargs,
+    )
 
 
 class ContainerModelTests(TestCase):
@@ -89,6 +140,702 @@ class S3Tests(TestCase):
         for b in s3.buckets.all():
             print(b.name)
 
+class DepositStatesTests(TestCase):
+
+    def test_deposit_states(self) -> None:
+        c = mk_container('555', 'brand', 'product', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA', ca=True, Or=True)
+        c.save()
+        self.assertEqual(c.states(), ['CA', 'OR'])
+        self.assertTrue(c.eligible_in('or'))
+        self.assertFalse(c.eligible_in('NY'))
+
+        c.set_eligible('NY', True)
+        c.set_eligible('CA', False)
+        c.save()
+        self.assertEqual(list(Container.objects.eligible_in('NY', 'OR')), [c])
+        self.assertEqual(list(Container.objects.eligible_in('CA')), [])
+        self.assertEqual(list(Container.objects.eligible_in_any('CA', 'NY')), [c])
+
+        with self.assertRaises(ValueError):
+            c.eligible_in('TX')
+
+    def test_read_csv_deposit_states(self) -> None:
+        load_models_from_csv(os.path.join(settings.BASE_DIR, 'test_data'))
+        self.assertEqual(Container.objects.get(barcode='00345323').states(), ['CA', 'OR'])
+
+
+class ImageCountsTests(TestCase):
+
+    def test_counts(self) -> None:
+        c = mk_container('555', 'brand', 'product', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        for n, (crush_degree, valid_orientation) in enumerate([(0, True), (0, True), (2, True), (-1, False),
+                                                               (-1, True)]):
+            mk_test_image(c, n, crush_degree=crush_degree, valid_orientation=valid_orientation)
+            increment_image_counts(c, image_category(crush_degree, valid_orientation))
+
+        counts = ContainerImageCounts.objects.get(container=c)
+        self.assertEqual((counts.total, counts.valid, counts.crushed_2, counts.bad_orientation, counts.no_label),
+                         (5, 2, 1, 1, 1))
+
+        Image.objects.filter(container=c, crush_degree=0).delete()
+        ContainerImageCounts.objects.filter(container=c).update(crushed_4=7)
+        self.assertEqual(recompute_image_counts(), 1)
+        counts.refresh_from_db()
+        self.assertEqual([n for _, n in counts.categories()], [0, 0, 1, 0, 0, 1, 1])
+        self.assertEqual(counts.total, 3)
+
+    def test_csv_import_counts(self) -> None:
+        with tempfile.TemporaryDirectory() as dir_name:
+            with open(os.path.join(dir_name, 'container.csv'), 'w') as f:
+                f.write('barcode,material_type,CA\n666,aluminum,True\n777,glass,False\n')
+            with open(os.path.join(dir_name, 'image.csv'), 'w') as f:
+                f.write('barcode,aws_entity_tag,crush_degree,valid_orientation\n'
+                        '666,e1,0,True\n666,e2,3,True\n666,e3,0,False\n777,e4,0,True\n')
+            load_models_from_csv(dir_name)
+
+        counts = ContainerImageCounts.objects.get(container__barcode='666')
+        self.assertEqual((counts.total, counts.valid, counts.crushed_3, counts.bad_orientation), (3, 1, 1, 1))
+        self.assertEqual(ContainerImageCounts.objects.get(container__barcode='777').valid, 1)
+
+    def test_csv_import_resumed(self) -> None:
+        with tempfile.TemporaryDirectory() as dir_name:
+            with open(os.path.join(dir_name, 'container.csv'), 'w') as f:
+                f.write('barcode,material_type\n666,aluminum\n777,glass\n')
+            with open(os.path.join(dir_name, 'image.csv'), 'w') as f:
+                f.write('barcode,aws_entity_tag\n')
+            load_models_from_csv(dir_name)
+
+            # An import resumed after its containers skips all of them.
+            with open(os.path.join(dir_name, 'image.csv'), 'w') as f:
+                f.write('barcode,aws_entity_tag\n666,e1\n777,e2\n')
+            load_models_from_csv(dir_name, checkpoint={'containers': 2, 'images': 0})
+
+        for barcode in ['666', '777']:
+            self.assertTrue(Image.objects.get(container__barcode=barcode).s3_object_key
+                            .startswith(f'images/{barcode}/{barcode}_'))
+
+
+class CaptureRollupTests(TestCase):
+
+    def setUp(self) -> None:
+        self.client.force_login(get_user_model().objects.create_user('tester', password='pw'))
+        c = mk_container('556', 'brand', 'product', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        for n, (day, cube_sn, crush_degree) in enumerate([(1, 'cube0', 0), (1, 'cube0', 0), (1, 'cube0', 3),
+                                                          (1, 'cube1', 0), (2, 'cube0', 0)]):
+            mk_test_image(c, n, crush_degree=crush_degree, cube_sn=cube_sn, store_name='store',
+                          timestamp=datetime(2024, 11, day, 12, tzinfo=timezone.utc))
+        mk_test_image(c, 5)  # no timestamp, not counted
+
+    def rollups(self) -> dict:
+        return {(r.day.day, r.cube_sn, r.deposit_type): r.count for r in CaptureRollup.objects.all()}
+
+    def test_incremental_and_compaction(self) -> None:
+        expected = {(1, 'cube0', 'valid'): 2, (1, 'cube0', 'invalid'): 1, (1, 'cube1', 'valid'): 1,
+                    (2, 'cube0', 'valid'): 1}
+        self.assertEqual(self.rollups(), expected)
+
+        # Deletes and queryset updates bypass Image.save, so the rollups drift until compacted.
+        Image.objects.filter(cube_sn='cube1').delete()
+        Image.objects.filter(crush_degree=3).update(crush_degree=0)
+        self.assertEqual(self.rollups(), expected)
+        self.assertEqual(compact_capture_rollups(date(2024, 11, 2)), 1)
+        self.assertEqual(self.rollups(), {**expected, (1, 'cube1', 'valid'): 1})
+        self.assertEqual(compact_capture_rollups(), 2)
+        self.assertEqual(self.rollups(), {(1, 'cube0', 'valid'): 3, (2, 'cube0', 'valid'): 1})
+
+    def test_compaction_job(self) -> None:
+        call_command('enqueue_job', 'compact_capture_rollups', 'days=7', stdout=io.StringIO())
+        job = Job.objects.get()
+        self.assertEqual(job.params, {'days': 7})
+        self.assertEqual(run_worker('test-worker', once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+
+        # Jobs queued with string parameters before they were parsed still run.
+        job = enqueue_job('compact_capture_rollups', {'days': '7'})
+        run_worker('test-worker', once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+
+    def test_api(self) -> None:
+        url = reverse('recyclable:api_capture_rollups')
+        rows = self.client.get(url).json()['rows']
+        self.assertEqual(rows, [{'day': '2024-11-01', 'count': 4}, {'day': '2024-11-02', 'count': 1}])
+
+        rows = self.client.get(url, {'start_date': '2024-11-01', 'end_date': '2024-11-01', 'cubes': 'cube0',
+                                     'group_by': 'cube_sn,deposit_type'}).json()['rows']
+        self.assertEqual(rows, [{'cube_sn': 'cube0', 'deposit_type': 'invalid', 'count': 1},
+                                {'cube_sn': 'cube0', 'deposit_type': 'valid', 'count': 2}])
+
+        self.assertEqual(self.client.get(url, {'group_by': 'brand'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start_date': '11/01/2024'}).status_code, 400)
+
+
+class CompactChoicesFieldTests(TestCase):
+
+    def test_compact_choices(self) -> None:
+        c = mk_container('666', 'brand', 'product', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        img = mk_test_image(c, 1, label=Image.LabelType.NEITHER, lid_cap='')
+
+        img = Image.objects.get(pk=img.pk)
+        self.assertEqual(img.label, 'neither')
+        self.assertEqual(img.get_label_display(), 'Neither')
+        self.assertEqual(img.lid_cap, Image.LidCapType.UNKNOWN)
+        self.assertEqual(Image.objects.filter(label__in=[Image.LabelType.NEITHER, 'neck_only']).count(), 1)
+        self.assertEqual(list(Image.objects.values_list('count', flat=True)), ['solo'])
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT label FROM recyclable_image WHERE id = %s', [img.pk])
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+        with self.assertRaises(ValueError):
+            Image.objects.filter(label='sideways').count()
+
+
+class IndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        for i_container in range(20):
+            c = mk_container(f'idx{i_container}', 'brand', 'product', Container.MaterialType.ALUMINUM,
+                             Container.PlasticCode.NA, 12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA',
+                             ca=i_container % 2 == 0)
+            c.save()
+            for n in range(10):
+                mk_test_image(c, n, crush_degree=n % 5, valid_orientation=n % 3 != 0,
+                              timestamp=datetime(2024, 11, 1 + n, tzinfo=timezone.utc),
+                              cube_sn=f'cube{i_container % 4}', store_name=f'store{i_container % 3}')
+
+    def assertUsesIndex(self, queryset, index_name: str) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE recyclable_image')
+            cursor.execute('ANALYZE recyclable_container')
+            # The seeded tables are tiny, so make the planner prefer any usable index over a sequential scan.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_hot_queries_use_indexes(self) -> None:
+        c = Container.objects.get(barcode='idx0')
+        start = datetime(2024, 11, 2, tzinfo=timezone.utc)
+        end = datetime(2024, 11, 5, tzinfo=timezone.utc)
+
+        self.assertUsesIndex(Image.objects.filter(container=c).order_by('-image_sequence_number')[:1],
+                             'image_container_seq_idx')
+        self.assertUsesIndex(Image.objects.filter(container=c, valid_orientation=True, crush_degree__in=[0, 1]),
+                             'image_valid_uncrushed_idx')
+        self.assertUsesIndex(Image.objects.filter(valid_orientation=False, crush_degree=2),
+                             'image_orientation_crush_idx')
+        self.assertUsesIndex(Container.objects.eligible_in('CA').filter(material_type__in=[Container.MaterialType.GLASS]),
+                             'container_ca_material_idx')
+        self.assertUsesIndex(Image.objects.filter(timestamp__range=(start, end)), 'image_timestamp_id_idx')
+        self.assertUsesIndex(Image.objects.filter(cube_sn='cube1', timestamp__range=(start, end)),
+                             'image_cube_timestamp_id_idx')
+        self.assertUsesIndex(Image.objects.filter(store_name='store1', timestamp__range=(start, end)),
+                             'image_store_timestamp_idx')
+
+
+class SnapshotTests(TestCase):
+
+    def test_diff_snapshots(self) -> None:
+        c = mk_container('444', 'brand', 'product', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        img1 = mk_test_image(c, 1)
+        img2 = mk_test_image(c, 2)
+        img3 = mk_test_image(c, 3)
+        # Snapshots don't sign URLs.
+        with mock.patch('recyclable.views_helpers.image_urls', side_effect=AssertionError) as presign:
+            old = create_snapshot('v1', 'deposit_classifier')
+        presign.assert_not_called()
+        self.assertEqual(old.num_items, 3)
+
+        img1_id = img1.id
+        img1.delete()
+        img2.valid_orientation = False
+        img2.save()
+        img3.aws_entity_tag = 'd41d8cd98f00b204e9800998ecf8427e'
+        img3.save()
+        img4 = mk_test_image(c, 4)
+        new = create_snapshot('v2', 'deposit_classifier')
+
+        diff = diff_snapshots(old, new)
+        self.assertEqual(diff.removed, [(img1_id, 'alu')])
+        self.assertEqual(diff.moved, [(img2.id, 'alu', 'invalid_bad_orientation')])
+        self.assertEqual(diff.changed, [(img3.id, 'alu')])
+        self.assertEqual(diff.added, [(img4.id, 'alu')])
+
+
+class ContainerApiTests(TestCase):
+
+    def setUp(self) -> None:
+        self.client.force_login(get_user_model().objects.create_user('tester', password='pw'))
+        mk_container('600', 'brand', 'product', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                     12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA').save()
+
+    def post(self, name: str, body: Any) -> Any:
+        return self.client.post(reverse(f'recyclable:{name}'), json.dumps(body), content_type='application/json')
+
+    def test_lookup(self) -> None:
+        with self.assertNumQueries(3):  # session, user, containers
+            response = self.post('api_container_lookup', {'barcodes': ['600', '601', '601']})
+        data = response.json()
+        self.assertEqual(list(data['containers']), ['600'])
+        self.assertEqual(data['containers']['600']['material_type'], 'alu')
+        self.assertEqual(data['missing'], ['601'])
+        self.assertEqual(self.post('api_container_lookup', {'barcodes': '600'}).status_code, 400)
+
+    def test_upsert(self) -> None:
+        new = {'barcode': '601', 'material_type': 'glass', 'plastic_code': 'NA', 'liquid_volume_unit': 'OZ',
+               'liquid_volume': 25, 'deposit_states': ['CA', 'OR']}
+        results = self.post('api_container_upsert', {'containers': [
+            new,
+            {'barcode': '600', 'brand': 'new brand', 'visual_volume': 'small'},
+            {'barcode': '602', 'material_type': 'glass'},
+            {'barcode': '603', 'material_type': 'wood', 'made_in': 'us', 'mass': 3},
+            {'barcode': '601', 'brand': 'again'},
+            {'barcode': '604', 'material_type': 'plastic', 'plastic_code': 'NA', 'liquid_volume_unit': 'OZ'},
+        ]}).json()['results']
+        self.assertEqual([r['status'] for r in results], ['created', 'updated', 'error', 'error', 'error', 'error'])
+        self.assertEqual(set(results[2]['errors']), {'plastic_code', 'liquid_volume_unit'})
+        self.assertEqual(set(results[3]['errors']), {'material_type', 'made_in', 'mass'})
+        self.assertIn('Duplicate', results[4]['errors']['barcode'])
+
+        c = Container.objects.get(barcode='601')
+        self.assertEqual((c.id, c.liquid_volume, c.states()), (results[0]['id'], 25.0, ['CA', 'OR']))
+        updated = Container.objects.get(barcode='600')
+        self.assertEqual((updated.brand, updated.visual_volume, updated.product_name),
+                         ('new brand', 'small', 'product'))
+        self.assertFalse(Container.objects.filter(barcode__in=['602', '603', '604']).exists())
+
+        results = self.post('api_container_upsert', {'containers': [new]}).json()['results']
+        self.assertEqual(results, [{'barcode': '601', 'status': 'unchanged', 'id': c.id}])
+        self.assertEqual(self.post('api_container_upsert', {'containers': {}}).status_code, 400)
+
+    def test_search(self) -> None:
+        for barcode, brand, product in [('6001', 'Coca-Cola', 'Classic'), ('7000', 'Pepsi', 'Cola 600'),
+                                        ('8000', 'Cola Nut', 'Soda')]:
+            mk_container(barcode, brand, product, Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA').save()
+        url = reverse('recyclable:api_container_search')
+
+        barcodes = [c['barcode'] for c in self.client.get(url, {'q': '600'}).json()['containers']]
+        self.assertEqual(barcodes, ['600', '6001'])
+        barcodes = [c['barcode'] for c in self.client.get(url, {'q': 'cola'}).json()['containers']]
+        self.assertEqual(barcodes[0], '8000')  # brand matches rank above product name matches
+        self.assertIn('7000', barcodes)
+        self.assertEqual(len(self.client.get(url, {'q': '600', 'limit': 1}).json()['containers']), 1)
+        self.assertEqual(self.client.get(url, {'q': '6', 'limit': 'x'}).status_code, 400)
+
+        self.client.force_login(get_user_model().objects.create_superuser('admin', password='pw'))
+        response = self.client.get(reverse('admin:recyclable_container_changelist'), {'q': 'pepsi'})
+        self.assertEqual([c.barcode for c in response.context['cl'].result_list], ['7000'])
+
+
+class CaptureViewTests(TestCase):
+
+    def test_allocate_counts(self) -> None:
+        counts = allocate_counts(10, {'valid': 46, 'crushed_2': 27, 'no_label': 27})
+        self.assertEqual([count for _, count in counts], [4, 0, 0, 3, 0, 3, 0])
+
+    @mock.patch('recyclable.views.save_image_bytes')
+    @mock.patch('recyclable.views.upload_image_bytes_to_s3', return_value='etag-capture')
+    def test_capture(self, upload, save_file) -> None:
+        self.client.force_login(get_user_model().objects.create_user('tester', password='pw'))
+        c = mk_container('557', 'brand', 'product', Container.MaterialType.GLASS, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        percentages = {f'{name}_percentage': 0 for name in CAPTURE_CATEGORIES}
+        response = self.client.post(reverse('recyclable:image'), {
+            'container_id': c.id, 'barcode': c.barcode, 'num_images': 3,
+            **percentages, 'valid_percentage': 34, 'crushed_2_percentage': 66})
+        self.assertTemplateUsed(response, 'recyclable/image.html')
+        self.assertEqual((response.context['i_image'], response.context['category']), (1, 'valid'))
+
+        data = {'capture_session': response.context['capture_session'], 'image_width': 640, 'image_height': 480,
+                'frame_data_url': 'data:image/png;base64,AAAA'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('recyclable:image'), {**data, 'i_image': 2})
+        # The container comes from the capture session, and the session is only read.
+        self.assertFalse([q['sql'] for q in queries if '"recyclable_container".' in q['sql']
+                          or q['sql'].startswith(('UPDATE "django_session"', 'INSERT INTO "django_session"'))])
+        self.assertTemplateUsed(response, 'recyclable/image.html')
+        self.assertEqual((response.context['i_image'], response.context['category']), (3, 'crushed_2'))
+        img = Image.objects.get(container=c)
+        self.assertEqual((img.aws_entity_tag, img.crush_degree), ('etag-capture', 2))
+        self.assertEqual(upload.call_args.args, (img.s3_object_key, b'\x00\x00\x00'))
+        self.assertEqual(save_file.call_args.args[1], b'\x00\x00\x00')
+        self.assertEqual(ContainerImageCounts.objects.get(container=c).crushed_2, 1)
+
+        self.assertEqual(self.client.post(reverse('recyclable:image'), {**data, 'i_image': 4}).status_code, 400)
+        response = self.client.post(reverse('recyclable:image'), {**data, 'i_image': 3})
+        self.assertEqual(response.context['message'], 'All images have been captured.')
+        response = self.client.post(reverse('recyclable:image'), {**data, 'i_image': 3})
+        self.assertIn('expired', response.context['message'])
+        self.assertEqual(self.client.get(reverse('recyclable:image')).status_code, 405)
+
+    def test_capture_session_expiry(self) -> None:
+        c = Container(id=1, barcode='558', material_type=Container.MaterialType.GLASS)
+        session = {}
+        with mock.patch('recyclable.capture_sessions.time.time', return_value=1000.0):
+            old = create_capture_session(session, c, 2, [('valid', 1), ('no_label', 1)])
+        self.assertEqual((old.category(2), old.crush_degree(2)), ('no_label', -1))
+        self.assertIsNone(get_capture_session(session, old.id))
+        new = create_capture_session(session, c, 1, [('valid', 1)])
+        self.assertEqual(list(session[CAPTURE_SESSION_KEY]), [new.id])
+        self.assertEqual(get_capture_session(session, new.id), new)
+
+
+@skipUnless(mock_aws, 'moto is not installed')
+class ImageProxyTests(TestCase):
+
+    def setUp(self) -> None:
+        reset_s3_clients()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(IMAGE_CACHE_DIR=self.cache_dir.name)
+        self.settings_override.enable()
+        reset_cache_size()
+        self.client.force_login(get_user_model().objects.create_user('tester', password='pw'))
+
+    def tearDown(self) -> None:
+        self.settings_override.disable()
+        self.cache_dir.cleanup()
+        reset_s3_clients()
+
+    def test_image_proxy(self) -> None:
+        c = mk_container('999', 'brand', 'product', Container.MaterialType.GLASS, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        png = io.BytesIO()
+        PILImage.new('RGB', (600, 400), 'red').save(png, 'PNG')
+
+        with mock_aws():
+            s3 = boto3.client('s3', region_name='us-west-2')
+            s3.create_bucket(Bucket='olyns-recyclable', CreateBucketConfiguration={'LocationConstraint': 'us-west-2'})
+            etag = s3.put_object(Bucket='olyns-recyclable', Key='images/999/999_1.png', Body=png.getvalue())['ETag']
+            img = mk_test_image(c, 1)
+            img.aws_entity_tag = etag.strip('"')
+            img.save()
+            url = reverse('recyclable:image_proxy', args=[img.id])
+
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(b''.join(response.streaming_content), png.getvalue())
+
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+            response = self.client.get(url, HTTP_RANGE='bytes=1-3')
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], f'bytes 1-3/{len(png.getvalue())}')
+            self.assertEqual(b''.join(response.streaming_content), png.getvalue()[1:4])
+            self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=100000-').status_code, 416)
+
+            response = self.client.get(url, {'w': 256})
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+            self.assertEqual(PILImage.open(io.BytesIO(b''.join(response.streaming_content))).size, (256, 171))
+            self.assertEqual(self.client.get(url, {'w': 300}).status_code, 400)
+
+        # Served from the cache once fetched.
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertGreater(evict(0), 0)
+
+
+class ImageCacheTests(TestCase):
+
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(IMAGE_CACHE_DIR=self.cache_dir.name, IMAGE_CACHE_MAX_BYTES=1000)
+        self.settings_override.enable()
+        reset_cache_size()
+        c = mk_container('999', 'brand', 'product', Container.MaterialType.GLASS, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        self.images = [mk_test_image(c, n) for n in range(4)]
+        for img in self.images:
+            img.aws_entity_tag = f'etag{img.id}'
+
+    def tearDown(self) -> None:
+        self.settings_override.disable()
+        self.cache_dir.cleanup()
+        reset_cache_size()
+
+    def fake_download(self, img: Image, path: str) -> int:
+        return image_cache.write_atomically(path, lambda f: f.write(b'x' * 300))
+
+    def test_evicted_while_opening(self) -> None:
+        img = self.images[0]
+        cached_image_path = image_cache.cached_image_path
+
+        def evicting_cached_image_path(*args):
+            # Another worker's evict() deletes the file after the first lookup found it.
+            path = cached_image_path(*args)
+            if download.call_count == 1:
+                os.unlink(path)
+            return path
+
+        with mock.patch('recyclable.image_cache.download', side_effect=self.fake_download) as download, \
+                mock.patch('recyclable.image_cache.cached_image_path', side_effect=evicting_cached_image_path):
+            with open_cached_image(img) as f:
+                self.assertEqual(f.read(), b'x' * 300)
+        self.assertEqual(download.call_count, 2)
+
+    def test_evicts_only_when_full(self) -> None:
+        with mock.patch('recyclable.image_cache.download', side_effect=self.fake_download), \
+                mock.patch('recyclable.image_cache.evict', wraps=evict) as evict_mock, \
+                mock.patch('recyclable.image_cache.EVICT_RESCAN_FRACTION', 1.0):
+            # The first write scans the cache to learn its size; the next ones are tracked until it is over 1000.
+            for img in self.images[:3]:
+                open_cached_image(img).close()
+            self.assertEqual(evict_mock.call_count, 1)
+            open_cached_image(self.images[3]).close()
+            self.assertEqual(evict_mock.call_count, 2)
+            # Hits don't evict.
+            open_cached_image(self.images[3]).close()
+            self.assertEqual(evict_mock.call_count, 2)
+        self.assertLessEqual(sum(len(files) for _, _, files in os.walk(self.cache_dir.name)), 3)
+
+
+@skipUnless(mock_aws, 'moto is not installed')
+class PresignTests(TestCase):
+
+    def setUp(self) -> None:
+        reset_s3_clients()
+        caches['presigned_urls'].clear()
+
+    def tearDown(self) -> None:
+        reset_s3_clients()
+
+    def test_presigned_urls(self) -> None:
+        locations = [('olyns-recyclable', 'us-west-2', f'images/1/a {n}.png') for n in range(3)]
+        with mock_aws():
+            urls = presigned_urls(locations)
+            self.assertTrue(all('X-Amz-Signature=' in url for url in urls))
+            self.assertEqual(s3_data_from_object_url(urls[0]), locations[0])
+            self.assertTrue(urls[0].startswith(DEFAULT_URL_PREFIX))
+
+            with mock.patch('recyclable.presign.sign', return_value='signed') as sign:
+                self.assertEqual(presigned_urls(locations), urls)
+                self.assertEqual(presigned_urls(locations[:1], expires_in=60), ['signed'])
+            sign.assert_called_once_with(locations[0], 60)
+
+
+@skipUnless(mock_aws, 'moto is not installed')
+class SagemakerTests(TestCase):
+
+    def test_materialize_dataset(self) -> None:
+        with mock_aws():
+            s3 = boto3.client('s3', region_name='us-east-1')
+            s3.create_bucket(Bucket='source')
+            s3.create_bucket(Bucket='dest')
+            images = {}
+            for barcode, body in [('1', b'a1'), ('2', b'a2'), ('3', b'b')]:
+                c = mk_container(barcode, 'brand', 'product', Container.MaterialType.ALUMINUM,
+                                 Container.PlasticCode.NA, 12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+                c.save()
+                images[barcode] = mk_test_image(c, 1)
+                Image.objects.filter(id=images[barcode].id).update(
+                    aws_entity_tag=s3.put_object(Bucket='source', Key=images[barcode].s3_object_key,
+                                                 Body=body)['ETag'])
+            s3.put_object(Bucket='source', Key='other/3_1.png', Body=b'other')
+            # Both pet objects are named 3_1.png, and the second has no Image row.
+            url = 'https://source.s3.us-east-1.amazonaws.com/'
+            classifier = {
+                'alu': [f'{url}images/1/1_1.png', f'{url}images/2/2_1.png'],
+                'pet': [f'{url}images/3/3_1.png', f'{url}other/3_1.png'],
+            }
+
+            results = materialize_dataset(with_image_data(classifier_items(classifier)), 'dest', 'ds',
+                                          s3_client=s3, max_workers=2)
+            self.assertEqual([r.status for r in results], ['copied'] * 4)
+            self.assertEqual(s3.get_object(Bucket='dest', Key=f'ds/alu/{images["1"].id}_1_1.png')['Body'].read(),
+                             b'a1')
+            self.assertEqual(results[3].dest_key, 'ds/pet/other_3_1.png')
+
+            image = images['3']
+            Image.objects.filter(id=image.id).update(
+                aws_entity_tag=s3.put_object(Bucket='source', Key=image.s3_object_key, Body=b'changed')['ETag'])
+            results = materialize_dataset(with_image_data(classifier_items(classifier)), 'dest', 'ds',
+                                          s3_client=s3, max_workers=2)
+            self.assertEqual([r.status for r in results], ['skipped', 'skipped', 'copied', 'skipped'])
+
+            manifest_key = write_manifest(results, 'dest', 'ds', s3_client=s3)
+            manifest = s3.get_object(Bucket='dest', Key=manifest_key)['Body'].read().decode('utf-8').splitlines()
+            self.assertEqual(json.loads(manifest[2])['source-ref'], f's3://dest/ds/pet/{image.id}_3_1.png')
+
+
+@skipUnless(mock_aws, 'moto is not installed')
+class S3IndexTests(TestCase):
+
+    def test_index_captures(self) -> None:
+        self.assertEqual(parse_capture_key('collector/captures/Safeway1483/attempts/2024.11.10/image1.jpg'),
+                         ('Safeway1483', '1483', date(2024, 11, 10)))
+
+        with mock_aws():
+            s3 = boto3.client('s3', region_name='us-east-1')
+            s3.create_bucket(Bucket='captures')
+            for key in ['Safeway1483/attempts/2024.11.09/a.jpg', 'Safeway1483/attempts/2024.11.10/b.jpg',
+                        'Lucky762/attempts/2024.11.10/c.jpg', 'Lucky762/attempts/2024.11.10/d.jpg']:
+                s3.put_object(Bucket='captures', Key=f'collector/captures/{key}', Body=b'x')
+
+            result = index_captures('captures', s3_client=s3, max_workers=2)
+            self.assertEqual((result.num_prefixes, result.num_objects), (3, 4))
+            c = S3Object.objects.get(key='collector/captures/Lucky762/attempts/2024.11.10/c.jpg')
+            self.assertEqual((c.store, c.cube_sn, c.capture_date, c.size), ('Lucky762', '762', date(2024, 11, 10), 1))
+
+            # Only the latest indexed date of each store and newer dates are listed again.
+            for key in ['Safeway1483/attempts/2024.11.09/late.jpg', 'Safeway1483/attempts/2024.11.11/e.jpg']:
+                s3.put_object(Bucket='captures', Key=f'collector/captures/{key}', Body=b'x')
+            result = index_captures('captures', s3_client=s3, max_workers=2)
+            self.assertEqual((result.num_prefixes, result.num_objects), (3, 4))
+            self.assertEqual(S3Object.objects.count(), 5)
+
+            result = index_captures('captures', s3_client=s3, max_workers=2, full=True)
+            self.assertEqual(result.num_prefixes, 4)
+            self.assertEqual(S3Object.objects.count(), 6)
+
+
+class PartitionTests(TestCase):
+
+    def test_enable_partitioning(self) -> None:
+        c = mk_container('444', 'brand', 'product', Container.MaterialType.GLASS, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        mk_test_image(c, 1, timestamp=datetime(2024, 1, 15, tzinfo=timezone.utc))
+        mk_test_image(c, 2)
+
+        today = date(2024, 3, 10)
+        enable_partitioning(months_ahead=1, today=today)
+        self.assertTrue(is_partitioned())
+        self.assertEqual([month for _, month in list_partitions()],
+                         [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1), date(2024, 4, 1)])
+
+        # The ORM keeps working: inserts are routed by timestamp and the rows were copied over.
+        img = mk_test_image(c, 3, timestamp=datetime(2024, 3, 1, tzinfo=timezone.utc))
+        self.assertEqual(img.image_sequence_number, 3)
+        self.assertEqual(Image.objects.filter(container=c).count(), 3)
+        self.assertEqual(list(Image.objects.filter(timestamp__range=(datetime(2024, 1, 1, tzinfo=timezone.utc),
+                                                                      datetime(2024, 2, 1, tzinfo=timezone.utc)))
+                              .values_list('image_sequence_number', flat=True)), [1])
+
+        # ETags and object keys stay unique across partitions, including the default one.
+        for n, timestamp in [(1, datetime(2024, 3, 2, tzinfo=timezone.utc)), (2, None)]:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                mk_test_image(c, n, timestamp=timestamp)
+
+        # A month without a partition goes to the default partition until its partition is created.
+        mk_test_image(c, 4, timestamp=datetime(2024, 6, 3, tzinfo=timezone.utc))
+        self.assertEqual(create_future_partitions(3, today=today), [partition_name(date(2024, 5, 1)),
+                                                                   partition_name(date(2024, 6, 1))])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM "{partition_name(date(2024, 6, 1))}"')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            mk_test_image(c, 4, timestamp=datetime(2024, 7, 3, tzinfo=timezone.utc))
+
+        self.assertEqual(detach_old_partitions(1, drop=True, today=today), [partition_name(date(2024, 1, 1))])
+        self.assertEqual(Image.objects.filter(container=c).count(), 3)
+        # The dropped images' keys are released.
+        mk_test_image(c, 1, timestamp=datetime(2024, 3, 3, tzinfo=timezone.utc))
+
+
+class ReplicaRouterTests(TestCase):
+
+    @override_settings(DATABASE_REPLICA='replica')
+    def test_routing(self) -> None:
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Image))
+        with use_replica():
+            self.assertEqual(router.db_for_read(Image), 'replica')
+            self.assertEqual(router.db_for_write(Image), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'recyclable'))
+        self.assertIsNone(router.allow_migrate('default', 'recyclable'))
+
+        def reads():
+            for _ in range(2):
+                yield router.db_for_read(Image)
+
+        # Each step of the iterator runs on the replica, but the caller between steps does not.
+        steps = []
+        for alias in iter_on_replica(reads()):
+            steps.append((alias, router.db_for_read(Image)))
+        self.assertEqual(steps, [('replica', None), ('replica', None)])
+
+    @override_settings(DATABASE_REPLICA=None)
+    def test_without_replica(self) -> None:
+        with use_replica():
+            self.assertIsNone(ReplicaRouter().db_for_read(Image))
+            self.assertEqual(Image.objects.all().db, 'default')
+
+
+@skipUnless(mock_aws, 'moto is not installed')
+class JobTests(TestCase):
+
+    def test_classifier_export_job(self) -> None:
+        c = mk_container('333', 'brand', 'product', Container.MaterialType.PLASTIC, Container.PlasticCode.PET,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        mk_test_image(c, 1)
+
+        with mock_aws():
+            s3 = boto3.client('s3', region_name='us-east-1')
+            s3.create_bucket(Bucket='olyns-recyclable')
+
+            job = enqueue_job('deposit_classifier', {'format': 'jsonl', 'compression': 'gzip'})
+            self.assertEqual(run_worker('test-worker', once=True), 1)
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.Status.SUCCEEDED)
+            self.assertEqual(job.progress, 1.0)
+            artifact = s3.get_object(Bucket='olyns-recyclable', Key=job.artifact_s3_object_key)['Body'].read()
+            self.assertEqual(json.loads(gzip.decompress(artifact))['class'], 'pet')
+
+    def test_load_models_from_csv_job_resumes(self) -> None:
+        job = enqueue_job('load_models_from_csv', {'dir_name': os.path.join(settings.BASE_DIR, 'test_data')})
+        job.checkpoint = {'containers': 5, 'images': 0}
+        job.save()
+
+        claimed = claim_job('test-worker')
+        self.assertEqual(claimed.id, job.id)
+        self.assertIsNone(claim_job('other-worker'))
+        run_job(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertEqual(job.checkpoint['containers'], 9)
+        self.assertEqual(Container.objects.count(), 4)
+
+    def test_reclaimed_job(self) -> None:
+        job = enqueue_job('compact_capture_rollups', {'days': 1})
+        stale = claim_job('worker-a')
+        self.assertTrue(beat(stale))
+        Job.objects.filter(id=job.id).update(heartbeat_at=datetime.now(timezone.utc) - STALE_JOB_TIMEOUT * 2)
+        reclaimed = claim_job('worker-b')
+        self.assertEqual((reclaimed.id, reclaimed.attempts), (job.id, 2))
+
+        # The first worker can no longer checkpoint or record an outcome over the second one's.
+        self.assertFalse(beat(stale))
+        with self.assertRaises(JobReclaimed):
+            stale.save_checkpoint(0.5)
+        run_job(stale)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.Status.RUNNING, 'worker-b'))
+
+        # A job whose workers keep dying fails instead of being claimed forever.
+        Job.objects.filter(id=job.id).update(heartbeat_at=datetime.now(timezone.utc) - STALE_JOB_TIMEOUT * 2,
+                                             attempts=MAX_JOB_ATTEMPTS)
+        self.assertIsNone(claim_job('worker-c'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+
+
 class UtilsTests(TestCase):
 
     def test_data_from_url(self) -> None:
@@ -111,6 +858,261 @@ class UtilsTests(TestCase):
         self.assertEqual(rn1, region_name)
         self.assertEqual(s3ok1, s3_object_key)
 
+class ImageAdminTests(TestCase):
+
+    def setUp(self) -> None:
+        self.client.force_login(get_user_model().objects.create_superuser('admin', password='pw'))
+        alu = mk_container('555', 'brand', 'product', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                           12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        alu.save()
+        glass = mk_container('556', 'brand', 'product', Container.MaterialType.GLASS, Container.PlasticCode.NA,
+                             12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        glass.save()
+        timestamp = datetime(2024, 11, 1, tzinfo=timezone.utc)
+        self.images = [mk_test_image(alu, n, crush_degree=n % 2, cube_sn=f'cube{n % 2}', timestamp=timestamp)
+                       for n in range(5)] + [mk_test_image(glass, 0, timestamp=timestamp)]
+        recompute_image_counts()
+
+    def ids(self, response) -> list:
+        return [img.id for img in response.context['cl'].result_list]
+
+    def test_change_list(self) -> None:
+        url = reverse('admin:recyclable_image_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(self.ids(response), [img.id for img in reversed(self.images)])
+        self.assertContains(response, '555')
+        # The containers come with the images, not one query per row.
+        self.assertLess(len(ctx.captured_queries), 10)
+
+        self.assertEqual(self.ids(self.client.get(url, {'container__material_type': 'glass'})), [self.images[-1].id])
+        self.assertEqual(len(self.ids(self.client.get(url, {'crush_degree': '1'}))), 2)
+        self.assertEqual(len(self.ids(self.client.get(url, {'cube_sn': 'cube0'}))), 3)
+
+    def test_keyset_navigation(self) -> None:
+        url = reverse('admin:recyclable_image_changelist')
+        ids = []
+        with mock.patch.object(ImageAdmin, 'list_per_page', 4):
+            query = ''
+            while query is not None:
+                cl = self.client.get(url + query).context['cl']
+                ids += [img.id for img in cl.result_list]
+                query = cl.older_url
+        self.assertEqual(ids, [img.id for img in reversed(self.images)])
+        self.assertEqual(cl.newest_url, '?')
+
+    def test_background_actions(self) -> None:
+        url = reverse('admin:recyclable_image_changelist')
+        alu_images = self.images[:5]
+        response = self.client.post(url, {'action': 'mark_invalid_orientation', 'index': 0,
+                                          '_selected_action': [img.id for img in alu_images[:2]]})
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get(kind='bulk_action')
+        self.assertEqual(job.params, {'action': 'mark_invalid_orientation', 'ids': [img.id for img in alu_images[:2]]})
+        self.assertEqual(Image.objects.filter(valid_orientation=False).count(), 0)
+
+        self.assertEqual(run_worker('test-worker', once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (Job.Status.SUCCEEDED, 1.0))
+        self.assertEqual(Image.objects.filter(valid_orientation=False).count(), 2)
+        counts = ContainerImageCounts.objects.get(container=alu_images[0].container)
+        self.assertEqual((counts.total, counts.bad_orientation, counts.valid, counts.crushed_1), (5, 2, 2, 1))
+        rollups = {deposit_type: sum(CaptureRollup.objects.filter(deposit_type=deposit_type)
+                                     .values_list('count', flat=True)) for deposit_type in ('valid', 'invalid')}
+        self.assertEqual(rollups, {'valid': 4, 'invalid': 2})
+
+        # Select every image of the (filtered) change list.
+        self.client.post(url + '?cube_sn=cube1', {'action': 'delete_images', 'index': 0, 'select_across': 1,
+                                                  '_selected_action': [alu_images[1].id]})
+        run_worker('test-worker', once=True)
+        self.assertEqual(Image.objects.count(), 4)
+        self.assertEqual(ContainerImageCounts.objects.get(container=alu_images[0].container).total, 3)
+        self.assertEqual(sum(CaptureRollup.objects.values_list('count', flat=True)), 4)
+        actions = [name for name, _ in self.client.get(url).context['action_form'].fields['action'].choices]
+        self.assertNotIn('delete_selected', actions)
+
+    def test_estimated_count(self) -> None:
+        self.assertGreater(estimated_count(Image.objects.all()), 0)
+        self.assertEqual(EstimatedCountPaginator(Image.objects.order_by('id'), 2).count, 6)
+
+
+class ProductionApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        alu = mk_container('888', 'brand', 'product', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                           12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        alu.save()
+        for n in range(10):
+            # Pairs of images share a timestamp, so pages must break ties on id.
+            mk_test_image(alu, n, crush_degree=0 if n < 6 else 3, cube_sn=f'cube{n % 2}',
+                          timestamp=datetime(2024, 11, 1 + n // 2, 12, tzinfo=timezone.utc))
+        mk_test_image(alu, 10)
+
+    def setUp(self) -> None:
+        caches['production_api'].clear()
+        self.client.force_login(get_user_model().objects.create_user('tester', password='pw'))
+
+    def post(self, filters: dict) -> Any:
+        return self.client.post(reverse('recyclable:api_containers'), json.dumps(filters),
+                                content_type='application/json')
+
+    def test_keyset_pagination(self) -> None:
+        ids = []
+        cursor = ''
+        for _ in range(5):
+            page = self.post({'cursor': cursor, 'limit': 3}).json()
+            ids += [img['id'] for img in page['images']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        expected = list(Image.objects.filter(timestamp__isnull=False).order_by('-timestamp', '-id')
+                        .values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(ids), 10)
+
+    def test_filters(self) -> None:
+        page = self.post({'start_date': '2024-11-02', 'end_date': '2024-11-03', 'cubes': 'cube1\n'}).json()
+        self.assertEqual([img['cube_sn'] for img in page['images']], ['cube1', 'cube1'])
+        self.assertIsNone(page['next_cursor'])
+
+        self.assertEqual(len(self.post({'deposit_types': ['valid']}).json()['images']), 6)
+        self.assertEqual(len(self.post({'deposit_types': ['invalid']}).json()['images']), 4)
+        self.assertEqual(len(self.post({'deposit_types': ['valid', 'invalid']}).json()['images']), 10)
+        self.assertEqual(len(self.post({'materials': ['GLS']}).json()['images']), 0)
+
+        self.assertEqual(self.post({'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.post({'cursor': 5}).json(), {'error': 'cursor must be a string'})
+        self.assertEqual(self.post({'limit': '10'}).status_code, 400)
+        self.assertEqual(self.post({'start_date': '11/02/2024'}).status_code, 400)
+        self.assertEqual(self.post({'deposit_types': ['maybe']}).status_code, 400)
+        self.assertEqual(self.post({'source': 'bucket'}).status_code, 400)
+
+    def test_captures(self) -> None:
+        for n in range(5):
+            store = f'Safeway148{n % 2}'
+            key = f'collector/captures/{store}/attempts/2024.11.0{1 + n // 2}/image {n}.jpg'
+            S3Object.objects.create(bucket='captures', key=key, store=store, cube_sn=store[-4:],
+                                    capture_date=date(2024, 11, 1 + n // 2))
+
+        ids = []
+        cursor = ''
+        while cursor is not None:
+            page = self.post({'source': 'captures', 'cursor': cursor, 'limit': 2}).json()
+            ids += [capture['id'] for capture in page['images']]
+            cursor = page['next_cursor']
+        self.assertEqual(ids, list(S3Object.objects.order_by('-capture_date', '-id').values_list('id', flat=True)))
+
+        page = self.post({'source': 'captures', 'end_date': '2024-11-02', 'cubes': ['1481']}).json()
+        self.assertEqual([capture['filename'] for capture in page['images']], ['image 3.jpg', 'image 1.jpg'])
+        self.assertTrue(page['images'][0]['url'].endswith('/Safeway1481/attempts/2024.11.02/image%203.jpg'))
+
+        self.assertEqual(self.post({'source': 'captures', 'deposit_types': ['valid', 'invalid']}).status_code, 200)
+        self.assertEqual(self.post({'source': 'captures', 'brand': 'brand'}).status_code, 400)
+        self.assertEqual(self.post({'source': 'captures', 'deposit_types': ['valid']}).status_code, 400)
+
+    def test_errors(self) -> None:
+        with mock.patch('recyclable.views.cached_production_images_page', side_effect=RuntimeError('db password')):
+            response = self.post({})
+        self.assertEqual((response.status_code, response.json()), (500, {'error': 'Internal server error'}))
+
+        self.client.logout()
+        self.assertEqual(self.post({}).status_code, 302)
+
+    def test_response_cache(self) -> None:
+        stats = production_cache_stats.to_dict()
+        first = self.post({'cubes': ['cube1', 'cube0'], 'brand': 'Brand', 'deposit_types': ['valid', 'invalid']})
+        second = self.post({'cubes': 'cube0\ncube1', 'brand': ' brand'})
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(len(first.json()['images']), 10)
+        self.assertEqual(production_cache_stats.hits - stats['hits'], 1)
+        self.assertEqual(production_cache_stats.misses - stats['misses'], 1)
+
+        today = date(2024, 11, 20)
+        closed = canonical_production_filters({'end_date': '2024-11-18'}, '', 60)
+        self.assertEqual(production_cache_ttl(closed, today), settings.PRODUCTION_API_CACHE_TTL_CLOSED)
+        for filters in [{'end_date': '2024-11-19'}, {'start_date': '2024-11-01'}]:
+            canonical = canonical_production_filters(filters, '', 60)
+            self.assertEqual(production_cache_ttl(canonical, today), settings.PRODUCTION_API_CACHE_TTL_OPEN)
+
+
+    @mock.patch('recyclable.views.IMAGE_STREAM_MAX_SECONDS', 0)
+    def test_stream(self) -> None:
+        url = reverse('recyclable:api_containers_stream')
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(get_user_model().objects.get(username='tester'))
+        self.assertEqual(self.client.get(url, {'filters': '{"deposit_types": ["bad"]}'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'filters': '{"source": "captures"}'}).status_code, 400)
+        self.assertEqual(self.client.post(url).status_code, 405)
+        self.assertEqual(self.client.get(reverse('recyclable:api_containers')).status_code, 405)
+
+        def events(response) -> list:
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            body = b''.join(response).decode()
+            return [json.loads(line[len('data: '):]) for line in body.split('\n') if line.startswith('data: ')]
+
+        # Starts after the newest image, so only images inserted later are sent.
+        self.assertEqual(events(self.client.get(url)), [])
+
+        ids = list(Image.objects.filter(cube_sn='cube0').order_by('id').values_list('id', flat=True))
+        response = self.client.get(url, {'filters': json.dumps({'cubes': ['cube0']})},
+                                   HTTP_LAST_EVENT_ID=str(ids[1]))
+        self.assertEqual([[img['id'] for img in images] for images in events(response)], [ids[2:]])
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTests(TestCase):
+
+    def setUp(self) -> None:
+        for histogram in HISTOGRAMS:
+            histogram.clear()
+        count_queries()
+        self.client.force_login(get_user_model().objects.create_user('tester', password='pw'))
+
+    def metrics(self) -> dict[str, float]:
+        response = self.client.get(reverse('recyclable:metrics'))
+        self.assertEqual(response['Content-Type'], METRICS_CONTENT_TYPE)
+        return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+                for line in response.content.decode().splitlines() if not line.startswith('#')}
+
+    def test_request_metrics(self) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('recyclable:index'))
+        # request_started resets connection.queries, so count them before the metrics request.
+        num_queries = len(queries)
+        samples = self.metrics()
+        self.assertEqual(samples['recyclable_request_seconds_count{view="recyclable:index",method="GET",status="200"}'],
+                         1)
+        self.assertEqual(samples['recyclable_request_db_queries_sum{view="recyclable:index"}'], num_queries)
+        self.assertEqual(samples['recyclable_request_db_queries_bucket{view="recyclable:index",le="+Inf"}'], 1)
+
+    @mock.patch('recyclable.views.save_image_bytes')
+    @mock.patch('recyclable.views.upload_image_bytes_to_s3', return_value='etag-metrics')
+    def test_capture_stages(self, upload, save_file) -> None:
+        c = mk_container('559', 'brand', 'product', Container.MaterialType.GLASS, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        percentages = {f'{name}_percentage': 0 for name in CAPTURE_CATEGORIES}
+        response = self.client.post(reverse('recyclable:image'), {
+            'container_id': c.id, 'barcode': c.barcode, 'num_images': 2, **percentages, 'valid_percentage': 100})
+        self.client.post(reverse('recyclable:image'), {
+            'capture_session': response.context['capture_session'], 'i_image': 1, 'image_width': 640,
+            'image_height': 480, 'frame_data_url': 'data:image/png;base64,AAAA'})
+
+        samples = self.metrics()
+        for name in ['session', 'decode', 's3_put', 'write_file', 'db_insert', 'save', 'render']:
+            self.assertEqual(samples[f'recyclable_stage_seconds_count{{stage="capture.{name}"}}'], 1)
+
+    def test_disabled(self) -> None:
+        with override_settings(METRICS_ENABLED=False):
+            with stage('disabled'):
+                pass
+            self.assertEqual(self.client.get(reverse('recyclable:metrics')).status_code, 404)
+        self.assertNotIn('disabled', render_metrics())
+
+
 class ViewsHelpersTests(TestCase):
 
     def test_create_count_classifier_json(self) -> None:
@@ -121,6 +1123,92 @@ class ViewsHelpersTests(TestCase):
         print(f'deposit_json: {deposit_json}')
         # add assertions for the size and deposit JSONs
 
+    def test_create_classifier_jsonl(self) -> None:
+        c = mk_container('111', 'brand', 'product', Container.MaterialType.ALUMINUM, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        img = mk_test_image(c, 1)
+
+        lines = list(create_classifier_jsonl(iter_deposit_classifier_records(), DEFAULT_URL_PREFIX))
+        self.assertEqual(json.loads(lines[0]), {'url_prefix': DEFAULT_URL_PREFIX})
+        record = json.loads(lines[1])
+        # The URL is presigned when AWS credentials are available.
+        self.assertEqual(record.pop('url').split('?')[0], 'images/111/111_1.png')
+        self.assertEqual(record, {'class': 'alu', 'image_id': img.id, 'barcode': '111'})
+
+        compressed = b''.join(compress_stream(lines, 'gzip'))
+        self.assertEqual(gzip.decompress(compressed).decode('utf-8'), ''.join(lines))
+
+    def test_download_deposit_classifier_jsonl(self) -> None:
+        user = get_user_model().objects.create_user('tester', password='pw')
+        self.client.force_login(user)
+        response = self.client.get(reverse('recyclable:download_deposit_classifier'),
+                                   {'format': 'jsonl', 'compression': 'gzip', 'splits': 'train:1'})
+        self.assertEqual(response.status_code, 200)
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8').splitlines()
+        self.assertEqual(json.loads(lines[-1])['split_counts']['ratios'], {'train': 1.0})
+
+    def test_plan_splits(self) -> None:
+        ratios = parse_split_ratios('train:8,val:1,test:1')
+        self.assertAlmostEqual(ratios['train'], 0.8)
+        with self.assertRaises(ValueError):
+            parse_split_ratios('train')
+
+        records = [ClassifierRecord('', 'alu', i, f'a{i}') for i in range(1000)]
+        records += [ClassifierRecord('', 'glass', 1000 + i, f'g{i}') for i in range(25)]
+        records += [ClassifierRecord('', 'pet', 2000 + i, f'p{i}') for i in range(4)]
+        # All images of b0 are in one split, stratified by its most common class, alu.
+        records += [ClassifierRecord('', 'alu', 3000, 'b0'), ClassifierRecord('', 'glass', 3001, 'b0'),
+                    ClassifierRecord('', 'alu', 3002, 'b0')]
+        labels = [ClassifierLabel(r.image_id, r.barcode, r.cls, r.etag) for r in records]
+        plan = plan_splits(labels, ratios)
+        self.assertEqual(plan, plan_splits(reversed(labels), ratios))
+
+        counts: dict[str, Counter] = defaultdict(Counter)
+        for barcode, split in plan.items():
+            counts['a' if barcode == 'b0' else barcode[0]][split] += 1
+        self.assertEqual(counts['a'], {'train': 801, 'val': 100, 'test': 100})
+        self.assertEqual(counts['g'], {'train': 20, 'val': 3, 'test': 2})
+        # Small classes still get a val and a test barcode.
+        self.assertEqual(counts['p'], {'train': 2, 'val': 1, 'test': 1})
+        self.assertEqual(split_sizes(2, ratios), {'train': 2, 'val': 0, 'test': 0})
+
+    def test_create_classifier_splits_json(self) -> None:
+        c = mk_container('222', 'brand', 'product', Container.MaterialType.GLASS, Container.PlasticCode.NA,
+                         12.0, Container.LiquidVolumeUnit.OZ, 15.0, 'USA')
+        c.save()
+        mk_test_image(c, 1)
+        mk_test_image(c, 2)
+        mk_test_image(c, 3, valid_orientation=False)
+
+        ratios = parse_split_ratios('train:0.8,val:0.1,test:0.1')
+        labels = CLASSIFIER_LABELS['deposit_classifier']
+        result = json.loads(create_classifier_splits_json(iter_deposit_classifier_records(), labels(), ratios))
+        # The only glass container is in train.
+        self.assertEqual(result['counts']['train'], {'glass': 2, 'invalid_bad_orientation': 1})
+        self.assertEqual(len(result['splits']['train']['glass']), 2)
+
+        lines = list(create_classifier_splits_jsonl(iter_deposit_classifier_records(), labels(), ratios))
+        self.assertEqual({json.loads(line)['split'] for line in lines[:-1]}, {'train'})
+        self.assertEqual(json.loads(lines[-1])['split_counts']['counts'], result['counts'])
+
+    def test_classifier_labels(self) -> None:
+        # The splits are planned from the labels, so they must match the records that are exported.
+        for volume, material, visual in ((15.0, Container.MaterialType.GLASS, Container.VisualVolume.LT_24OZ),
+                                         (30.0, Container.MaterialType.ALUMINUM, Container.VisualVolume.GT_24OZ)):
+            c = mk_container(f'{int(volume)}', 'brand', 'product', material, Container.PlasticCode.NA,
+                             12.0, Container.LiquidVolumeUnit.OZ, volume, 'USA', visual_volume=visual, ca=True)
+            c.save()
+            mk_test_image(c, 1)
+            mk_test_image(c, 2, crush_degree=2)
+            mk_test_image(c, 3, valid_orientation=False)
+
+        for name, iter_records in (('size_classifier', iter_size_classifier_records),
+                                   ('deposit_classifier', iter_deposit_classifier_records)):
+            labels = list(CLASSIFIER_LABELS[name]())
+            records = [ClassifierLabel(r.image_id, r.barcode, r.cls, r.etag) for r in iter_records()]
+            self.assertCountEqual(labels, records)
+            self.assertEqual(len(labels), 2 if name == 'size_classifier' else 6)
 
 # class ContainerModelTests(TestCase):
 #
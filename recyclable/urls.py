@@ -12,7 +12,18 @@ urlpatterns = [
     path('classifiers', views.classifiers, name='classifiers'),
     path('download_size_classifier', views.download_size_classifier, name='download_size_classifier'),
     path('download_deposit_classifier', views.download_deposit_classifier, name='download_deposit_classifier'),
+    path('jobs/classifiers/<str:name>', views.enqueue_classifier_export, name='enqueue_classifier_export'),
+    path('jobs/<int:job_id>', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/artifact', views.job_artifact, name='job_artifact'),
     path('production_images/', views.production_images, name='production_images'),
     path('production_images/grid/', views.production_image_grid, name='production_image_grid'),
+    path('images/<int:image_id>', views.image_proxy, name='image_proxy'),
     path('api/containers/', views.api_containers, name='api_containers'),
+    path('api/containers/cache_stats', views.api_containers_cache_stats, name='api_containers_cache_stats'),
+    path('api/containers/stream', views.api_containers_stream, name='api_containers_stream'),
+    path('api/containers/lookup', views.api_container_lookup, name='api_container_lookup'),
+    path('api/containers/upsert', views.api_container_upsert, name='api_container_upsert'),
+    path('api/containers/search', views.api_container_search, name='api_container_search'),
+    path('api/capture_rollups', views.api_capture_rollups, name='api_capture_rollups'),
+    path('metrics', views.metrics, name='metrics'),
 ]
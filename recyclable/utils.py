@@ -1,14 +1,21 @@
 import csv
 import logging
 import base64
+import zlib
 from dataclasses import dataclass
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Iterable, Iterator
 from io import BytesIO
+from urllib.parse import unquote
 
 import boto3 as boto3
 from cv2 import Mat
 from PIL import Image
 
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
 
 def convert_spaces_to_pluses(s: str) -> str:
     return s.replace(' ', '+')
@@ -40,15 +47,27 @@ def save_image_file(fp: str, image_base64: str) -> None:
     img.save(fp, 'PNG')
 
 
+def image_bytes_from_data_url(image_base64: str) -> bytes:
+    return base64.b64decode(image_base64.split(',')[1])
+
+
+def save_image_bytes(fp: str, image_data: bytes) -> None:
+    # Captures are already PNGs, so they are written as is; decoding and re-encoding one costs ~100 ms of CPU.
+    with open(fp, 'wb') as f:
+        f.write(image_data)
+
+
 def s3_data_from_object_url(url: str) -> Tuple[str, str, str]:
     # The URL has the form:
     # https://{bucket_name}.s3.{region_name}.amazonaws.com/{s3_object_key}
     # This function returns the bucket_name, region_name and s3_object_key
 
-    url_minus_protocol = url.split('//')[1]
+    # Presigned URLs also have a query string, and a percent-encoded key.
+
+    url_minus_protocol = url.split('//')[1].split('?')[0]
     bucket_name = url_minus_protocol.split('.')[0]
     region_name = url_minus_protocol.split('.')[2]
-    s3_object_key = url_minus_protocol.split('amazonaws.com/')[1]
+    s3_object_key = unquote(url_minus_protocol.split('amazonaws.com/')[1])
     return bucket_name, region_name, s3_object_key
 
 
@@ -67,12 +86,43 @@ def read_csv_with_headers(file_path: str) -> List[Dict[str, str]]:
 BUCKET_NAME: str = 'olyns-recyclable'
 
 
+COMPRESSIONS: Tuple[str, ...] = ('none', 'gzip', 'zstd')
+COMPRESSION_EXTENSIONS: Dict[str, str] = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+COMPRESSION_CONTENT_TYPES: Dict[str, str] = {'none': 'application/x-ndjson', 'gzip': 'application/gzip',
+                                             'zstd': 'application/zstd'}
+
+
+def compress_stream(chunks: Iterable[str], compression: str) -> Iterator[bytes]:
+    """Encodes and compresses chunks as they are produced, so the whole payload is never held in memory."""
+    if compression == 'none':
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+
+    if compression == 'gzip':
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd compression requires the zstandard package')
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        raise ValueError(f'Unknown compression: {compression}')
+
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 def upload_jpeg_base64_to_s3(s3_object_key: str, image_base64: str):
-    data = image_base64.split(',')[1]
-    image_data = base64.b64decode(data)
+    return upload_image_bytes_to_s3(s3_object_key, image_bytes_from_data_url(image_base64))
+
+
+def upload_image_bytes_to_s3(s3_object_key: str, image_data: bytes) -> str:
     image_buffer = BytesIO(image_data)
     ctype = 'image/png'
-    logging.debug(f'upload_jpeg_base64_to_s3() - ctype: {ctype}')
+    logging.debug(f'upload_image_bytes_to_s3() - ctype: {ctype}')
     s3_client = boto3.client('s3')  # get client higher and pass down?
     response = s3_client.put_object(Bucket=BUCKET_NAME, Body=image_buffer, Key=s3_object_key,
                          ACL='private', ContentType=ctype)
@@ -1,21 +1,72 @@
+import asyncio
 import logging
+import mimetypes
 import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any
+from functools import wraps
+from typing import Any, List
 from uuid import uuid4
 import re
 
 
+import boto3
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.db import IntegrityError, transaction
 from django.shortcuts import render
-from django.http import HttpResponse, HttpRequest, JsonResponse
+from django.urls import reverse
+from django.http import HttpResponse, HttpRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse, \
+    FileResponse
+from django.utils.cache import get_conditional_response
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.http import require_http_methods
 import json
 
-from recyclable.models import Container, Image, mk_null_container
-from recyclable.utils import save_image_file, upload_jpeg_base64_to_s3, BUCKET_NAME
-from recyclable.views_helpers import create_size_classifier_json, create_deposit_classifier_json
+from recyclable.capture_sessions import CaptureSession, allocate_counts, create_capture_session, \
+    end_capture_session, get_capture_session
+from recyclable.db_routers import use_replica, iter_on_replica
+from recyclable.image_cache import THUMBNAIL_WIDTHS, RangeFile, image_etag, open_cached_image, parse_range
+from recyclable.jobs import enqueue_job
+from recyclable.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics, stage, timed, timed_iter
+from recyclable.models import Container, ContainerImageCounts, Image, Job, mk_null_container, DEPOSIT_STATES, \
+    states_to_bitmask, increment_image_counts
+from recyclable.utils import image_bytes_from_data_url, save_image_bytes, upload_image_bytes_to_s3, BUCKET_NAME, \
+    COMPRESSIONS, COMPRESSION_EXTENSIONS, COMPRESSION_CONTENT_TYPES, compress_stream, zstandard
+from recyclable.views_helpers import create_size_classifier_json, create_deposit_classifier_json, \
+    create_classifier_jsonl, iter_size_classifier_records, iter_deposit_classifier_records, DEFAULT_URL_PREFIX, \
+    parse_split_ratios, create_classifier_splits_json, create_classifier_splits_jsonl, CLASSIFIER_EXPORTS, \
+    CLASSIFIER_LABELS, \
+    cached_production_images_page, production_cache_stats, PRODUCTION_PAGE_SIZE, capture_rollup_rows, \
+    latest_image_id, production_images_after, production_images_query, MAX_CONTAINER_BATCH, lookup_containers, \
+    upsert_containers, CONTAINER_SEARCH_LIMIT, search_containers
+
+# Django 4.2's login_required and require_http_methods only wrap sync views.
+
+def async_login_required(view):
+    """login_required for async views."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+def async_require_http_methods(methods: List[str]):
+    """require_http_methods for async views."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
 
 def index(_) -> HttpResponse:
     return render(_, "recyclable/index.html")
@@ -109,27 +160,25 @@ def num_images(request) -> HttpResponse:
     return render(request, "recyclable/num_images.html", get_container_context(c, barcode, message))
 
 
-@login_required
-def image(request) -> HttpResponse:
+@async_login_required
+async def image(request) -> HttpResponse:
     if request.method == 'POST':
         # Check if 'frame_data_url' is in POST data
         frame_data_url = request.POST.get('frame_data_url', '')
         if frame_data_url:
             # Handle image capture
-            return handle_image_capture(request)
+            return await handle_image_capture(request)
         else:
             # Handle initial submission with percentages
-            return handle_initial_submission(request)
+            return await sync_to_async(handle_initial_submission)(request)
     else:
         # Handle GET request if necessary
         return HttpResponse("Error: GET method not supported.", status=405)
 
-def handle_image_capture(request: HttpRequest) -> HttpResponse:
+async def handle_image_capture(request: HttpRequest) -> HttpResponse:
     # Get data from image.html after capturing an image
-    container_id = request.POST.get('container_id')
-    barcode = request.POST.get('barcode')
+    capture_session_id = request.POST.get('capture_session', '')
     i_image = request.POST.get('i_image')
-    num_images = request.POST.get('num_images')
     image_width = request.POST.get('image_width', '')
     image_height = request.POST.get('image_height', '')
 
@@ -142,102 +191,62 @@ def handle_image_capture(request: HttpRequest) -> HttpResponse:
         return HttpResponse("Error: Invalid image dimensions.", status=400)
 
     # Validate required fields
-    if not container_id or not i_image or not num_images:
+    if not capture_session_id or not i_image:
         logging.error("handle_image_capture() - Missing required data for image saving.")
         return HttpResponse("Error: Missing required data.", status=400)
 
-    # Convert to integers
     try:
-        container_id = int(container_id)
         i_image = int(i_image)
-        num_images = int(num_images)
     except ValueError:
-        logging.error(f"handle_image_capture() - Invalid data format - container_id: {container_id}, i_image: {i_image}, num_images: {num_images}")
+        logging.error(f"handle_image_capture() - Invalid data format - i_image: {i_image}")
         return HttpResponse("Error: Invalid data format.", status=400)
 
-    # Reconstruct counts from POST data
-    counts = {}
-    counts_list = []
-    for key in request.POST:
-        if key.startswith('counts['):
-            name = key[7:-1]  # Extract the name
-            count = request.POST.get(key)
-            try:
-                count = int(count)
-                counts[name] = count
-                counts_list.append((name, count))
-            except ValueError:
-                logging.error(f"handle_image_capture() - Invalid count value for {name}: {count}")
-                return HttpResponse("Error: Invalid count value.", status=400)
-
-    # Get container
-    try:
-        c = Container.objects.get(pk=container_id)
-    except Container.DoesNotExist:
-        logging.error(f"handle_image_capture() - Container with id {container_id} does not exist.")
-        return HttpResponse("Error: Container does not exist.", status=400)
-
-    # Initialize category mapping
-    category_to_crush_degree = {
-        "valid": 0,
-        "crushed_1": 1,
-        "crushed_2": 2,
-        "crushed_3": 3,
-        "crushed_4": 4,
-        "bad_orientation": -1,
-        "no_label": -1,
-    }
-
-    # Determine category based on the current i_image
-    total = 0
-    category = 'unknown'
-    for name, count in counts_list:
-        total += count
-        if i_image <= total:
-            category = name
-            break
-
-    # Assign crush degree based on the category
-    crush_degree = category_to_crush_degree.get(category, -1)
+    # The capture session holds the container and the category of every capture
+    with stage('capture.session'):
+        capture = await sync_to_async(get_capture_session)(request.session, capture_session_id)
+    if capture is None:
+        return await sync_to_async(render)(request, 'recyclable/barcode.html',
+                                           {'message': 'The capture session has expired. Please start again.'})
+    if not 1 <= i_image <= capture.num_images:
+        logging.error(f"handle_image_capture() - i_image {i_image} is out of range 1..{capture.num_images}")
+        return HttpResponse("Error: Invalid data format.", status=400)
 
     # Save the image
     frame_data_url = request.POST.get('frame_data_url', '')
     if frame_data_url:
-        save_image(
-            frame_data_url,
-            c,
-            crush_degree=crush_degree,
-            category=category,
-            image_width=image_width,
-            image_height=image_height,
-        )
+        with stage('capture.save'):
+            await save_image(
+                frame_data_url,
+                capture.container(),
+                crush_degree=capture.crush_degree(i_image),
+                category=capture.category(i_image),
+                image_width=image_width,
+                image_height=image_height,
+            )
 
     # Increment i_image for the next image
     i_image += 1
 
     # Check if all images have been captured
-    if i_image > num_images:
-        return render(request, 'recyclable/barcode.html', {'message': 'All images have been captured.'})
+    # Rendering may load the session user, so it runs in the request's sync thread.
+    if i_image > capture.num_images:
+        await sync_to_async(end_capture_session)(request.session, capture.id)
+        return await sync_to_async(render)(request, 'recyclable/barcode.html',
+                                           {'message': 'All images have been captured.'})
     else:
-        # Determine category based on the new i_image
-        total = 0
-        category = 'unknown'
-        for name, count in counts_list:
-            total += count
-            if i_image <= total:
-                category = name
-                break
-
         # Render image.html for the next image
-        return render(request, "recyclable/image.html", {
-            'container_id': container_id,
-            'barcode': barcode,
-            'i_image': i_image,
-            'num_images': num_images,
-            'counts': counts,
-            'counts_list': counts_list,
-            'category': category,
-        })
+        with stage('capture.render'):
+            return await sync_to_async(render)(request, "recyclable/image.html", capture_context(capture, i_image))
+
+def capture_context(capture: CaptureSession, i_image: int) -> dict[str, Any]:
+    return {
+        'capture_session': capture.id,
+        'container_id': capture.container_id,
+        'barcode': capture.barcode,
+        'i_image': i_image,
+        'num_images': capture.num_images,
+        'category': capture.category(i_image),
+    }
 
 def handle_initial_submission(request: HttpRequest) -> HttpResponse:
     # This is the initial submission from num_images.html with percentages
@@ -308,71 +317,27 @@ def handle_initial_submission(request: HttpRequest) -> HttpResponse:
             'message': message,
         })
 
-    # Calculate counts based on percentages
+    # Plan the categories of all the captures once; each capture request then looks its category up
     num_images = int(num_images_str)
-    categories = [
-        ('valid', valid_percentage),
-        ('bad_orientation', bad_orientation_percentage),
-        ('crushed_1', crushed_1_percentage),
-        ('crushed_2', crushed_2_percentage),
-        ('crushed_3', crushed_3_percentage),
-        ('no_label', no_label_percentage),
-        ('crushed_4', crushed_4_percentage),
-    ]
-
-    # Calculate exact counts
-    exact_counts = [(name, num_images * (perc / 100)) for name, perc in categories]
-
-    # Calculate integer counts and distribute remaining images
-    int_counts = []
-    fractional_parts = []
-    total_int_counts = 0
-    for name, exact_count in exact_counts:
-        int_count = int(exact_count)
-        int_counts.append((name, int_count))
-        fractional_parts.append((name, exact_count - int_count))
-        total_int_counts += int_count
-
-    remaining_images = num_images - total_int_counts
-    fractional_parts.sort(key=lambda x: x[1], reverse=True)
-    for i in range(remaining_images):
-        name, _ = fractional_parts[i]
-        for j in range(len(int_counts)):
-            if int_counts[j][0] == name:
-                int_counts[j] = (name, int_counts[j][1] + 1)
-                break
-
-    counts = dict(int_counts)
-    counts_list = int_counts
-
-    # Initialize i_image
-    i_image = 1
-
-    # Determine category for the first image
-    total = 0
-    category = 'unknown'
-    for name, count in counts_list:
-        total += count
-        if i_image <= total:
-            category = name
-            break
+    counts_list = allocate_counts(num_images, {
+        'valid': valid_percentage,
+        'bad_orientation': bad_orientation_percentage,
+        'crushed_1': crushed_1_percentage,
+        'crushed_2': crushed_2_percentage,
+        'crushed_3': crushed_3_percentage,
+        'no_label': no_label_percentage,
+        'crushed_4': crushed_4_percentage,
+    })
 
     # Get the container
     try:
         c = Container.objects.get(pk=container_id)
-    except Container.DoesNotExist:
+    except (Container.DoesNotExist, ValueError):
         logging.error(f"handle_initial_submission() - Container with id {container_id} does not exist.")
         return HttpResponse("Error: Container does not exist.", status=400)
 
-    return render(request, "recyclable/image.html", {
-        'container_id': container_id,
-        'barcode': barcode,
-        'i_image': i_image,
-        'num_images': num_images,
-        'counts': counts,
-        'counts_list': counts_list,
-        'category': category,
-    })
+    capture = create_capture_session(request.session, c, num_images, counts_list)
+    return render(request, "recyclable/image.html", capture_context(capture, 1))
 # @login_required
 # def image(request) -> HttpResponse:
 #     if request.method == 'POST':
@@ -633,56 +598,231 @@ def classifiers(_) -> HttpResponse:
     return render(_, 'recyclable/classifiers.html')
 
 @login_required
-def download_size_classifier(_) -> HttpResponse:
+def download_size_classifier(request) -> HttpResponse:
+    return classifier_response(request, 'size_classifier', create_size_classifier_json,
+                               iter_size_classifier_records)
+
+@login_required
+def download_deposit_classifier(request) -> HttpResponse:
+    return classifier_response(request, 'deposit_classifier', create_deposit_classifier_json,
+                               iter_deposit_classifier_records)
+
+def classifier_response(request: HttpRequest, name: str, create_json, iter_records) -> HttpResponse:
+    # Query parameters:
+    #   format=jsonl              stream one record per line instead of a single JSON object
+    #   compression=none|gzip|zstd (jsonl only, default gzip)
+    #   factor_prefix=1           (jsonl only) strip the common URL prefix from every record
+    #   splits=train:0.8,val:0.1,test:0.1  assign train/val/test splits by barcode, stratified by class, and add
+    #                             per-split class counts
+    splits = request.GET.get('splits', '')
+    ratios = None
+    if splits:
+        try:
+            ratios = parse_split_ratios(splits)
+        except ValueError as e:
+            return HttpResponse(f"Error: {e}", status=400)
+
+    if request.GET.get('format') == 'jsonl':
+        return classifier_jsonl_response(request, name, iter_records, ratios)
+
     response = HttpResponse(content_type="text/json")
-    response['Content-Disposition'] = 'attachment; filename="size_classifier.json"'
-    json = create_size_classifier_json()
+    with use_replica(), stage(f'export.{name}.json'):
+        if ratios:
+            response['Content-Disposition'] = f'attachment; filename="{name}_splits.json"'
+            json = create_classifier_splits_json(iter_records(), CLASSIFIER_LABELS[name](), ratios)
+        else:
+            response['Content-Disposition'] = f'attachment; filename="{name}.json"'
+            json = create_json()
     response.write(json)
     return response
 
+def classifier_jsonl_response(request: HttpRequest, name: str, iter_records, ratios=None) -> HttpResponse:
+    compression = request.GET.get('compression', 'gzip')
+    if compression not in COMPRESSIONS:
+        return HttpResponse(f"Error: Unknown compression {compression}.", status=400)
+    if compression == 'zstd' and zstandard is None:
+        return HttpResponse("Error: zstd compression is not available on this server.", status=400)
+
+    url_prefix = DEFAULT_URL_PREFIX if request.GET.get('factor_prefix') in ['1', 'true'] else ''
+    if ratios:
+        lines = create_classifier_splits_jsonl(iter_records(), CLASSIFIER_LABELS[name](), ratios, url_prefix)
+    else:
+        lines = create_classifier_jsonl(iter_records(), url_prefix)
+
+    # The records are read while the response streams, after this view has returned.
+    chunks = timed_iter(f'export.{name}.jsonl', compress_stream(lines, compression))
+    response = StreamingHttpResponse(iter_on_replica(chunks), content_type=COMPRESSION_CONTENT_TYPES[compression])
+    response['Content-Disposition'] = f'attachment; filename="{name}.jsonl{COMPRESSION_EXTENSIONS[compression]}"'
+    return response
+
 @login_required
-def download_deposit_classifier(_) -> HttpResponse:
-    response = HttpResponse(content_type="text/json")
-    response['Content-Disposition'] = 'attachment; filename="deposit_classifier.json"'
-    json = create_deposit_classifier_json()
-    response.write(json)
+@require_http_methods(["POST"])
+def enqueue_classifier_export(request, name: str) -> HttpResponse:
+    """Starts a classifier export as a background job instead of building it inside the request.  Accepts the
+    same parameters as the download views and returns the job id."""
+    if name not in CLASSIFIER_EXPORTS:
+        return JsonResponse({"error": f"Unknown classifier {name}"}, status=404)
+
+    params = {key: request.POST.get(key) for key in ['format', 'compression', 'factor_prefix', 'splits']
+              if request.POST.get(key)}
+    try:
+        if params.get('splits'):
+            parse_split_ratios(params['splits'])
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if params.get('compression', 'gzip') not in COMPRESSIONS:
+        return JsonResponse({"error": f"Unknown compression {params['compression']}"}, status=400)
+
+    job = enqueue_job(name, params)
+    return JsonResponse({"job_id": job.id, "status": job.status}, status=202)
+
+@login_required
+def job_status(request, job_id: int) -> HttpResponse:
+    try:
+        job = Job.objects.get(pk=job_id)
+    except Job.DoesNotExist:
+        return JsonResponse({"error": "Job does not exist"}, status=404)
+
+    return JsonResponse({
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "artifact_url": reverse('recyclable:job_artifact', args=[job.id]) if job.artifact_s3_object_key else None,
+    })
+
+@login_required
+def job_artifact(request, job_id: int) -> HttpResponse:
+    try:
+        job = Job.objects.get(pk=job_id, status=Job.Status.SUCCEEDED)
+    except Job.DoesNotExist:
+        return HttpResponse("Error: Job does not exist or has not finished.", status=404)
+    if not job.artifact_s3_object_key:
+        return HttpResponse("Error: Job has no artifact.", status=404)
+
+    s3_client = boto3.client('s3')
+    s3_object = s3_client.get_object(Bucket=BUCKET_NAME, Key=job.artifact_s3_object_key)
+    response = StreamingHttpResponse(s3_object['Body'].iter_chunks(), content_type=s3_object['ContentType'])
+    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(job.artifact_s3_object_key)}"'
     return response
 
-def save_image(frame_data_url: Any, container: Container, crush_degree: int, category: str, image_width: float, image_height: float):
+# Captured images are never rewritten in place, so browsers may keep them for a year.
+IMAGE_PROXY_MAX_AGE = 365 * 24 * 60 * 60
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def image_proxy(request, image_id: int) -> HttpResponse:
+    """Serves an image, or a thumbnail of it with ?w=<width>, from the on-disk image cache.  Supports
+    If-None-Match (304) and single byte ranges (206); files are streamed with the server's file wrapper."""
+    width = None
+    if request.GET.get('w'):
+        try:
+            width = int(request.GET['w'])
+        except ValueError:
+            width = -1
+        if width not in THUMBNAIL_WIDTHS:
+            return HttpResponse(f"Error: w must be one of {', '.join(map(str, THUMBNAIL_WIDTHS))}.", status=400)
+
+    try:
+        img = Image.objects.only('aws_entity_tag', 's3_bucket_name', 'aws_region_name', 's3_object_key') \
+            .get(pk=image_id)
+    except Image.DoesNotExist:
+        return HttpResponse("Error: Image does not exist.", status=404)
+
+    etag = image_etag(img, width)
+    cache_headers = {'ETag': etag, 'Cache-Control': f'private, max-age={IMAGE_PROXY_MAX_AGE}', 'Accept-Ranges': 'bytes'}
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            f = open_cached_image(img, width)
+        except Exception as e:
+            logging.error(f'image_proxy() - error caching image {image_id}: {e}')
+            return HttpResponse("Error: Image could not be fetched.", status=502)
+
+        content_type = 'image/jpeg' if width else mimetypes.guess_type(img.s3_object_key)[0] or 'image/png'
+        # The open file stays readable even if it is evicted now.
+        size = os.fstat(f.fileno()).st_size
+        byte_range = None
+        if 'HTTP_RANGE' in request.META and request.META.get('HTTP_IF_RANGE', etag) == etag:
+            try:
+                byte_range = parse_range(request.META['HTTP_RANGE'], size)
+            except ValueError:
+                f.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if byte_range is None:
+            response = FileResponse(f, content_type=content_type)
+        else:
+            start, end = byte_range
+            f.seek(start)
+            response = FileResponse(RangeFile(f, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    for header, value in cache_headers.items():
+        response[header] = value
+    return response
+
+# S3 uploads and file writes from async views wait on I/O, so they get more threads than the default executor's
+# CPU count + 4; otherwise a few slow uploads would queue every other tablet's.
+CAPTURE_IO_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix='capture-io')
+
+async def save_image(frame_data_url: Any, container: Container, crush_degree: int, category: str, image_width: float, image_height: float):
     try:
         image_name = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
         file_name = f'{container.barcode}_{image_name}.png'
         s3_object_key = f'images/{container.barcode}/{file_name}'
 
+        # Decoding, the S3 upload and the local copy run in worker threads instead of on the event loop, and the
+        # upload and the copy run concurrently.
+        image_data = await sync_to_async(timed('capture.decode')(image_bytes_from_data_url),
+                                         thread_sensitive=False)(frame_data_url)
+
         SAVE_TO_S3 = True
         if SAVE_TO_S3:
-            etag = upload_jpeg_base64_to_s3(s3_object_key, frame_data_url)
+            upload = sync_to_async(timed('capture.s3_put')(upload_image_bytes_to_s3), thread_sensitive=False,
+                                   executor=CAPTURE_IO_EXECUTOR)(s3_object_key, image_data)
         else:
-            etag = uuid4()
+            upload = asyncio.sleep(0, result=uuid4())
 
         SAVE_TO_DISK = True
         if SAVE_TO_DISK:
             fp = os.path.join('/tmp', file_name)
-            save_image_file(fp, frame_data_url)
+            copy = sync_to_async(timed('capture.write_file')(save_image_bytes), thread_sensitive=False,
+                                 executor=CAPTURE_IO_EXECUTOR)(fp, image_data)
+        else:
+            copy = asyncio.sleep(0)
 
-        # Set valid_orientation based on category
-        valid_orientation = False if category == 'bad_orientation' else True
+        etag, _ = await asyncio.gather(upload, copy)
+        await sync_to_async(timed('capture.db_insert')(create_captured_image))(
+            container, etag, s3_object_key, crush_degree, category, image_width, image_height)
+    except Exception as e:
+        logging.error(f'save_image() - exception saving image for container {container.barcode}: {e}')
 
-        # Set orientation_style based on valid_orientation
-        if valid_orientation:
-            orientation_style = Image.Orientation.PARALLEL
-        else:
-            orientation_style = Image.Orientation.UNKNOWN
+def create_captured_image(container: Container, etag: str, s3_object_key: str, crush_degree: int, category: str,
+                          image_width: float, image_height: float) -> Image:
+    # Set valid_orientation based on category
+    valid_orientation = False if category == 'bad_orientation' else True
 
-        # Set label based on category
-        if category in ['valid', 'crushed_1', 'crushed_2', 'crushed_3']:
-            label = Image.LabelType.BODY_ONLY
-        elif category in ['bad_orientation', 'no_label', 'crushed_4']:
-            label = Image.LabelType.NEITHER
-        else:
-            label = Image.LabelType.BODY_ONLY
+    # Set orientation_style based on valid_orientation
+    if valid_orientation:
+        orientation_style = Image.Orientation.PARALLEL
+    else:
+        orientation_style = Image.Orientation.UNKNOWN
 
-        Image.objects.create(
+    # Set label based on category
+    if category in ['valid', 'crushed_1', 'crushed_2', 'crushed_3']:
+        label = Image.LabelType.BODY_ONLY
+    elif category in ['bad_orientation', 'no_label', 'crushed_4']:
+        label = Image.LabelType.NEITHER
+    else:
+        label = Image.LabelType.BODY_ONLY
+
+    with transaction.atomic():
+        img = Image.objects.create(
             container=container,
             aws_entity_tag=etag,
             s3_bucket_name=BUCKET_NAME,
@@ -695,8 +835,8 @@ def save_image(frame_data_url: Any, container: Container, crush_degree: int, cat
             image_width=image_width,
             image_height=image_height,
         )
-    except Exception as e:
-        logging.error(f'save_image() - exception saving image for container {container.barcode}: {e}')
+        increment_image_counts(container, category)
+    return img
 
 def update_container_from_request(c: Container, request: HttpRequest) -> None:
     c.barcode: str = request.POST.get('barcode', '')
@@ -722,17 +862,7 @@ def update_container_from_request(c: Container, request: HttpRequest) -> None:
     c.ribbed: str = request.POST.get('ribbed', '')
     c.ringed: str = request.POST.get('ringed', '')
     c.visual_volume: str = request.POST.get('visual_volume', '')
-    c.ca: bool = 'ca' in request.POST
-    c.ct: bool = 'ct' in request.POST
-    c.gu: bool = 'gu' in request.POST
-    c.hi: bool = 'hi' in request.POST
-    c.ia: bool = 'ia' in request.POST
-    c.me: bool = 'me' in request.POST
-    c.ma: bool = 'ma' in request.POST
-    c.mi: bool = 'mi' in request.POST
-    c.ny: bool = 'ny' in request.POST
-    c.Or: bool = 'Or' in request.POST
-    c.vt: bool = 'vt' in request.POST
+    c.deposit_states: int = states_to_bitmask(state for state in DEPOSIT_STATES if state.lower() in request.POST)
 
 def get_container_context(container, barcode, message=''):
     return {
@@ -756,11 +886,14 @@ def get_container_context(container, barcode, message=''):
         'ribbed_types': Container._meta.get_field('ribbed').choices,
         'ringed_types': Container._meta.get_field('ringed').choices,
         'visual_volumes': Container._meta.get_field('visual_volume').choices,
+        'deposit_states': [(state, container.eligible_in(state)) for state in DEPOSIT_STATES],
+        'image_counts': ContainerImageCounts.objects.filter(container_id=container.id).first(),
     }
 
 def production_images(request):
     return render(request, 'recyclable/production_images.html')
 
+@ensure_csrf_cookie
 def production_image_grid(request):
     # Get filter parameters from request.GET
     start_date = request.GET.get('startDate')
@@ -778,28 +911,171 @@ def production_image_grid(request):
     }
     return render(request, 'recyclable/production_image_grid.html', context)
 
-@require_http_methods(["POST"])
-def api_containers(request):
-    """API endpoint for fetching container images based on filters"""
+@async_login_required
+@async_require_http_methods(["POST"])
+async def api_containers(request):
+    """API endpoint for fetching container images based on filters.
+
+    The JSON body holds the filters (start_date, end_date, deposit_types, cubes, materials, sizes, brand, product,
+    upc), plus the optional cursor of the page to fetch and a page limit.  "source": "captures" lists the imager
+    captures indexed from S3 instead of the images in the database.  Returns {"images": [...], "next_cursor": ...};
+    next_cursor is null on the last page."""
     try:
         filters = json.loads(request.body)
-        
-        # TODO: Implement AWS query logic
-        # example response_data
-        response_data = {
-            "images": [
-                {
-                    "id": "1",
-                    "url": "https://static-olyns.olyns.com/collector/captures/Safeway1483/attempts/2024.11.10/image1.jpg",
-                    "filename": "image1.jpg"
-                }
-                # more images...
-            ]
-        }
-        
-        return JsonResponse(response_data)
+        if not isinstance(filters, dict):
+            return JsonResponse({"error": "Invalid JSON data"}, status=400)
+        cursor = filters.get('cursor') or ''
+        limit = filters.get('limit') or PRODUCTION_PAGE_SIZE
+        if not isinstance(cursor, str):
+            return JsonResponse({"error": "cursor must be a string"}, status=400)
+        if not isinstance(limit, int) or isinstance(limit, bool):
+            return JsonResponse({"error": "limit must be an integer"}, status=400)
+        # The query and URL signing run in the request's sync thread, leaving the event loop free.
+        page, hit = await sync_to_async(use_replica()(cached_production_images_page))(filters, cursor, limit)
+        response = JsonResponse(page, json_dumps_params={'separators': (',', ':')})
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
+        logging.error(f'api_containers() - {e}')
+        logging.error(traceback.format_exc())
+        return JsonResponse({"error": "Internal server error"}, status=500)
+
+@login_required
+@require_http_methods(["GET"])
+@use_replica()
+def api_capture_rollups(request) -> HttpResponse:
+    """Production image counts from the capture rollups.  Query parameters: start_date, end_date (inclusive,
+    YYYY-MM-DD), cubes, stores and deposit_types (comma-separated), and group_by (comma-separated, some of
+    day, cube_sn, store_name and deposit_type; default day).  Returns {"rows": [{..., "count": n}, ...]}."""
+    def split(name: str) -> List[str]:
+        return [value.strip() for value in request.GET.get(name, '').split(',') if value.strip()]
+
+    try:
+        rows = capture_rollup_rows(request.GET.get('start_date', ''), request.GET.get('end_date', ''),
+                                   split('cubes'), split('stores'), split('deposit_types'),
+                                   split('group_by') or ['day'])
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({"rows": rows}, json_dumps_params={'separators': (',', ':')})
+
+# Live stream of new production images (server-sent events).  Each stream polls for new ids every
+# IMAGE_STREAM_POLL_INTERVAL seconds and ends after IMAGE_STREAM_MAX_SECONDS; EventSource then reconnects on its
+# own, resuming after the Last-Event-ID it was sent.
+IMAGE_STREAM_POLL_INTERVAL = 2.0
+IMAGE_STREAM_KEEPALIVE = 15.0
+IMAGE_STREAM_MAX_SECONDS = 300.0
+
+@async_login_required
+@async_require_http_methods(["GET"])
+async def api_containers_stream(request) -> HttpResponse:
+    """Streams the production images inserted from now on that match ?filters=<the api_containers filters as
+    JSON>, as "images" events of [image, ...] oldest first.  ?after=<image id> starts after that image instead."""
+    try:
+        filters = json.loads(request.GET.get('filters') or '{}')
+        if not isinstance(filters, dict):
+            raise ValueError('filters must be a JSON object')
+        if (filters.get('source') or 'images') != 'images':
+            raise ValueError('Only images can be streamed')
+        production_images_query(filters)  # validates the filters
+        after = request.headers.get('Last-Event-ID') or request.GET.get('after')
+        after = int(after) if after else await sync_to_async(use_replica()(latest_image_id))()
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    poll = sync_to_async(use_replica()(production_images_after))
+
+    async def events():
+        last_id = after
+        yield 'retry: 5000\n\n'
+        deadline = time.monotonic() + IMAGE_STREAM_MAX_SECONDS
+        idle = 0.0
+        while True:
+            images = await poll(filters, last_id)
+            if images:
+                last_id = images[-1]['id']
+                yield f'id: {last_id}\nevent: images\ndata: {json.dumps(images, separators=(",", ":"))}\n\n'
+                idle = 0.0
+            elif idle >= IMAGE_STREAM_KEEPALIVE:
+                yield ': keepalive\n\n'
+                idle = 0.0
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(IMAGE_STREAM_POLL_INTERVAL)
+            idle += IMAGE_STREAM_POLL_INTERVAL
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+@login_required
+@require_http_methods(["POST"])
+def api_container_lookup(request) -> HttpResponse:
+    """Looks up to MAX_CONTAINER_BATCH barcodes at once.  The JSON body is {"barcodes": [...]}.  Returns
+    {"containers": {barcode: container, ...}, "missing": [barcode, ...]}."""
+    try:
+        barcodes = json.loads(request.body).get('barcodes')
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    if not isinstance(barcodes, list) or not all(isinstance(barcode, str) for barcode in barcodes):
+        return JsonResponse({"error": "barcodes must be a list of strings"}, status=400)
+    if len(barcodes) > MAX_CONTAINER_BATCH:
+        return JsonResponse({"error": f"At most {MAX_CONTAINER_BATCH} barcodes per request"}, status=400)
+
+    containers = lookup_containers(barcodes)
+    missing = [barcode for barcode in dict.fromkeys(barcodes) if barcode not in containers]
+    return JsonResponse({"containers": containers, "missing": missing})
+
+@login_required
+@require_http_methods(["POST"])
+def api_container_upsert(request) -> HttpResponse:
+    """Creates or updates up to MAX_CONTAINER_BATCH containers, keyed on barcode, in one transaction.  The JSON
+    body is {"containers": [{"barcode": ..., field: value, ...}, ...]}, with the Container field names and
+    deposit_states as a list of states.  New containers need material_type, plastic_code and liquid_volume_unit.
+    Returns {"results": [{"barcode", "status", "id" or "errors"}, ...]}, one per container in order."""
+    try:
+        items = json.loads(request.body).get('containers')
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    if not isinstance(items, list):
+        return JsonResponse({"error": "containers must be a list"}, status=400)
+    if len(items) > MAX_CONTAINER_BATCH:
+        return JsonResponse({"error": f"At most {MAX_CONTAINER_BATCH} containers per request"}, status=400)
+
+    try:
+        results = upsert_containers(items)
+    except IntegrityError as e:
+        # Another request created one of the new barcodes first; retrying updates it instead.
+        logging.error(f'api_container_upsert() - {e}')
+        return JsonResponse({"error": "A container was created concurrently; retry the request"}, status=409)
+    return JsonResponse({"results": results})
+
+@login_required
+@require_http_methods(["GET"])
+@use_replica()
+def api_container_search(request) -> HttpResponse:
+    """Searches containers by barcode prefix, brand and product name.  ?q=<text>&limit=<n, default 20, at most
+    100>.  Returns {"containers": [{"id", "barcode", "brand", "product_name", "material_type", "rank"}, ...]},
+    best match first."""
+    try:
+        containers = search_containers(request.GET.get('q', ''), request.GET.get('limit') or CONTAINER_SEARCH_LIMIT)
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+    return JsonResponse({"containers": containers})
+
+def metrics(request) -> HttpResponse:
+    """Request, DB query and stage timing histograms of this server process, in the Prometheus text format.
+    Not found unless METRICS_ENABLED."""
+    if not settings.METRICS_ENABLED:
+        return HttpResponse("Error: Metrics are not enabled.", status=404)
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+@login_required
+def api_containers_cache_stats(request) -> HttpResponse:
+    """Hit and miss counts of the api_containers response cache, for this server process."""
+    return JsonResponse(production_cache_stats.to_dict())
 
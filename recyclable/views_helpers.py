@@ -1,19 +1,66 @@
-from typing import List
+from typing import List, Iterator, Iterable, Any, NamedTuple, Tuple
+from collections import Counter, defaultdict
+import hashlib
+from functools import lru_cache
+from itertools import islice
 import logging
+import threading
 from dataclasses import dataclass, asdict
+from datetime import date, datetime, time, timedelta, timezone
 import json
+import re
 
 from enum import Enum, StrEnum, auto
 from typing import Optional
 
-from django.db.models import Q
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections, models, transaction
+from django.db.models import Q, QuerySet, Sum, Value
+from django.urls import reverse
 
-from recyclable.models import Image, ContainerSize, Container
+from recyclable.models import Image, ContainerSize, Container, CaptureRollup, S3Object, image_urls, VALID_DEPOSIT_Q, \
+    DEPOSIT_TYPES, DEPOSIT_STATES, states_to_bitmask
+from recyclable.presign import PRESIGNED_URL_REFRESH_MARGIN
+from recyclable.s3_index import capture_url
+from recyclable.utils import BUCKET_NAME, url_from_s3_data
 
 # type S3ObjectKey = str
 # type JSON = str
 
 
+# Every object in the bucket shares this prefix, so JSON Lines exports can factor it out.
+DEFAULT_URL_PREFIX: str = url_from_s3_data(BUCKET_NAME, 'us-west-2', '')
+
+
+@dataclass
+class ClassifierRecord:
+    url: str
+    cls: str
+    image_id: int
+    barcode: str
+    split: str = ''
+    etag: str = ''
+
+    def to_dict(self, url_prefix: str = '') -> dict[str, Any]:
+        url = self.url
+        if url_prefix and url.startswith(url_prefix):
+            url = url[len(url_prefix):]
+        d = {'url': url, 'class': self.cls, 'image_id': self.image_id, 'barcode': self.barcode}
+        if self.split:
+            d['split'] = self.split
+        return d
+
+
+class ClassifierLabel(NamedTuple):
+    """A record of a classifier export without its URL, read from a values_list pass (see CLASSIFIER_LABELS)."""
+    image_id: int
+    barcode: str
+    cls: str
+    etag: str
+
+
 @dataclass
 class SizeClassifier:
     lt24oz: list[str]
@@ -58,35 +105,62 @@ class DepositClass(StrEnum):
 
 
 
+def iter_images_with_urls(images: QuerySet, expires_in: Optional[int] = None,
+                          batch_size: int = 2000) -> Iterator[Tuple[Image, str]]:
+    # iterator() keeps memory flat on large tables, and the URLs of each batch are signed together.
+    iterator = images.iterator(chunk_size=batch_size)
+    while batch := list(islice(iterator, batch_size)):
+        yield from zip(batch, image_urls(batch, expires_in))
+
+
 # IMPORTANT NOTE: For each classifier, an image must not belong to more than one class.
 
 def create_count_classifier_json() -> str:
     return "Not implemented yet"
 
-def create_size_classifier_json() -> str:
-    valid_containers = Container.objects.filter(
-        Q(ca=True) &
+SIZE_CLASSES = {
+    Container.VisualVolume.LT_24OZ: 'lt24oz',
+    Container.VisualVolume.GT_24OZ: 'gte24oz',
+}
+SIZE_CLASSIFIER_IMAGES_Q = Q(valid_orientation=True) & Q(crush_degree__in=[0, 1])
+
+
+def size_classifier_containers() -> QuerySet:
+    return Container.objects.eligible_in('CA').filter(
         Q(material_type__in=[
             Container.MaterialType.ALUMINUM,
             Container.MaterialType.GLASS,
             Container.MaterialType.PLASTIC
-        ])
+        ]) &
+        Q(visual_volume__in=list(SIZE_CLASSES))
     )
 
+
+def iter_size_classifier_records() -> Iterator[ClassifierRecord]:
+    for c in size_classifier_containers().iterator():
+        cls = SIZE_CLASSES[c.visual_volume]
+        imgs = Image.objects.filter(Q(container=c) & SIZE_CLASSIFIER_IMAGES_Q)
+        for img, url in iter_images_with_urls(imgs, settings.PRESIGNED_URL_EXPIRES_EXPORT):
+            yield ClassifierRecord(url, cls, img.id, c.barcode, etag=img.aws_entity_tag)
+
+
+def iter_size_classifier_labels() -> Iterator[ClassifierLabel]:
+    """The labels of the records of iter_size_classifier_records(), without signing URLs."""
+    images = Image.objects.filter(Q(container__in=size_classifier_containers()) & SIZE_CLASSIFIER_IMAGES_Q)
+    for image_id, barcode, visual_volume, etag in images.values_list(
+            'id', 'container__barcode', 'container__visual_volume', 'aws_entity_tag').iterator(chunk_size=10000):
+        yield ClassifierLabel(image_id, barcode, SIZE_CLASSES[visual_volume], etag)
+
+
+def create_size_classifier_json() -> str:
     lt24oz_urls: List[str] = []
     gte24oz_urls: List[str] = []
 
-    for c in valid_containers:
-        imgs = Image.objects.filter(
-            Q(container=c) &
-            Q(valid_orientation=True) &
-            Q(crush_degree__in=[0, 1])
-        )
-
-        if c.visual_volume == Container.VisualVolume.LT_24OZ:
-            lt24oz_urls.extend([img.url() for img in imgs])
-        elif c.visual_volume == Container.VisualVolume.GT_24OZ:
-            gte24oz_urls.extend([img.url() for img in imgs])
+    for record in iter_size_classifier_records():
+        if record.cls == 'lt24oz':
+            lt24oz_urls.append(record.url)
+        else:
+            gte24oz_urls.append(record.url)
 
     classifier = SizeClassifier(lt24oz_urls, gte24oz_urls)
     return json.dumps(asdict(classifier))
@@ -176,12 +250,651 @@ def create_deposit_classifier_json() -> str:
         DepositClass.NOT_CLASSIFIED: [],
     }
 
-    images = Image.objects.all()
-
-    for img in images:
-        cls = classify_deposit_image(img)
-        classification_dict[cls.__str__()].append(img.url())
+    for record in iter_deposit_classifier_records():
+        classification_dict[record.cls].append(record.url)
 
     # print(f'create_deposit_classifier_json() - classifier: {classifier}')
 
     return json.dumps(classification_dict)
+
+
+def iter_deposit_classifier_records() -> Iterator[ClassifierRecord]:
+    # select_related avoids one container query per image, and iterator() keeps memory flat on large tables.
+    images = Image.objects.select_related('container').order_by('id')
+
+    for img, url in iter_images_with_urls(images, settings.PRESIGNED_URL_EXPIRES_EXPORT):
+        cls = classify_deposit_image(img)
+        barcode = img.container.barcode if img.container else ''
+        yield ClassifierRecord(url, str(cls), img.id, barcode, etag=img.aws_entity_tag)
+
+
+def iter_deposit_classifier_labels() -> Iterator[ClassifierLabel]:
+    """The labels of the records of iter_deposit_classifier_records(), reading only the columns that
+    classify_deposit_image() needs and without signing URLs."""
+    images = Image.objects.select_related('container').only(
+        'aws_entity_tag', 'valid_orientation', 'crush_degree', 'container__barcode', 'container__material_type')
+    for img in images.iterator(chunk_size=10000):
+        barcode = img.container.barcode if img.container else ''
+        yield ClassifierLabel(img.id, barcode, str(classify_deposit_image(img)), img.aws_entity_tag)
+
+
+def create_classifier_jsonl(records: Iterable[ClassifierRecord], url_prefix: str = '') -> Iterator[str]:
+    """Yields one JSON object per line.  When url_prefix is given, the first line is a header
+    {"url_prefix": ...} and each record's url is relative to it."""
+    if url_prefix:
+        yield json.dumps({'url_prefix': url_prefix}) + '\n'
+
+    for record in records:
+        yield json.dumps(record.to_dict(url_prefix)) + '\n'
+
+
+# name -> (create_json, iter_records) for each downloadable classifier
+CLASSIFIER_EXPORTS = {
+    'size_classifier': (create_size_classifier_json, iter_size_classifier_records),
+    'deposit_classifier': (create_deposit_classifier_json, iter_deposit_classifier_records),
+}
+# name -> iter_labels, the records without their URLs, which plan_splits() and dataset snapshots read
+CLASSIFIER_LABELS = {
+    'size_classifier': iter_size_classifier_labels,
+    'deposit_classifier': iter_deposit_classifier_labels,
+}
+
+
+DEFAULT_SPLIT_RATIOS: dict[str, float] = {'train': 0.8, 'val': 0.1, 'test': 0.1}
+
+
+def parse_split_ratios(value: str) -> dict[str, float]:
+    """Parses 'train:0.8,val:0.1,test:0.1'.  Ratios are normalized so they need not sum to exactly 1."""
+    ratios: dict[str, float] = {}
+    for part in value.split(','):
+        name, sep, ratio = part.partition(':')
+        name = name.strip()
+        if not sep or not name or name in ratios:
+            raise ValueError(f'Invalid split specification: {part!r}')
+        ratios[name] = float(ratio)
+        if ratios[name] < 0:
+            raise ValueError(f'Split ratio must not be negative: {part!r}')
+
+    total = sum(ratios.values())
+    if total <= 0:
+        raise ValueError('Split ratios must add up to more than zero.')
+    return {name: ratio / total for name, ratio in ratios.items()}
+
+
+def barcode_hash(barcode: str, salt: str = '') -> bytes:
+    return hashlib.sha256(f'{salt}{barcode}'.encode('utf-8')).digest()
+
+
+def assign_split(barcode: str, ratios: dict[str, float], salt: str = '') -> str:
+    # Buckets the barcode by its hash alone.  Only used for barcodes that plan_splits() did not see, e.g. a
+    # container added while an export streams.
+    x = int.from_bytes(barcode_hash(barcode, salt)[:8], 'big') / 2 ** 64
+
+    cumulative = 0.0
+    name = ''
+    for name, ratio in ratios.items():
+        cumulative += ratio
+        if x < cumulative:
+            return name
+    return name
+
+
+def split_sizes(n: int, ratios: dict[str, float]) -> dict[str, int]:
+    """Divides n barcodes in the ratios by largest remainder.  When n allows it, every split with a positive
+    ratio gets at least one barcode, so small classes still have val and test examples."""
+    exact = {name: n * ratio for name, ratio in ratios.items()}
+    sizes = {name: int(x) for name, x in exact.items()}
+    by_remainder = sorted(ratios, key=lambda name: exact[name] - sizes[name], reverse=True)
+    for name in by_remainder[:n - sum(sizes.values())]:
+        sizes[name] += 1
+
+    positive = [name for name, ratio in ratios.items() if ratio > 0]
+    if n >= len(positive):
+        for name in positive:
+            if sizes[name] == 0:
+                sizes[max(sizes, key=sizes.get)] -= 1
+                sizes[name] = 1
+    return sizes
+
+
+def plan_splits(labels: Iterable[ClassifierLabel], ratios: dict[str, float], salt: str = '') -> dict[str, str]:
+    """Assigns every barcode of the labels to a split, stratified by class: the barcodes of each class are ordered
+    by hash and cut into runs of split_sizes().  Every image of a container lands in the same
+    split, so a container with images in several classes is stratified by its most common class.  The plan depends
+    only on the set of barcodes per class, and adding a barcode to a class only moves the barcodes next to its
+    cuts."""
+    class_counts: dict[str, Counter] = defaultdict(Counter)
+    for label in labels:
+        class_counts[label.barcode][label.cls] += 1
+
+    class_barcodes: dict[str, List[str]] = defaultdict(list)
+    for barcode, counts in class_counts.items():
+        class_barcodes[min(counts, key=lambda cls: (-counts[cls], cls))].append(barcode)
+
+    plan: dict[str, str] = {}
+    for barcodes in class_barcodes.values():
+        barcodes.sort(key=lambda barcode: barcode_hash(barcode, salt))
+        start = 0
+        for name, size in split_sizes(len(barcodes), ratios).items():
+            plan.update(dict.fromkeys(barcodes[start:start + size], name))
+            start += size
+    return plan
+
+
+class SplitCounts:
+    """Counts records per split and class as they stream through assign_splits()."""
+
+    def __init__(self, ratios: dict[str, float]):
+        self.ratios = ratios
+        self.counts: dict[str, dict[str, int]] = {name: {} for name in ratios}
+
+    def add(self, split: str, cls: str) -> None:
+        counts = self.counts[split]
+        counts[cls] = counts.get(cls, 0) + 1
+
+    def to_dict(self) -> dict[str, Any]:
+        return {'ratios': self.ratios, 'counts': self.counts}
+
+
+def assign_splits(records: Iterable[ClassifierRecord], split_counts: SplitCounts, plan: dict[str, str],
+                  salt: str = '') -> Iterator[ClassifierRecord]:
+    for record in records:
+        split = plan.get(record.barcode)
+        if split is None:
+            split = plan[record.barcode] = assign_split(record.barcode, split_counts.ratios, salt)
+        record.split = split
+        split_counts.add(split, record.cls)
+        yield record
+
+
+def create_classifier_splits_json(records: Iterable[ClassifierRecord], labels: Iterable[ClassifierLabel],
+                                  ratios: dict[str, float]) -> str:
+    """The records grouped by split and class.  The splits are planned from the labels (see CLASSIFIER_LABELS)."""
+    split_counts = SplitCounts(ratios)
+    splits: dict[str, dict[str, list[str]]] = {name: {} for name in ratios}
+
+    for record in assign_splits(records, split_counts, plan_splits(labels, ratios)):
+        splits[record.split].setdefault(record.cls, []).append(record.url)
+
+    return json.dumps({'splits': splits, **split_counts.to_dict()})
+
+
+def create_classifier_splits_jsonl(records: Iterable[ClassifierRecord], labels: Iterable[ClassifierLabel],
+                                   ratios: dict[str, float], url_prefix: str = '') -> Iterator[str]:
+    """Like create_classifier_jsonl(), with a split on every record and a final {"split_counts": ...} line.  The
+    splits are planned from the labels first, which don't sign URLs, and the records are
+    then streamed once.  Only the plan, one split per barcode, is held in memory."""
+    plan = plan_splits(labels, ratios)
+    split_counts = SplitCounts(ratios)
+    yield from create_classifier_jsonl(assign_splits(records, split_counts, plan), url_prefix)
+    yield json.dumps({'split_counts': split_counts.to_dict()}) + '\n'
+
+
+# Production image API (views.api_containers)
+
+PRODUCTION_PAGE_SIZE = 60
+MAX_PRODUCTION_PAGE_SIZE = 500
+PRODUCTION_THUMBNAIL_WIDTH = 256
+PRODUCTION_IMAGE_FIELDS = ('id', 'timestamp', 'cube_sn', 's3_bucket_name', 'aws_region_name', 's3_object_key')
+# 'images' lists Image rows; 'captures' lists the imager captures indexed from S3 by recyclable.s3_index, which
+# have no container, so only the date and cube filters apply to them.
+PRODUCTION_SOURCES = ('images', 'captures')
+CONTAINER_FILTERS = ('materials', 'sizes', 'brand', 'product', 'upc')
+
+PRODUCTION_MATERIALS = {
+    'ALU': Container.MaterialType.ALUMINUM,
+    'GLS': Container.MaterialType.GLASS,
+    'PET': Container.MaterialType.PLASTIC,
+}
+PRODUCTION_SIZES = {
+    'LT24': Container.VisualVolume.LT_24OZ,
+    'GTE24': Container.VisualVolume.GT_24OZ,
+}
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# A cursor is '<timestamp in microseconds since the epoch>.<image id>' of the last image of the previous page.
+def encode_cursor(timestamp: datetime, image_id: int) -> str:
+    return f'{(timestamp - EPOCH) // timedelta(microseconds=1)}.{image_id}'
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        micros, image_id = cursor.split('.')
+        return EPOCH + timedelta(microseconds=int(micros)), int(image_id)
+    except ValueError:
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+
+
+def parse_date(value: str, name: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}: {value!r}')
+
+
+def production_images_query(filters: dict[str, Any]) -> QuerySet:
+    """The images matching the production grid filters.  Only images with a timestamp are included."""
+    images = Image.objects.filter(timestamp__isnull=False)
+
+    if filters.get('start_date'):
+        start = parse_date(filters['start_date'], 'start_date')
+        images = images.filter(timestamp__gte=datetime.combine(start, time.min, tzinfo=timezone.utc))
+    if filters.get('end_date'):
+        end = parse_date(filters['end_date'], 'end_date') + timedelta(days=1)  # end date is inclusive
+        images = images.filter(timestamp__lt=datetime.combine(end, time.min, tzinfo=timezone.utc))
+
+    cubes = filters.get('cubes') or []
+    if isinstance(cubes, str):
+        cubes = cubes.split('\n')
+    cubes = [cube.strip() for cube in cubes if cube.strip()]
+    if cubes:
+        images = images.filter(cube_sn__in=cubes)
+
+    deposit_types = set(filters.get('deposit_types') or [])
+    if deposit_types - {'valid', 'invalid'}:
+        raise ValueError(f'Invalid deposit_types: {sorted(deposit_types)}')
+    if deposit_types == {'valid'}:
+        images = images.filter(VALID_DEPOSIT_Q)
+    elif deposit_types == {'invalid'}:
+        images = images.exclude(VALID_DEPOSIT_Q)
+
+    materials = [PRODUCTION_MATERIALS[m] for m in filters.get('materials') or [] if m in PRODUCTION_MATERIALS]
+    if materials:
+        images = images.filter(container__material_type__in=materials)
+    sizes = [PRODUCTION_SIZES[s] for s in filters.get('sizes') or [] if s in PRODUCTION_SIZES]
+    if sizes:
+        images = images.filter(container__visual_volume__in=sizes)
+    if filters.get('brand'):
+        images = images.filter(container__brand__icontains=filters['brand'].strip())
+    if filters.get('product'):
+        images = images.filter(container__product_name__icontains=filters['product'].strip())
+    if filters.get('upc'):
+        images = images.filter(container__barcode=filters['upc'].strip())
+
+    return images
+
+
+def production_images_page(filters: dict[str, Any], cursor: str = '', limit: int = PRODUCTION_PAGE_SIZE) -> dict:
+    """Returns one page of images, newest first, and the cursor of the next page (None on the last page).
+
+    Pages are keyed on (timestamp, id) instead of an OFFSET, so every page is an index range scan of at most
+    limit rows, however deep it is."""
+    limit = max(1, min(int(limit), MAX_PRODUCTION_PAGE_SIZE))
+    if filters.get('source') == 'captures':
+        return production_captures_page(filters, cursor, limit)
+    images = production_images_query(filters)
+    if cursor:
+        timestamp, image_id = decode_cursor(cursor)
+        # The redundant timestamp__lte bound becomes the index condition; the OR only breaks ties.
+        images = images.filter(Q(timestamp__lte=timestamp) & (Q(timestamp__lt=timestamp) | Q(id__lt=image_id)))
+
+    page = list(images.order_by('-timestamp', '-id').only(*PRODUCTION_IMAGE_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1].timestamp, page[limit - 1].id) if len(page) > limit else None
+
+    return {'images': production_image_dicts(page[:limit]), 'next_cursor': next_cursor}
+
+
+
+def production_image_dicts(images: List[Image]) -> List[dict[str, Any]]:
+    return [{
+        'id': img.id,
+        'url': url,
+        'thumbnail_url': f"{reverse('recyclable:image_proxy', args=[img.id])}?w={PRODUCTION_THUMBNAIL_WIDTH}",
+        'filename': img.s3_object_key.rsplit('/', 1)[-1],
+        'timestamp': img.timestamp.isoformat(),
+        'cube_sn': img.cube_sn,
+    } for img, url in zip(images, image_urls(images))]
+
+
+def latest_image_id() -> int:
+    return Image.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def production_images_after(filters: dict[str, Any], after_id: int,
+                            limit: int = MAX_PRODUCTION_PAGE_SIZE) -> List[dict[str, Any]]:
+    """The images inserted after image after_id that match the filters, oldest first.  Ids only grow, so this is
+    a primary key range scan of just the new rows.  An image whose insert commits after one with a higher id was
+    polled is skipped; the next full page load shows it."""
+    images = production_images_query(filters).filter(id__gt=after_id).order_by('id').only(*PRODUCTION_IMAGE_FIELDS)
+    return production_image_dicts(list(images[:limit]))
+
+
+def production_captures_query(filters: dict[str, Any]) -> QuerySet:
+    """The indexed captures matching the production grid's date and cube filters."""
+    if any(filters.get(name) for name in CONTAINER_FILTERS) or \
+            set(filters.get('deposit_types') or []) not in (set(), {'valid', 'invalid'}):
+        raise ValueError('Captures can only be filtered by date and cube')
+    captures = S3Object.objects.filter(capture_date__isnull=False)
+    if filters.get('start_date'):
+        captures = captures.filter(capture_date__gte=parse_date(filters['start_date'], 'start_date'))
+    if filters.get('end_date'):
+        captures = captures.filter(capture_date__lte=parse_date(filters['end_date'], 'end_date'))
+
+    cubes = filters.get('cubes') or []
+    if isinstance(cubes, str):
+        cubes = cubes.split('\n')
+    cubes = [cube.strip() for cube in cubes if cube.strip()]
+    if cubes:
+        captures = captures.filter(cube_sn__in=cubes)
+    return captures
+
+
+def production_captures_page(filters: dict[str, Any], cursor: str, limit: int) -> dict:
+    """production_images_page() of the captures, newest date first.  The cursor holds the capture date as a
+    midnight timestamp."""
+    captures = production_captures_query(filters)
+    if cursor:
+        timestamp, capture_id = decode_cursor(cursor)
+        capture_date = timestamp.date()
+        captures = captures.filter(Q(capture_date__lte=capture_date) &
+                                   (Q(capture_date__lt=capture_date) | Q(id__lt=capture_id)))
+
+    page = list(captures.order_by('-capture_date', '-id')
+                .only('id', 'key', 'cube_sn', 'capture_date', 'last_modified')[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        last = page[limit - 1]
+        next_cursor = encode_cursor(datetime.combine(last.capture_date, time.min, tzinfo=timezone.utc), last.id)
+
+    return {'images': production_capture_dicts(page[:limit]), 'next_cursor': next_cursor}
+
+
+def production_capture_dicts(captures: List[S3Object]) -> List[dict[str, Any]]:
+    return [{
+        'id': obj.id,
+        'url': capture_url(obj.key),
+        'thumbnail_url': capture_url(obj.key),
+        'filename': obj.key.rsplit('/', 1)[-1],
+        'timestamp': (obj.last_modified or datetime.combine(obj.capture_date, time.min, tzinfo=timezone.utc))
+        .isoformat(),
+        'cube_sn': obj.cube_sn,
+    } for obj in captures]
+
+
+# Response cache of production_images_page()
+
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, hit: bool) -> None:
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def to_dict(self) -> dict[str, int]:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+production_cache_stats = CacheStats()
+
+
+def canonical_production_filters(filters: dict[str, Any], cursor: str, limit: int) -> dict[str, Any]:
+    """Normalizes the filters so that requests for the same images share a cache entry, whatever the order of
+    the cubes, the case of the brand or filters that select everything."""
+    cubes = filters.get('cubes') or []
+    if isinstance(cubes, str):
+        cubes = cubes.split('\n')
+    deposit_types = sorted(set(filters.get('deposit_types') or []))
+    source = filters.get('source') or 'images'
+    if source not in PRODUCTION_SOURCES:
+        raise ValueError(f'Invalid source: {source!r}')
+    canonical = {
+        'source': source,
+        'start_date': parse_date(filters['start_date'], 'start_date').isoformat() if filters.get('start_date') else '',
+        'end_date': parse_date(filters['end_date'], 'end_date').isoformat() if filters.get('end_date') else '',
+        'cubes': sorted({cube.strip() for cube in cubes if cube.strip()}),
+        'deposit_types': [] if deposit_types == ['invalid', 'valid'] else deposit_types,
+        'materials': sorted({m for m in filters.get('materials') or [] if m in PRODUCTION_MATERIALS}),
+        'sizes': sorted({s for s in filters.get('sizes') or [] if s in PRODUCTION_SIZES}),
+        'brand': (filters.get('brand') or '').strip().lower(),
+        'product': (filters.get('product') or '').strip().lower(),
+        'upc': (filters.get('upc') or '').strip(),
+    }
+    canonical['cursor'] = cursor
+    canonical['limit'] = max(1, min(int(limit), MAX_PRODUCTION_PAGE_SIZE))
+    return canonical
+
+
+def production_cache_ttl(canonical: dict[str, Any], today: Optional[date] = None) -> int:
+    # Captures can reach the database a day late, so a range is closed once it ended before yesterday.
+    today = today or datetime.now(timezone.utc).date()
+    if canonical['end_date'] and date.fromisoformat(canonical['end_date']) < today - timedelta(days=1):
+        return settings.PRODUCTION_API_CACHE_TTL_CLOSED
+    return settings.PRODUCTION_API_CACHE_TTL_OPEN
+
+
+def cached_production_images_page(filters: dict[str, Any], cursor: str = '',
+                                  limit: int = PRODUCTION_PAGE_SIZE) -> Tuple[dict, bool]:
+    """production_images_page() through the production_api cache.  Returns the page and whether it was a hit."""
+    canonical = canonical_production_filters(filters, cursor, limit)
+    digest = hashlib.sha256(json.dumps(canonical, sort_keys=True).encode('utf-8')).hexdigest()
+    key = f'production_images_page:{digest}'
+
+    cache = caches['production_api']
+    page = cache.get(key)
+    production_cache_stats.count(page is not None)
+    if page is not None:
+        return page, True
+
+    page = production_images_page(canonical, cursor, canonical['limit'])
+    # A cached page must not outlive the presigned URLs in it.
+    cache.set(key, page, min(production_cache_ttl(canonical),
+                             settings.PRESIGNED_URL_EXPIRES - PRESIGNED_URL_REFRESH_MARGIN))
+    return page, False
+
+
+# Capture dashboard (views.api_capture_rollups)
+
+ROLLUP_GROUP_BY = ('day', 'cube_sn', 'store_name', 'deposit_type')
+
+
+def capture_rollup_rows(start_date: str = '', end_date: str = '', cubes: Iterable[str] = (),
+                        stores: Iterable[str] = (), deposit_types: Iterable[str] = (),
+                        group_by: Iterable[str] = ('day',)) -> List[dict[str, Any]]:
+    """Sums the capture rollups matching the filters by the group_by columns.  The query reads the rollup
+    table only, so its cost depends on the number of days and cubes, not on the number of images."""
+    group_by = list(group_by)
+    if not group_by or set(group_by) - set(ROLLUP_GROUP_BY):
+        raise ValueError(f'group_by must be some of {", ".join(ROLLUP_GROUP_BY)}')
+    deposit_types = set(deposit_types)
+    if deposit_types - set(DEPOSIT_TYPES):
+        raise ValueError(f'Invalid deposit_types: {sorted(deposit_types)}')
+
+    rollups = CaptureRollup.objects.all()
+    if start_date:
+        rollups = rollups.filter(day__gte=parse_date(start_date, 'start_date'))
+    if end_date:
+        rollups = rollups.filter(day__lte=parse_date(end_date, 'end_date'))
+    if cubes:
+        rollups = rollups.filter(cube_sn__in=list(cubes))
+    if stores:
+        rollups = rollups.filter(store_name__in=list(stores))
+    if deposit_types:
+        rollups = rollups.filter(deposit_type__in=deposit_types)
+
+    rows = rollups.values(*group_by).annotate(count=Sum('count')).order_by(*group_by)
+    return [{**row, 'day': row['day'].isoformat()} if 'day' in row else row for row in rows]
+
+
+# Bulk container API (views.api_container_lookup and views.api_container_upsert)
+
+MAX_CONTAINER_BATCH = 1000
+CONTAINER_API_FIELDS = {f.name: f for f in Container._meta.concrete_fields
+                        if f.name not in ('id', 'created_at', 'updated_at')}
+CONTAINER_CHOICES = {name: frozenset(value for value, _ in f.flatchoices)
+                     for name, f in CONTAINER_API_FIELDS.items() if f.choices}
+NEW_CONTAINER_REQUIRED = [name for name, f in CONTAINER_API_FIELDS.items() if not f.has_default()]
+MADE_IN_PATTERN = re.compile(r'[A-Z]{3}')
+
+
+def container_to_dict(c: Container) -> dict[str, Any]:
+    return {
+        'id': c.id,
+        **{name: getattr(c, name) for name in CONTAINER_API_FIELDS},
+        'deposit_states': c.states(),
+        'updated_at': c.updated_at.isoformat(),
+    }
+
+
+def lookup_containers(barcodes: List[str]) -> dict[str, dict[str, Any]]:
+    """The containers with the given barcodes, by barcode, in one barcode__in query."""
+    return {c.barcode: container_to_dict(c) for c in Container.objects.filter(barcode__in=barcodes)}
+
+
+def clean_container_fields(item: dict[str, Any]) -> Tuple[dict[str, Any], dict[str, str]]:
+    """Validates an upsert item in one pass over its keys: choice fields against their TextChoices, numbers,
+    string lengths and deposit states.  Returns the model field values and the errors by field name."""
+    values, errors = {}, {}
+    for name, value in item.items():
+        field = CONTAINER_API_FIELDS.get(name)
+        if field is None:
+            errors[name] = 'Unknown field.'
+        elif name == 'deposit_states':
+            if not isinstance(value, list) or any(state not in DEPOSIT_STATES for state in value):
+                errors[name] = f'Must be a list of states from {", ".join(DEPOSIT_STATES)}.'
+            else:
+                values[name] = states_to_bitmask(value)
+        elif name in CONTAINER_CHOICES:
+            if value not in CONTAINER_CHOICES[name]:
+                errors[name] = f'Invalid choice: {value!r}.'
+            else:
+                values[name] = value
+        elif isinstance(field, models.FloatField):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                errors[name] = 'Must be a number.'
+            else:
+                values[name] = float(value)
+        elif not isinstance(value, str) or len(value) > field.max_length:
+            errors[name] = f'Must be a string of at most {field.max_length} characters.'
+        elif name == 'made_in' and not MADE_IN_PATTERN.fullmatch(value):
+            errors[name] = 'Must be exactly 3 uppercase English letters (A-Z).'
+        elif name == 'barcode' and not value:
+            errors[name] = 'Must not be empty.'
+        else:
+            values[name] = value
+    return values, errors
+
+
+def upsert_containers(items: List[Any]) -> List[dict[str, Any]]:
+    """Creates or updates a container per item, keyed on barcode, in one transaction.  Items that fail validation
+    are reported and skipped; the others are written.  Returns a result per item, in order, with a status of
+    created, updated, unchanged or error."""
+    results: List[Optional[dict[str, Any]]] = [None] * len(items)
+    cleaned: dict[str, Tuple[int, dict[str, Any]]] = {}
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = {'barcode': None, 'status': 'error', 'errors': {'': 'Must be an object.'}}
+            continue
+        values, errors = clean_container_fields(item)
+        if 'barcode' not in item:
+            errors['barcode'] = 'Required.'
+        elif values.get('barcode') in cleaned:
+            errors['barcode'] = 'Duplicate barcode in this request.'
+        if errors:
+            results[i] = {'barcode': item.get('barcode'), 'status': 'error', 'errors': errors}
+        else:
+            cleaned[values['barcode']] = (i, values)
+
+    now = datetime.now(timezone.utc)
+    with transaction.atomic():
+        existing = {c.barcode: c for c in Container.objects.select_for_update().filter(barcode__in=list(cleaned))}
+        to_create, to_update, update_fields = [], [], {'updated_at'}
+        for barcode, (i, values) in cleaned.items():
+            c = existing.get(barcode)
+            if c is None:
+                missing = [name for name in NEW_CONTAINER_REQUIRED if name not in values]
+                if missing:
+                    results[i] = {'barcode': barcode, 'status': 'error',
+                                  'errors': {name: 'Required for a new container.' for name in missing}}
+                    continue
+                c, status = Container(**values), 'created'
+            else:
+                changed = [name for name, value in values.items() if getattr(c, name) != value]
+                for name in changed:
+                    setattr(c, name, values[name])
+                status = 'updated' if changed else 'unchanged'
+
+            valid, message = c.is_valid()
+            if not valid:
+                results[i] = {'barcode': barcode, 'status': 'error', 'errors': {'plastic_code': message}}
+            elif status == 'created':
+                to_create.append((i, c))
+            elif status == 'updated':
+                c.updated_at = now
+                update_fields.update(changed)
+                to_update.append((i, c))
+            else:
+                results[i] = {'barcode': barcode, 'status': status, 'id': c.id}
+
+        Container.objects.bulk_create([c for _, c in to_create])
+        Container.objects.bulk_update([c for _, c in to_update], sorted(update_fields))
+
+    for status, written in [('created', to_create), ('updated', to_update)]:
+        for i, c in written:
+            results[i] = {'barcode': c.barcode, 'status': status, 'id': c.id}
+    return results
+
+
+# Container search (views.api_container_search and the Container admin)
+
+CONTAINER_SEARCH_LIMIT = 20
+MAX_CONTAINER_SEARCH_LIMIT = 100
+
+
+@lru_cache(maxsize=None)
+def has_trigram_search(using: str) -> bool:
+    """Whether the pg_trgm extension is installed on the database.  Migration 0010 adds the trigram indexes if so."""
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def container_search_q(query: str, trigram: bool) -> Q:
+    """Barcodes starting with query, and brands or product names matching it: by trigram word similarity, which
+    also matches words in the middle and typos, or else by case-insensitive prefix.  Every condition is served by
+    an index, so Postgres combines them with a BitmapOr instead of scanning the table."""
+    if trigram:
+        return Q(barcode__startswith=query) | Q(brand__trigram_word_similar=query) | \
+            Q(product_name__trigram_word_similar=query)
+    return Q(barcode__startswith=query) | Q(brand__istartswith=query) | Q(product_name__istartswith=query)
+
+
+def search_containers(query: str, limit: int = CONTAINER_SEARCH_LIMIT) -> List[dict[str, Any]]:
+    """The containers matching query, best first: an exact barcode, then barcode prefixes, then by how well the
+    brand or product name matches.  Each kind of match is a separately limited index scan, so a common prefix
+    that matches half the table costs no more than a rare one."""
+    query = query.strip()
+    if not query:
+        return []
+    limit = max(1, min(int(limit), MAX_CONTAINER_SEARCH_LIMIT))
+
+    containers = Container.objects.all()
+    fields = ('id', 'barcode', 'brand', 'product_name', 'material_type', 'rank')
+
+    def ranked(matches: Q, rank: Any, order: bool = False) -> QuerySet:
+        qs = containers.filter(matches).annotate(rank=rank)
+        return (qs.order_by('-rank') if order else qs.order_by()).values(*fields)[:limit]
+
+    branches = [ranked(Q(barcode=query), Value(2.0)), ranked(Q(barcode__startswith=query), Value(1.0))]
+    if has_trigram_search(containers.db):
+        branches += [ranked(Q(brand__trigram_word_similar=query), TrigramWordSimilarity(query, 'brand'), True),
+                     ranked(Q(product_name__trigram_word_similar=query),
+                            TrigramWordSimilarity(query, 'product_name'), True)]
+    else:
+        branches += [ranked(Q(brand__istartswith=query), Value(0.5)),
+                     ranked(Q(product_name__istartswith=query), Value(0.4))]
+
+    best: dict[int, dict[str, Any]] = {}
+    for row in branches[0].union(*branches[1:], all=True):
+        if row['id'] not in best or row['rank'] > best[row['id']]['rank']:
+            best[row['id']] = row
+    return sorted(best.values(), key=lambda row: (-row['rank'], row['barcode']))[:limit]
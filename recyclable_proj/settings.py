@@ -43,10 +43,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'widget_tweaks',
 ]
 
 MIDDLEWARE = [
+    'recyclable.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,9 +90,65 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': '{{rds_host}}',
         'PORT': '5432',
+        # Keep connections open across requests, and check them before reuse.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Optional read replica for read-only workloads (classifier exports, production image API, admin list views).
+# See recyclable.db_routers.
+DATABASE_REPLICA = None
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASE_REPLICA = 'replica'
+    DATABASES[DATABASE_REPLICA] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['recyclable.db_routers.ReplicaRouter']
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Each gunicorn worker has its own local-memory caches, so they are sized for the 1 GiB instance that runs three
+# workers.  Presigned URLs signed with role credentials are about 1.1 KB, so 50 API pages of 60 images take about
+# 3.5 MB per worker and 3,000 presigned URLs about 4.2 MB.  When a set finds MAX_ENTRIES entries, LocMemCache culls
+# the least recently used 1/CULL_FREQUENCY of them at once (a third by default); CULL_FREQUENCY 10 keeps that to 10%.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'production_api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'production-api',
+        'OPTIONS': {'MAX_ENTRIES': 50, 'CULL_FREQUENCY': 10},
+    },
+    'presigned_urls': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'presigned-urls',
+        'OPTIONS': {'MAX_ENTRIES': 3000, 'CULL_FREQUENCY': 10},
+    },
+}
+
+# Seconds to cache production image API pages whose date range ended before yesterday, and all other pages.
+PRODUCTION_API_CACHE_TTL_CLOSED = 24 * 60 * 60
+PRODUCTION_API_CACHE_TTL_OPEN = 30
+
+# Seconds that presigned image URLs stay valid, in the webapp and in classifier exports (at most 7 days).
+PRESIGNED_URL_EXPIRES = 60 * 60
+PRESIGNED_URL_EXPIRES_EXPORT = 7 * 24 * 60 * 60
+
+# On-disk LRU cache of the image proxy (recyclable.image_cache), shared by the workers of a node.
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', '/tmp/recyclable-image-cache')
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(2 * 2 ** 30)))
+
+# Request, DB query and stage timing histograms, served at /recyclable/metrics in the Prometheus text format
+# (recyclable.metrics).  Off by default; when off they cost nothing.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true')
+
 
 
 # Password validation